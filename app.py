@@ -1,14 +1,24 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from services.auth_service import AuthService
+from services.cache_warmer import start_cache_warmer
+from services.llm_service import LLMService
 from ui.auth_ui import show_login_form, show_error_page
 from ui.main_ui import main_app_ui
 from ui.styles import apply_base_styles
 from utils.logger import setup_logger
 from utils.exception_utils import format_exception
+from utils.metrics import RERUN_DURATION, start_exporters, track_session
 
 # Configuration du logging
 logger = setup_logger()
 
+# Exposer les métriques (une seule fois par processus)
+start_exporters()
+
+# Préchauffer en heures creuses les recherches les plus demandées (une seule fois par processus)
+start_cache_warmer()
+
 # Configurer la page Streamlit
 st.set_page_config(
     page_title="Assistant de Recherche M&A",
@@ -39,17 +49,28 @@ def main():
         
         # Si l'utilisateur n'est pas connecté, afficher le formulaire de connexion
         if not authentication_status:
-            logger.info("Utilisateur non authentifié, affichage du formulaire de connexion")
+            logger.debug("Utilisateur non authentifié, affichage du formulaire de connexion")
             auth_success = show_login_form(auth_service)
             if not auth_success:
                 st.stop()
+            
+            # Préparer en arrière-plan les connexions et un thread pour la première question
+            if not st.session_state.get("warmed_up"):
+                st.session_state.warmed_up = True
+                LLMService().warm_up()
         
         # Si l'authentification a réussi, afficher l'interface principale
         if authentication_status:
-            logger.info(f"Utilisateur authentifié: {st.session_state.get('name')}")
+            logger.debug("Utilisateur authentifié: %s", st.session_state.get('name'))
+            
+            # Suivre les sessions actives
+            ctx = get_script_run_ctx()
+            if ctx is not None:
+                track_session(ctx.session_id)
             
             # Afficher l'interface principale
-            main_app_ui()
+            with RERUN_DURATION.time():
+                main_app_ui()
             
             # Le bouton de déconnexion est maintenant intégré dans main_app_ui
             # donc nous n'avons plus besoin de l'appeler ici
@@ -5,4 +5,105 @@ API_KEY = st.secrets["OPENAI_API_KEY"]
 
 # Chat Configuration
 MAX_HISTORY = 10  # Nombre max de messages dans l'historique
-STREAM_RESPONSE = True  # Si l'API supporte le streaming
\ No newline at end of file
+STREAM_RESPONSE = True  # Si l'API supporte le streaming
+CHAT_HISTORY_WINDOW = 5  # Nombre d'échanges récents affichés par défaut
+CHAT_HISTORY_PAGE = 5  # Nombre d'échanges ajoutés par "Afficher les messages précédents"
+CHAT_LIVE_EXCHANGES = 3  # Échanges redessinés par le fragment de saisie avant d'être intégrés à l'historique
+
+# Storage Configuration
+DATA_DIR = "data"  # Répertoire des données locales (caches, conversions...)
+CONVERSATIONS_DB_PATH = f"{DATA_DIR}/conversations.sqlite3"  # Miroir local des conversations
+FILES_DIR = f"{DATA_DIR}/files"  # Contenus des fichiers de résultats, adressés par empreinte
+
+# Preview Configuration (fichiers de résultats CSV/Excel)
+PREVIEW_LARGE_FILE_BYTES = 2 * 1024 * 1024  # Au-delà de cette taille, aperçu paginé côté serveur
+PREVIEW_PAGE_SIZE = 200  # Nombre de lignes par page en mode grand résultat
+PREVIEW_MAX_RENDER_BYTES = 512 * 1024  # Octets max de données envoyés au navigateur par rendu
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Mémoire max des tables Arrow gardées en cache
+PREVIEW_DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Espace disque max des conversions Parquet (data/results)
+
+# Parsing Configuration (analyse des fichiers CSV/Excel hors du processus Streamlit)
+PARSE_POOL_WORKERS = 2  # Processus d'analyse
+PARSE_OFFLOAD_MIN_BYTES = 1024 * 1024  # CSV plus petits analysés dans le processus (Excel toujours déporté)
+PARSE_TIMEOUT = 120  # Durée max (secondes) de l'analyse d'un fichier
+PARSE_MAX_BYTES = 256 * 1024 * 1024  # Taille max d'un fichier analysé
+
+# Tool Output Configuration (résultats d'outils renvoyés à l'assistant)
+TOOL_OUTPUT_MAX_BYTES = 6000  # Budget strict du JSON renvoyé (~1500 tokens)
+TOOL_OUTPUT_TOP_K = 5  # Lignes d'exemple par fichier de résultats
+TOOL_OUTPUT_MAX_COLUMNS = 25  # Colonnes décrites au plus par fichier
+# Champs de event_data conservés par fonction (chemins pointés) et colonne de tri des lignes d'exemple
+TOOL_OUTPUT_PROJECTIONS = {
+    "default": {"fields": ["event_id", "status", "message", "summary", "derived", "age_seconds"], "sort_by": None},
+    "get_company_targets": {"fields": ["event_id", "status", "message", "summary", "query", "derived", "age_seconds"], "sort_by": "revenue"},
+}
+
+# Warm-up Configuration (préparation de la première question)
+WARMUP_THREAD_POOL_SIZE = 2  # Threads Assistants créés à l'avance pour les nouvelles sessions
+WARMUP_THREAD_MAX_AGE = 3600  # Âge max (secondes) d'un thread de la réserve
+HTTP_POOL_MAXSIZE = 20  # Connexions keep-alive max vers ArcadiaAgents
+ASSISTANT_TOOLS_CACHE_TTL = 600  # Durée (secondes) de mise en cache de la liste des outils de l'assistant
+
+# Job Scheduling Configuration (tâches ArcadiaAgents)
+ARCADIA_MAX_CONCURRENT_JOBS = 4  # Tâches ArcadiaAgents en cours au plus, toutes sessions confondues
+ARCADIA_USER_WEIGHTS = {}  # Poids par utilisateur pour le partage équitable (1 par défaut)
+ARCADIA_QUEUE_TIMEOUT = 300  # Attente max (secondes) d'une tâche en file d'attente
+ARCADIA_CONNECT_TIMEOUT = 5  # Délai (secondes) d'établissement de connexion à ArcadiaAgents
+ARCADIA_READ_TIMEOUT = 30  # Délai (secondes) de lecture d'une réponse ArcadiaAgents
+ARCADIA_MAX_RETRIES = 3  # Nouvelles tentatives sur erreur réseau, 429 ou 5xx
+ARCADIA_RETRY_BACKOFF = 0.5  # Délai initial (secondes) du backoff exponentiel
+ARCADIA_RETRY_MAX_DELAY = 10  # Délai max (secondes) entre deux tentatives
+ARCADIA_JOB_DURATION_ESTIMATE = 30  # Durée initiale estimée d'une tâche (secondes), affinée ensuite
+
+# State Backend Configuration (état des sessions partagé entre réplicas)
+STATE_BACKEND_URL = st.secrets.get("STATE_BACKEND_URL", "memory://")  # memory:// ou redis://hôte:port/base
+STATE_TTL = 7 * 24 * 3600  # Durée de vie (secondes) des états de session et des fichiers
+STATE_LOCK_TIMEOUT = 10  # Attente max (secondes) du verrou d'une session
+
+# Session Memory Configuration (budget mémoire par session)
+SESSION_MEMORY_BUDGET = 200 * 1024 * 1024  # Au-delà, les contenus de fichiers les plus anciens sont déchargés sur disque
+SESSION_MEMORY_KEEP_LATEST = 1  # Nombre de messages les plus récents dont les fichiers restent toujours en mémoire
+
+# Local Tools Configuration (outils exécutés dans le processus, sur les résultats déjà récupérés)
+LOCAL_QUERY_MAX_ROWS = 50  # Lignes max renvoyées à l'assistant par une requête locale
+VALUATION_MAX_MULTIPLE = 100  # Multiples au-delà de cette valeur exclus des statistiques (aberrants)
+# Noms de colonnes reconnus (sans tenir compte de la casse) selon leur rôle dans un fichier de résultats
+RESULT_COLUMN_CANDIDATES = {
+    "enterprise_value": ["enterprise_value", "ev", "valeur_entreprise", "deal_value"],
+    "ebitda": ["ebitda"],
+    "revenue": ["revenue", "revenues", "sales", "chiffre_affaires", "ca"],
+    "date": ["deal_date", "date", "announcement_date", "year", "annee"],
+    "company_name": ["company_name", "company", "name", "target", "target_name", "entreprise", "nom"],
+    "sector": ["sector", "industry", "secteur"],
+    "country": ["country", "pays"],
+}
+
+# Screen Cache Configuration (réutilisation des recherches ArcadiaAgents terminées)
+SCREEN_CACHE_EVENT_TYPES = ["company_targets"]  # Types d'événements dont les résultats sont réutilisés
+SCREEN_CACHE_MAX_AGE = 6 * 3600  # Âge max (secondes) d'un résultat réutilisé ou dérivé
+SCREEN_CACHE_MAX_ENTRIES = 200  # Recherches gardées au plus (contenus dans le FileStore)
+
+# Cache Warming Configuration (recherches populaires relancées en heures creuses)
+CACHE_WARMING_ENABLED = True  # Préchauffage en arrière-plan du cache des recherches
+CACHE_WARMING_WINDOWS = [("05:00", "08:00")]  # Plages creuses (heure locale, début et fin)
+CACHE_WARMING_TOP_N = 10  # Recherches les plus demandées relancées à chaque cycle
+CACHE_WARMING_MIN_SCORE = 2.5  # Score de popularité minimal (~3 demandes récentes) pour être relancée
+CACHE_WARMING_HALF_LIFE = 3 * 24 * 3600  # Demi-vie (secondes) du score de popularité
+CACHE_WARMING_REFRESH_AGE = 2 * 3600  # Âge (secondes) à partir duquel un résultat conservé est relancé
+CACHE_WARMING_MAX_CONCURRENT = 1  # Tâches de préchauffage simultanées au plus
+CACHE_WARMING_MAX_PER_HOUR = 20  # Tâches de préchauffage par heure au plus
+CACHE_WARMING_RESERVED_SLOTS = 2  # Créneaux de l'ordonnanceur toujours laissés au trafic interactif
+CACHE_WARMING_CHECK_INTERVAL = 300  # Intervalle (secondes) entre deux cycles de préchauffage
+CACHE_WARMING_MAX_TRACKED = 1000  # Recherches suivies au plus
+CACHE_WARMING_POPULARITY_PATH = f"{DATA_DIR}/screen_popularity.json"  # Scores de popularité
+
+# Results Index Configuration (index local des résultats passés, toutes sessions confondues)
+RESULTS_INDEX_DB_PATH = f"{DATA_DIR}/results_index.sqlite3"  # Base SQLite (FTS5) de l'index
+RESULTS_INDEX_MAX_MATCHES = 500  # Lignes max retournées par une recherche dans l'index
+RESULTS_INDEX_BATCH_ROWS = 2000  # Lignes indexées par transaction (le verrou d'écriture est relâché entre deux lots)
+
+# Export Configuration (archive des résultats d'une conversation)
+EXPORTS_DIR = f"{DATA_DIR}/exports"  # Archives générées, supprimées après EXPORT_TTL
+EXPORT_TTL = 3600  # Durée de conservation (secondes) d'une archive générée
+EXPORT_CHUNK_BYTES = 1024 * 1024  # Taille des morceaux écrits dans l'archive
+EXPORT_PARQUET_BATCH_ROWS = 50000  # Lignes par lot écrit dans le Parquet combiné
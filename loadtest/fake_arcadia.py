@@ -0,0 +1,169 @@
+"""
+Substitut HTTP local de l'API ArcadiaAgents (/events, /events/{id}, /files/{id}).
+
+Chaque événement soumis reste "processing" pendant job_seconds, avec des nœuds de
+task_context qui progressent, puis passe à "completed" avec un fichier CSV généré.
+"""
+import csv
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTORS = ["Software", "Healthcare", "Industrials", "Consumer", "Energy", "Financials"]
+COUNTRIES = ["France", "Germany", "United Kingdom", "Spain", "Italy", "Netherlands"]
+NODES = ["planner", "search", "enrichment", "export"]
+
+
+def generate_results_csv(rows, seed=0):
+    """Génère un CSV de résultats d'entreprises/transactions plausible."""
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["company_name", "sector", "country", "deal_date", "revenue", "ebitda", "enterprise_value"])
+    for index in range(rows):
+        revenue = round(rng.uniform(5, 500), 1)
+        ebitda = round(revenue * rng.uniform(0.05, 0.3), 1)
+        writer.writerow([
+            f"Company {seed}-{index}",
+            rng.choice(SECTORS),
+            rng.choice(COUNTRIES),
+            f"{rng.randint(2015, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            revenue,
+            ebitda,
+            round(ebitda * rng.uniform(5, 15), 1),
+        ])
+    return buffer.getvalue().encode()
+
+
+class FakeArcadiaServer:
+    """
+    Serveur HTTP local simulant ArcadiaAgents.
+
+    Args:
+        job_seconds (float): Durée de traitement simulée de chaque événement
+        rows (int): Nombre de lignes du fichier CSV de résultats
+        failure_rate (float): Proportion de requêtes qui échouent avec un 503 (réseau instable)
+    """
+
+    def __init__(self, job_seconds=1.0, rows=200, failure_rate=0.0, host="127.0.0.1", port=0):
+        self.job_seconds = job_seconds
+        self.rows = rows
+        self.failure_rate = failure_rate
+        self.events = {}
+        self.idempotency_keys = {}
+        self.files = {}
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-arcadia", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _submit(self, payload, headers):
+        key = headers.get("Idempotency-Key")
+        with self._lock:
+            # Une soumission rejouée avec la même clé renvoie l'événement existant
+            if key and key in self.idempotency_keys:
+                return 200, {"event_id": self.idempotency_keys[key], "message": "Événement déjà accepté"}
+            event_id = f"evt_{next(self._ids)}"
+            self.events[event_id] = {"payload": payload, "submitted_at": time.monotonic()}
+            if key:
+                self.idempotency_keys[key] = event_id
+        return 202, {"event_id": event_id, "message": "Événement accepté"}
+
+    def _node(self, event_id, name):
+        """Étape terminée ; l'étape de recherche fournit un premier lot de lignes."""
+        node = {"id": f"{event_id}_{name}", "name": name, "status": "completed"}
+        if name == "search":
+            content = generate_results_csv(min(self.rows, 20), seed=int(event_id.split("_")[1]))
+            node["output"] = {"rows": list(csv.DictReader(io.StringIO(content.decode())))}
+        return node
+
+    def _status(self, event_id):
+        with self._lock:
+            event = self.events.get(event_id)
+        if event is None:
+            return 404, {"detail": "Événement introuvable"}
+        elapsed = time.monotonic() - event["submitted_at"]
+        if elapsed < self.job_seconds:
+            done = int(len(NODES) * elapsed / self.job_seconds) if self.job_seconds else len(NODES)
+            nodes = [self._node(event_id, name) for name in NODES[:done]]
+            nodes.append({"name": NODES[min(done, len(NODES) - 1)], "status": "running"})
+            return 200, {"event_id": event_id, "status": "processing", "task_context": {"nodes": nodes}}
+
+        file_id = f"file_{event_id}"
+        with self._lock:
+            if file_id not in self.files:
+                self.files[file_id] = generate_results_csv(self.rows, seed=int(event_id.split("_")[1]))
+        return 200, {
+            "event_id": event_id,
+            "status": "completed",
+            "task_context": {"nodes": [self._node(event_id, name) for name in NODES]},
+            "files": [{"id": file_id, "filename": f"resultats_{event_id}.csv", "type": "csv"}],
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _unavailable(self):
+                return server.failure_rate and random.random() < server.failure_rate
+
+            def do_POST(self):
+                server.requests.append(("POST", self.path))
+                if self.path != "/events":
+                    return self._send(404, {"detail": "Not found"})
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                # L'échec après acceptation simule une réponse perdue : l'événement est créé
+                response = server._submit(payload, dict(self.headers))
+                if self._unavailable():
+                    return self._send(503, {"detail": "Service indisponible"})
+                self._send(*response)
+
+            def do_GET(self):
+                server.requests.append(("GET", self.path))
+                if self._unavailable():
+                    return self._send(503, {"detail": "Service indisponible"})
+                match = re.fullmatch(r"/events/([^/]+)", self.path)
+                if match:
+                    return self._send(*server._status(match.group(1)))
+                match = re.fullmatch(r"/files/([^/]+)", self.path)
+                if match:
+                    with server._lock:
+                        content = server.files.get(match.group(1))
+                    if content is None:
+                        return self._send(404, {"detail": "Fichier introuvable"})
+                    return self._send(200, content, "text/csv")
+                self._send(404, {"detail": "Not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
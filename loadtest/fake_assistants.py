@@ -0,0 +1,230 @@
+"""
+Substitut local des endpoints OpenAI Assistants utilisés par LLMService.
+
+Les runs rejouent des séquences d'événements enregistrées (fichiers JSON de
+loadtest/recordings), y compris les tours requires_action et les morceaux
+thread.message.delta, à une vitesse configurable.
+"""
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+# Identifiants générés à chaque rejeu, pour que des sessions concurrentes ne partagent pas d'IDs
+_PLACEHOLDERS = ("{run_id}", "{message_id}", "{tool_call_id}", "{thread_id}")
+
+
+def _to_object(value):
+    """Convertit récursivement un JSON en objets à attributs, comme les modèles du SDK."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_object(item) for item in value]
+    return value
+
+
+def _substitute(value, ids):
+    if isinstance(value, str):
+        for placeholder, replacement in ids.items():
+            value = value.replace(placeholder, replacement)
+        return value
+    if isinstance(value, dict):
+        return {key: _substitute(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, ids) for item in value]
+    return value
+
+
+def load_recording(path):
+    """Charge un enregistrement : {"tools": [...], "questions": [...], "rounds": [[événements], ...]}."""
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+class _ReplayStream:
+    """Flux d'événements rejoué, utilisable comme les gestionnaires de stream du SDK."""
+
+    def __init__(self, client, run, events):
+        self._client = client
+        self._run = run
+        self._events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        state = FakeAssistantsClient._state
+        for raw_event in self._events:
+            delay = raw_event.get("delay", 0) / state["speed"] if state["speed"] else 0
+            if delay:
+                time.sleep(delay)
+            event = _to_object({"event": raw_event["event"], "data": raw_event.get("data", {})})
+            self._client._observe(self._run, event)
+            yield event
+        self._client._finish_round(self._run)
+
+
+class _Messages:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, thread_id, role, content, **kwargs):
+        message = self._client._add_message(thread_id, role, content)
+        if role == "user":
+            self._client._start_turn(thread_id)
+        return message
+
+    def list(self, thread_id, order="desc", limit=20, **kwargs):
+        with FakeAssistantsClient._lock:
+            messages = list(FakeAssistantsClient._state["threads"].get(thread_id, []))
+        if order == "desc":
+            messages.reverse()
+        return SimpleNamespace(data=[self._client._message_object(m) for m in messages[:limit]])
+
+
+class _Runs:
+    def __init__(self, client):
+        self._client = client
+        self.steps = SimpleNamespace(list=lambda **kwargs: SimpleNamespace(data=[]))
+
+    def stream(self, assistant_id, thread_id, **kwargs):
+        run = self._client._create_run(thread_id)
+        return _ReplayStream(self._client, run, run["rounds"][0])
+
+    def submit_tool_outputs_stream(self, thread_id, run_id, tool_outputs, **kwargs):
+        with FakeAssistantsClient._lock:
+            run = FakeAssistantsClient._state["runs"][run_id]
+            run["tool_outputs"].append(tool_outputs)
+            run["round"] += 1
+            events = run["rounds"][run["round"]] if run["round"] < len(run["rounds"]) else []
+        return _ReplayStream(self._client, run, events)
+
+    def list(self, thread_id, limit=20, **kwargs):
+        with FakeAssistantsClient._lock:
+            runs = [r for r in FakeAssistantsClient._state["runs"].values() if r["thread_id"] == thread_id]
+        runs = runs[-limit:][::-1]
+        return SimpleNamespace(data=[SimpleNamespace(id=r["id"], status=r["status"]) for r in runs])
+
+
+class _Threads:
+    def __init__(self, client):
+        self.messages = _Messages(client)
+        self.runs = _Runs(client)
+
+    def create(self, **kwargs):
+        thread_id = f"thread_fake{next(FakeAssistantsClient._ids)}"
+        with FakeAssistantsClient._lock:
+            FakeAssistantsClient._state["threads"][thread_id] = []
+        return SimpleNamespace(id=thread_id)
+
+
+class FakeAssistantsClient:
+    """
+    Remplaçant de openai.OpenAI pour les endpoints Assistants.
+
+    L'état (threads, runs, mesures) est partagé au niveau de la classe, car l'application
+    recrée un client à chaque rerun. Utiliser configure() avant de lancer les sessions.
+    """
+
+    _lock = threading.Lock()
+    _ids = itertools.count(1)
+    _state = {"recording": {"rounds": [[]]}, "speed": 1.0, "threads": {}, "runs": {}, "turns": []}
+
+    def __init__(self, *args, **kwargs):
+        self.beta = SimpleNamespace(
+            threads=_Threads(self),
+            assistants=SimpleNamespace(retrieve=self._retrieve_assistant)
+        )
+
+    @classmethod
+    def configure(cls, recording, speed=1.0):
+        """
+        Args:
+            recording (dict): Enregistrement à rejouer (voir load_recording)
+            speed (float): Facteur de vitesse des délais enregistrés (0 = sans délai)
+        """
+        with cls._lock:
+            cls._state = {"recording": recording, "speed": speed, "threads": {}, "runs": {}, "turns": []}
+
+    @classmethod
+    def turns(cls, thread_id=None):
+        """Retourne les mesures des tours : début, premier token et fin (time.perf_counter)."""
+        with cls._lock:
+            return [dict(t) for t in cls._state["turns"] if thread_id is None or t["thread_id"] == thread_id]
+
+    def _retrieve_assistant(self, assistant_id, **kwargs):
+        # Outils laissés en dictionnaires, comme après to_dict() sur les modèles du SDK
+        tools = self._state["recording"].get("tools", [])
+        return SimpleNamespace(id=assistant_id, tools=list(tools))
+
+    def _message_object(self, message):
+        return _to_object({
+            "id": message["id"],
+            "role": message["role"],
+            "content": [{"type": "text", "text": {"value": message["text"]}}]
+        })
+
+    def _add_message(self, thread_id, role, content, message_id=None):
+        message = {"id": message_id or f"msg_fake{next(self._ids)}", "role": role, "text": content}
+        with self._lock:
+            self._state["threads"].setdefault(thread_id, []).append(message)
+        return self._message_object(message)
+
+    def _start_turn(self, thread_id):
+        with self._lock:
+            self._state["turns"].append(
+                {"thread_id": thread_id, "start": time.perf_counter(), "first_token": None, "end": None}
+            )
+
+    def _create_run(self, thread_id):
+        ids = {placeholder: f"{placeholder.strip('{}')}_fake{next(self._ids)}" for placeholder in _PLACEHOLDERS}
+        ids["{thread_id}"] = thread_id
+        run = {
+            "id": ids["{run_id}"],
+            "thread_id": thread_id,
+            "status": "queued",
+            "round": 0,
+            "rounds": _substitute(self._state["recording"]["rounds"], ids),
+            "tool_outputs": [],
+            "messages": {},
+        }
+        with self._lock:
+            self._state["runs"][run["id"]] = run
+        return run
+
+    def _observe(self, run, event):
+        """Met à jour l'état du thread et du run en fonction d'un événement rejoué."""
+        name = event.event
+        if name.startswith("thread.run.") and not name.startswith("thread.run.step."):
+            run["status"] = name.rsplit(".", 1)[-1]
+        elif name == "thread.message.created":
+            self._add_message(run["thread_id"], "assistant", "", message_id=event.data.id)
+        elif name == "thread.message.delta":
+            text = "".join(
+                getattr(getattr(part, "text", None), "value", "") for part in event.data.delta.content
+            )
+            with self._lock:
+                for message in reversed(self._state["threads"][run["thread_id"]]):
+                    if message["id"] == event.data.id:
+                        message["text"] += text
+                        break
+                turn = self._current_turn(run["thread_id"])
+                if turn is not None and turn["first_token"] is None:
+                    turn["first_token"] = time.perf_counter()
+
+    def _current_turn(self, thread_id):
+        for turn in reversed(self._state["turns"]):
+            if turn["thread_id"] == thread_id:
+                return turn
+        return None
+
+    def _finish_round(self, run):
+        if run["status"] in ("completed", "failed", "cancelled", "expired"):
+            with self._lock:
+                turn = self._current_turn(run["thread_id"])
+                if turn is not None and turn["end"] is None:
+                    turn["end"] = time.perf_counter()
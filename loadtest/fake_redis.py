@@ -0,0 +1,125 @@
+"""
+Substitut local d'un serveur Redis, limité aux commandes utilisées par RedisStateBackend.
+
+Commandes : PING, AUTH, SELECT, GET, SET (NX, EX, PX), DEL, EXISTS, EXPIRE et EVAL pour le
+seul script de libération de verrou du backend.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Store:
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() > expires_at:
+            del self.values[key]
+            return None
+        return value
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _reply(self, value):
+        if value is None:
+            data = b"$-1\r\n"
+        elif isinstance(value, Exception):
+            data = f"-ERR {value}\r\n".encode()
+        elif isinstance(value, int):
+            data = f":{value}\r\n".encode()
+        elif isinstance(value, str):
+            data = f"+{value}\r\n".encode()
+        else:
+            data = f"${len(value)}\r\n".encode() + value + b"\r\n"
+        self.wfile.write(data)
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name, args = args[0].upper(), args[1:]
+            with store.lock:
+                self.server.commands += 1
+                self._reply(self._execute(store, name, args))
+
+    def _execute(self, store, name, args):
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return "PONG" if name == b"PING" else "OK"
+        if name == b"GET":
+            return store.get(args[0])
+        if name == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in options and store.get(key) is not None:
+                return None
+            expires_at = None
+            for unit, factor in ((b"EX", 1.0), (b"PX", 0.001)):
+                if unit in options:
+                    expires_at = time.monotonic() + int(options[options.index(unit) + 1]) * factor
+            store.values[key] = (value, expires_at)
+            return "OK"
+        if name == b"DEL":
+            return sum(1 for key in args if store.values.pop(key, None) is not None)
+        if name == b"EXISTS":
+            return sum(1 for key in args if store.get(key) is not None)
+        if name == b"EXPIRE":
+            value = store.get(args[0])
+            if value is None:
+                return 0
+            store.values[args[0]] = (value, time.monotonic() + int(args[1]))
+            return 1
+        if name == b"EVAL":
+            # Import tardif : services.state_backend lit la configuration Streamlit
+            from services.state_backend import _UNLOCK_SCRIPT
+            if args[0].decode() != _UNLOCK_SCRIPT:
+                return ValueError("script non pris en charge par le substitut")
+            key, token = args[2], args[3]
+            if store.get(key) == token:
+                del store.values[key]
+                return 1
+            return 0
+        return ValueError(f"commande inconnue '{name.decode()}'")
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Serveur RESP local ; url à passer à STATE_BACKEND_URL."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+        self.commands = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
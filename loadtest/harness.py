@@ -0,0 +1,290 @@
+"""
+Test de charge de bout en bout : N analystes simulés pilotent app.py via AppTest.
+
+Les endpoints Assistants sont remplacés par FakeAssistantsClient (rejeu d'un
+enregistrement) et l'API ArcadiaAgents par FakeArcadiaServer. Le rapport donne,
+par tour et par session : temps jusqu'au premier token, durée totale du tour,
+durée d'un rerun sans saisie et mémoire de l'état de session.
+
+Usage :
+    python -m loadtest.harness --sessions 8 --turns 3 --speed 2
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import openai
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+
+from loadtest.fake_arcadia import FakeArcadiaServer
+from loadtest.fake_assistants import FakeAssistantsClient, load_recording
+from loadtest.fake_redis import FakeRedisServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+DEFAULT_RECORDING = os.path.join(REPO_ROOT, "loadtest", "recordings", "company_screen.json")
+
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    p95_index = min(len(ordered) - 1, max(0, int(round(0.95 * len(ordered))) - 1))
+    return {
+        "count": len(ordered),
+        "p50": statistics.median(ordered),
+        "p95": ordered[p95_index],
+        "max": ordered[-1],
+    }
+
+
+def _deep_size(value, seen=None):
+    """Taille approximative (octets) d'un objet et de tout ce qu'il référence."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += _deep_size(vars(value), seen)
+    return size
+
+
+def _rss_bytes():
+    """RSS courant du processus (Linux), ou pic de RSS à défaut."""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _install_shared_runtime():
+    """
+    AppTest remet Runtime._instance à None à la fin de chaque run, ce qui casse les
+    sessions qui tournent en parallèle (st.download_button, st.image...). On fournit
+    un runtime de test partagé quand aucun n'est installé.
+    """
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    original = Runtime.__dict__["instance"].__func__
+
+    def instance(cls):
+        if cls._instance is None:
+            return shared
+        return original(cls)
+
+    Runtime.instance = classmethod(instance)
+
+
+def _install_fakes(recording, speed, poll_interval, secrets):
+    # Le client factice doit être en place avant l'import de services.llm_service
+    openai.OpenAI = FakeAssistantsClient
+    FakeAssistantsClient.configure(recording, speed=speed)
+
+    # Secrets globaux identiques pour toutes les sessions : AppTest remplace st.secrets
+    # pendant chaque run, ce qui n'est sûr en parallèle que si toutes les valeurs sont égales
+    global_secrets = Secrets()
+    global_secrets._secrets = secrets
+    st.secrets = global_secrets
+
+    from services.api_tools import APITools
+    APITools.poll_interval = poll_interval
+    _install_shared_runtime()
+
+
+def run_session(index, run_id, questions, turns, timeout, secrets):
+    """
+    Simule un analyste : connexion, puis `turns` questions, chacune suivie d'un rerun sans saisie.
+
+    Returns:
+        dict: Mesures de la session
+    """
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets = dict(secrets)
+    at.session_state["authentication_status"] = True
+    at.session_state["name"] = f"Analyste {index}"
+    at.session_state["username"] = f"loadtest-{run_id}-{index}"
+
+    result = {"session": index, "turns": [], "errors": []}
+    start = time.perf_counter()
+    at.run()
+    result["initial_render"] = time.perf_counter() - start
+
+    for turn in range(turns):
+        question = questions[turn % len(questions)]
+        submitted = time.perf_counter()
+        try:
+            at.text_input(key="chat_input").set_value(question)
+            at.run()
+        except Exception as e:
+            result["errors"].append(f"tour {turn + 1}: {e}")
+            break
+        turn_time = time.perf_counter() - submitted
+        if at.exception:
+            result["errors"].append(f"tour {turn + 1}: {at.exception[0].message}")
+
+        thread_id = at.session_state["thread_id"] if "thread_id" in at.session_state else None
+        measures = FakeAssistantsClient.turns(thread_id) if thread_id else []
+        first_token = measures[-1]["first_token"] if measures else None
+
+        rerun_start = time.perf_counter()
+        at.run()
+        rerun_time = time.perf_counter() - rerun_start
+
+        result["turns"].append({
+            "ttft": first_token - submitted if first_token is not None else None,
+            "turn_time": turn_time,
+            "rerun_time": rerun_time,
+        })
+
+    result["session_state_bytes"] = _deep_size(at.session_state.filtered_state)
+    return result
+
+
+def run_load_test(recording_path=DEFAULT_RECORDING, sessions=4, turns=2, speed=1.0, job_seconds=1.0,
+                  rows=200, poll_interval=0.25, timeout=120, state_backend="memory", failure_rate=0.0):
+    """
+    Lance le test de charge et retourne le rapport agrégé.
+
+    Args:
+        recording_path (str): Enregistrement Assistants à rejouer
+        sessions (int): Nombre d'analystes simulés en parallèle
+        turns (int): Nombre de questions par analyste
+        speed (float): Facteur de vitesse du rejeu (0 = sans délai)
+        job_seconds (float): Durée simulée des tâches ArcadiaAgents
+        rows (int): Nombre de lignes des fichiers de résultats
+        poll_interval (float): Intervalle de vérification de l'état des tâches (secondes)
+        timeout (float): Délai maximal d'un run AppTest (secondes)
+        state_backend (str): "memory" ou "redis" (substitut Redis local)
+        failure_rate (float): Proportion de requêtes ArcadiaAgents en échec (503)
+
+    Returns:
+        dict: Rapport (percentiles p50/p95/max et mesures par session)
+    """
+    recording = load_recording(recording_path)
+    server = FakeArcadiaServer(job_seconds=job_seconds, rows=rows, failure_rate=failure_rate).start()
+    secrets = {
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_ASSISTANT_ID": "asst_loadtest",
+        "API_KEY": "loadtest",
+        "ARCADIA_API_URL": server.url,
+    }
+    redis_server = FakeRedisServer().start() if state_backend == "redis" else None
+    if redis_server is not None:
+        secrets["STATE_BACKEND_URL"] = redis_server.url
+    run_id = uuid.uuid4().hex[:8]
+    # Comptes des analystes simulés (la session est déjà marquée comme authentifiée)
+    secrets["auth_config"] = {
+        "cookie": {"name": "mna_loadtest", "key": uuid.uuid4().hex, "expiry_days": 1},
+        "credentials": {"usernames": {
+            f"loadtest-{run_id}-{i}": {"name": f"Analyste {i}", "email": f"analyste{i}@loadtest.local", "password": "loadtest"}
+            for i in range(sessions)
+        }},
+    }
+    try:
+        _install_fakes(recording, speed, poll_interval, secrets)
+        questions = recording.get("questions") or ["Bonjour"]
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="analyst") as executor:
+            results = list(executor.map(
+                lambda i: run_session(i, run_id, questions, turns, timeout, secrets), range(sessions)
+            ))
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+    finally:
+        server.stop()
+        if redis_server is not None:
+            redis_server.stop()
+
+    all_turns = [t for r in results for t in r["turns"]]
+    return {
+        "sessions": sessions,
+        "turns_per_session": turns,
+        "elapsed": elapsed,
+        "completed_turns": len(all_turns),
+        "errors": [e for r in results for e in r["errors"]],
+        "ttft": _percentiles([t["ttft"] for t in all_turns if t["ttft"] is not None]),
+        "turn_time": _percentiles([t["turn_time"] for t in all_turns]),
+        "rerun_time": _percentiles([t["rerun_time"] for t in all_turns]),
+        "initial_render": _percentiles([r["initial_render"] for r in results]),
+        "session_state_bytes": _percentiles([r["session_state_bytes"] for r in results]),
+        "rss_delta_per_session": (rss_after - rss_before) / sessions if sessions else 0,
+        "arcadia_requests": len(server.requests),
+        "arcadia_events": len(server.events),
+        "state_backend_commands": redis_server.commands if redis_server is not None else None,
+        "per_session": results,
+    }
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def print_report(report):
+    print(f"{report['sessions']} session(s) x {report['turns_per_session']} tour(s) en {report['elapsed']:.1f}s "
+          f"({report['completed_turns']} tours terminés, {report['arcadia_requests']} requêtes ArcadiaAgents)")
+    print(f"{'mesure':<24}{'p50':>10}{'p95':>10}{'max':>10}")
+    for key, label in (("ttft", "premier token"), ("turn_time", "durée du tour"),
+                       ("rerun_time", "rerun"), ("initial_render", "premier affichage")):
+        stats = report[key]
+        print(f"{label:<24}{_format_seconds(stats['p50']):>10}{_format_seconds(stats['p95']):>10}"
+              f"{_format_seconds(stats['max']):>10}")
+    memory = report["session_state_bytes"]
+    print(f"{'état de session':<24}{memory['p50'] / 1024:>8.0f}Ko{memory['p95'] / 1024:>8.0f}Ko"
+          f"{memory['max'] / 1024:>8.0f}Ko")
+    print(f"RSS du processus par session : {report['rss_delta_per_session'] / 1024 / 1024:.1f} Mo")
+    for error in report["errors"]:
+        print(f"Erreur : {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'application avec des analystes simulés.")
+    parser.add_argument("--recording", default=DEFAULT_RECORDING, help="Enregistrement Assistants à rejouer (JSON)")
+    parser.add_argument("--sessions", type=int, default=4, help="Nombre d'analystes simulés en parallèle")
+    parser.add_argument("--turns", type=int, default=2, help="Nombre de questions par analyste")
+    parser.add_argument("--speed", type=float, default=1.0, help="Vitesse du rejeu (2 = deux fois plus vite, 0 = sans délai)")
+    parser.add_argument("--job-seconds", type=float, default=1.0, help="Durée simulée des tâches ArcadiaAgents")
+    parser.add_argument("--rows", type=int, default=200, help="Nombre de lignes des fichiers de résultats")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Intervalle de vérification des tâches (s)")
+    parser.add_argument("--timeout", type=float, default=120, help="Délai maximal d'un run (s)")
+    parser.add_argument("--state-backend", choices=["memory", "redis"], default="memory",
+                        help="Backend d'état des sessions (redis = substitut Redis local)")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Proportion de requêtes ArcadiaAgents en échec 503 (réseau instable)")
+    parser.add_argument("--json", action="store_true", help="Afficher le rapport complet en JSON")
+    args = parser.parse_args()
+
+    report = run_load_test(args.recording, args.sessions, args.turns, args.speed, args.job_seconds,
+                           args.rows, args.poll_interval, args.timeout, args.state_backend,
+                           args.failure_rate)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
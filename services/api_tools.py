@@ -1,37 +1,146 @@
+import hashlib
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import streamlit as st
-import pandas as pd
 import json
+from config import settings
+from services.job_scheduler import QueueTimeout, get_job_scheduler
+from services.result_tables import TABULAR_TYPES, read_window
+from services.warmup import get_http_session
+from utils.logger import setup_logger
+from utils.metrics import ARCADIA_DOWNLOAD_BYTES, ARCADIA_ERRORS, ARCADIA_JOB_DURATION, ARCADIA_POLLS_PER_JOB, ARCADIA_RETRIES, ARCADIA_SUBMITS
+
+# Configuration du logging
+logger = setup_logger("api_tools")
+
+# Réponses pour lesquelles une nouvelle tentative peut réussir
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def idempotency_key(tool_call_id, payload):
+    """
+    Clé d'idempotence d'une soumission, dérivée de l'appel d'outil et de son payload.
+    
+    Une même soumission renvoyée (nouvelle tentative après une coupure réseau) porte la
+    même clé, ce qui permet à l'API de ne pas créer de tâche en double.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{tool_call_id}:{canonical}".encode()).hexdigest()
+
+
+def _retry_delay(attempt, response=None):
+    """Délai avant la prochaine tentative : Retry-After si fourni, sinon backoff exponentiel avec gigue."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.ARCADIA_RETRY_MAX_DELAY)
+    delay = settings.ARCADIA_RETRY_BACKOFF * (2 ** attempt)
+    return min(delay, settings.ARCADIA_RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
+
+# Nombre de lignes affichées pour un résultat partiel (lignes ou fichier intermédiaire)
+PARTIAL_PREVIEW_ROWS = 20
+
+# Téléchargements des fichiers intermédiaires, hors de la boucle de suivi des tâches
+_partial_downloads = ThreadPoolExecutor(max_workers=4, thread_name_prefix="partial-download")
+
+_NODE_STATUS_ICONS = {"completed": "✅", "running": "⏳", "processing": "⏳", "failed": "❌", "pending": "▫️"}
+
+
+def format_timeline(nodes, elapsed=None):
+    """Chronologie des étapes d'une tâche, en markdown (une ligne par étape)."""
+    lines = []
+    for index, node in enumerate(nodes):
+        status = node.get("status", "pending")
+        icon = _NODE_STATUS_ICONS.get(status, "•")
+        lines.append(f"{icon} {node.get('name', f'Étape {index + 1}')} — {status}")
+    if elapsed is not None:
+        lines.append(f"*{elapsed:.0f}s écoulées*")
+    return "  \n".join(lines)
 
 class APITools:
-    def __init__(self, base_url="https://api.arcadia-agents.com"):
-        self.base_url = base_url
+    # Intervalle entre deux vérifications de l'état d'une tâche (secondes) et nombre max de vérifications
+    poll_interval = 2
+    max_poll_attempts = 60
+    
+    def __init__(self, base_url=None):
+        self.base_url = base_url or st.secrets.get("ARCADIA_API_URL", "https://api.arcadia-agents.com")
+        # Session partagée : connexions keep-alive réutilisées entre les appels et les sessions
+        self.session = get_http_session()
         # Vous pouvez ajouter des headers d'authentification si nécessaire
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {st.secrets.get('API_KEY', '')}"
         }
     
-    def submit_event(self, payload):
+    def _request(self, method, path, endpoint, headers=None, **kwargs):
+        """
+        Envoie une requête avec délais d'attente et nouvelles tentatives.
+        
+        Les erreurs réseau transitoires et les réponses 429/5xx sont retentées avec un
+        backoff exponentiel ; les autres réponses sont retournées telles quelles.
+        
+        Args:
+            method (str): Méthode HTTP
+            path (str): Chemin de l'endpoint (ex. "/events")
+            endpoint (str): Nom de l'endpoint pour les métriques
+            headers (dict): En-têtes supplémentaires
+            
+        Returns:
+            requests.Response: La dernière réponse obtenue
+            
+        Raises:
+            requests.RequestException: Si toutes les tentatives ont échoué sur une erreur réseau
+        """
+        request_headers = {**self.headers, **(headers or {})}
+        timeout = (settings.ARCADIA_CONNECT_TIMEOUT, settings.ARCADIA_READ_TIMEOUT)
+        max_retries = settings.ARCADIA_MAX_RETRIES
+        
+        for attempt in range(max_retries + 1):
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", headers=request_headers, timeout=timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == max_retries:
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning("Erreur réseau sur %s (%s), nouvelle tentative dans %.1fs", path, e, delay)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                    return response
+                delay = _retry_delay(attempt, response)
+                ARCADIA_ERRORS.inc(endpoint=endpoint, status_code=response.status_code)
+                logger.warning("Réponse %s sur %s, nouvelle tentative dans %.1fs", response.status_code, path, delay)
+            ARCADIA_RETRIES.inc(endpoint=endpoint)
+            time.sleep(delay)
+    
+    def submit_event(self, payload, idempotency_key=None):
         """
         Soumet un événement à l'API et retourne l'event_id.
         
         Args:
             payload (dict): Le payload JSON à envoyer à l'API
+            idempotency_key (str): Clé envoyée dans l'en-tête Idempotency-Key, identique
+                pour toutes les tentatives d'une même soumission
             
         Returns:
             dict: Contient l'event_id et le message de confirmation, ou une erreur
         """
         try:
-            print("Envoi d'une requête à l'endpoint /events : création d'un nouvel évènement")
-            response = requests.post(
-                f"{self.base_url}/events", 
-                json=payload, 
-                headers=self.headers
+            logger.debug("Envoi d'une requête à l'endpoint /events : création d'un nouvel évènement")
+            response = self._request(
+                "POST",
+                "/events",
+                "events",
+                headers={"Idempotency-Key": idempotency_key} if idempotency_key else None,
+                json=payload
             )
             
-            if response.status_code == 202:  # Accepted
+            # 200 : l'événement existait déjà pour cette clé d'idempotence
+            if response.status_code in (200, 202):
+                ARCADIA_SUBMITS.inc(outcome="accepted")
                 response_data = response.json()
                 return {
                     "success": True,
@@ -39,20 +148,26 @@ class APITools:
                     "message": response_data.get("message")
                 }
             elif response.status_code == 422:  # Unprocessable Entity
-                print(f"DEBUG - Erreur 422 : {response.text}")
+                ARCADIA_SUBMITS.inc(outcome="rejected")
+                ARCADIA_ERRORS.inc(endpoint="events", status_code=response.status_code)
+                logger.warning("Erreur 422 lors de la soumission: %s", response.text)
                 return {
                     "success": False,
                     "error": f"Erreur lors de la soumission: {response.status_code}",
                     "details": response.text
                 }
             else:
+                ARCADIA_SUBMITS.inc(outcome="error")
+                ARCADIA_ERRORS.inc(endpoint="events", status_code=response.status_code)
                 return {
                     "success": False,
                     "error": f"Erreur lors de la soumission: {response.status_code}",
                     "details": response.text
                 }
         except Exception as e:
-            print(f"DEBUG - Exception lors de la soumission: {str(e)}")
+            ARCADIA_SUBMITS.inc(outcome="exception")
+            ARCADIA_ERRORS.inc(endpoint="events", status_code="exception")
+            logger.error("Exception lors de la soumission: %s", e)
             return {
                 "success": False,
                 "error": f"Exception lors de la soumission: {str(e)}"
@@ -69,11 +184,8 @@ class APITools:
             dict: Les détails de l'événement ou une erreur
         """
         try:
-            print("Envoi d'une requête à l'endpoint /events/{event_id} : vérification d'un évènement existant")
-            response = requests.get(
-                f"{self.base_url}/events/{event_id}",
-                headers=self.headers
-            )
+            logger.debug("Envoi d'une requête à l'endpoint /events/%s : vérification d'un évènement existant", event_id)
+            response = self._request("GET", f"/events/{event_id}", "event_status")
             
             if response.status_code == 200:
                 return {
@@ -81,12 +193,14 @@ class APITools:
                     "data": response.json()
                 }
             else:
+                ARCADIA_ERRORS.inc(endpoint="event_status", status_code=response.status_code)
                 return {
                     "success": False,
                     "error": f"Erreur lors de la vérification: {response.status_code}",
                     "details": response.text
                 }
         except Exception as e:
+            ARCADIA_ERRORS.inc(endpoint="event_status", status_code="exception")
             return {
                 "success": False,
                 "error": f"Exception lors de la vérification: {str(e)}"
@@ -103,54 +217,141 @@ class APITools:
             dict: Contient le contenu du fichier ou une erreur
         """
         try:
-            print("Envoi d'une requête à l'endpoint /files/{file_id} : téléchargement d'un fichier existant")
-            response = requests.get(
-                f"{self.base_url}/files/{file_id}",
-                headers=self.headers
-            )
+            logger.debug("Envoi d'une requête à l'endpoint /files/%s : téléchargement d'un fichier existant", file_id)
+            response = self._request("GET", f"/files/{file_id}", "files")
             
             if response.status_code == 200:
+                ARCADIA_DOWNLOAD_BYTES.inc(len(response.content))
                 return {
                     "success": True,
                     "content": response.content,
                     "content_type": response.headers.get("Content-Type")
                 }
             else:
+                ARCADIA_ERRORS.inc(endpoint="files", status_code=response.status_code)
                 return {
                     "success": False,
                     "error": f"Erreur lors du téléchargement: {response.status_code}",
                     "details": response.text
                 }
         except Exception as e:
+            ARCADIA_ERRORS.inc(endpoint="files", status_code="exception")
             return {
                 "success": False,
                 "error": f"Exception lors du téléchargement: {str(e)}"
             }
     
-    def call_async_api(self, payload, display_status=True):
+    def _fetch_preview(self, file_info):
+        """Télécharge un fichier intermédiaire et en lit les premières lignes (None en cas d'échec)."""
+        file_result = self.download_file(file_info.get("id"))
+        if not file_result.get("success"):
+            logger.warning("Fichier intermédiaire %s indisponible: %s", file_info.get("filename"), file_result.get("error"))
+            return None
+        try:
+            return read_window(file_result["content"], file_info["type"], 0, PARTIAL_PREVIEW_ROWS)
+        except Exception as e:
+            logger.warning("Aperçu impossible pour %s: %s", file_info.get("filename"), e)
+            return None
+    
+    def _show_partial_results(self, nodes, shown_nodes, container, downloads):
+        """
+        Affiche les résultats partiels des étapes terminées qui n'ont pas encore été affichées.
+        
+        Une étape peut fournir des lignes ("output": {"rows": [...]}) et/ou des fichiers
+        intermédiaires ("files": [{"id", "filename", "type"}]). Les fichiers sont téléchargés
+        en arrière-plan (downloads : future -> (étape, fichier)) et affichés aux vérifications
+        suivantes, sans retarder le suivi de la tâche.
+        """
+        for index, node in enumerate(nodes):
+            node_key = node.get("id") or f"{index}:{node.get('name')}"
+            if node.get("status") != "completed" or node_key in shown_nodes:
+                continue
+            shown_nodes.add(node_key)
+            name = node.get("name", f"Étape {index + 1}")
+            
+            rows = (node.get("output") or {}).get("rows") if isinstance(node.get("output"), dict) else None
+            if rows:
+                with container:
+                    st.caption(f"Résultats partiels — {name} ({len(rows)} lignes)")
+                    st.dataframe(rows[:PARTIAL_PREVIEW_ROWS], hide_index=True, use_container_width=True)
+            
+            for file_info in node.get("files") or []:
+                if file_info.get("type") in TABULAR_TYPES:
+                    downloads[_partial_downloads.submit(self._fetch_preview, file_info)] = (name, file_info)
+        
+        for future in [future for future in downloads if future.done()]:
+            name, file_info = downloads.pop(future)
+            preview = future.result()
+            if preview is not None:
+                with container:
+                    st.caption(f"Fichier intermédiaire — {name} : {file_info.get('filename', 'fichier')}")
+                    st.dataframe(preview, hide_index=True, use_container_width=True)
+    
+    def call_async_api(self, payload, display_status=True, username=None, interactive=True, on_queue=None,
+                       idempotency_key=None, refresh=False):
         """
         Appelle l'API ArcadiaAgents de manière asynchrone et suit le processus jusqu'à la complétion.
         
+        La tâche attend d'abord son créneau dans l'ordonnanceur partagé par le processus
+        (files par utilisateur, partage équitable, nombre de tâches simultanées plafonné).
+        
         Args:
             payload (dict): Le payload JSON à envoyer pour l'événement
             display_status (bool): Afficher le statut dans l'interface Streamlit
+            username (str): Utilisateur à l'origine de la tâche
+            interactive (bool): Requête interactive (prioritaire) ou traitement par lot
+            on_queue (callable): Appelé avec (position, attente estimée en secondes) tant que
+                la tâche est en file d'attente
+            idempotency_key (str): Clé d'idempotence de la soumission (voir idempotency_key())
+            refresh (bool): Relancer la tâche même si un résultat réutilisable existe
+                (préchauffage), sans compter la demande dans les popularités
             
         Returns:
-            dict: Résultat final avec les données et/ou fichiers
+            dict: Résultat final avec les données et/ou fichiers ; marqué "derived" s'il est
+                  repris d'une recherche précédente, sans nouvelle tâche (voir ScreenCache)
         """
+        # Import tardif : le cache (pyarrow) n'est chargé qu'au premier appel
+        from services.cache_warmer import get_popularity_tracker
+        from services.screen_cache import get_screen_cache
+        
+        # Recherche identique ou plus restrictive qu'une recherche terminée : pas de nouvelle tâche
+        screen_cache = get_screen_cache()
+        if not refresh and screen_cache.is_cacheable(payload):
+            # Recherches les plus demandées, relancées en heures creuses (voir CacheWarmer)
+            get_popularity_tracker().record(payload)
+            cached = screen_cache.lookup(payload)
+            if cached is not None:
+                return cached
+        
+        try:
+            with get_job_scheduler().slot(username, interactive=interactive, on_wait=on_queue):
+                result = self._run_job(payload, display_status, idempotency_key)
+            screen_cache.store(payload, result)
+            return result
+        except QueueTimeout as e:
+            return {
+                "success": False,
+                "error": "File d'attente saturée",
+                "details": str(e),
+                "message": "Le service de recherche est saturé. Veuillez réessayer dans quelques minutes."
+            }
+    
+    def _run_job(self, payload, display_status, idempotency_key=None):
+        """Soumet la tâche et suit son état jusqu'à la complétion (voir call_async_api)."""
         # Afficher un placeholder pour les mises à jour de statut
         if display_status:
             status_placeholder = st.empty()
             status_placeholder.info("Soumission de la tâche en cours...")
         
+        job_start = time.perf_counter()
+        
         # 1. Soumettre l'événement
-        submit_result = self.submit_event(payload)
+        submit_result = self.submit_event(payload, idempotency_key=idempotency_key)
         
         if not submit_result.get("success"):
             error_msg = submit_result.get('error', 'Erreur inconnue')
             details = submit_result.get('details', 'Pas de détails disponibles')
-            print(f"DEBUG - Échec de la soumission: {error_msg}")
-            print(f"DEBUG - Détails de l'erreur: {details}")
+            logger.warning("Échec de la soumission: %s", error_msg, extra={"details": details})
             
             if display_status:
                 status_placeholder.error(f"Erreur: {error_msg}")
@@ -169,86 +370,111 @@ class APITools:
         
         if display_status:
             status_placeholder.info(f"Tâche soumise (ID: {event_id}). Traitement en cours...")
+            # Chronologie des étapes et résultats partiels, affichés pendant le traitement
+            timeline_placeholder = st.empty()
+            partial_placeholder = st.empty()
+            partial_container = partial_placeholder.container()
+            shown_nodes = set()
+            partial_downloads = {}
         
         # 2. Suivre l'état jusqu'à la complétion
-        max_attempts = 60  # 2 minutes maximum (avec 2s entre chaque tentative)
+        max_attempts = self.max_poll_attempts  # 2 minutes maximum (avec 2s entre chaque tentative)
         attempt = 0
         
-        while attempt < max_attempts:
-            time.sleep(2)  # Attendre 2 secondes entre les vérifications
-            attempt += 1
+        try:
+            while attempt < max_attempts:
+                time.sleep(self.poll_interval)  # Attendre entre les vérifications
+                attempt += 1
             
-            if display_status:
-                status_placeholder.info(f"Vérification de l'état... ({attempt}/{max_attempts})")
+                if display_status:
+                    status_placeholder.info(f"Vérification de l'état... ({attempt}/{max_attempts})")
             
-            status_result = self.check_event_status(event_id)
+                status_result = self.check_event_status(event_id)
             
-            if not status_result.get("success"):
-                if display_status:
-                    status_placeholder.warning(f"Erreur lors de la vérification: {status_result.get('error')}")
-                continue
+                if not status_result.get("success"):
+                    if display_status:
+                        status_placeholder.warning(f"Erreur lors de la vérification: {status_result.get('error')}")
+                    continue
             
-            event_data = status_result.get("data", {})
-            event_status = event_data.get("status")
+                event_data = status_result.get("data", {})
+                event_status = event_data.get("status")
             
-            if event_status == "completed":
-                if display_status:
-                    status_placeholder.success("Traitement terminé !")
+                if event_status == "completed":
+                    ARCADIA_POLLS_PER_JOB.observe(attempt)
+                    if display_status:
+                        status_placeholder.success("Traitement terminé !")
+                        # Les résultats complets remplacent les résultats partiels
+                        timeline_placeholder.empty()
+                        partial_placeholder.empty()
                 
-                # 3. Récupérer les fichiers si présents
-                files = event_data.get("files", [])
-                downloaded_files = []
+                    # 3. Récupérer les fichiers si présents
+                    files = event_data.get("files", [])
+                    downloaded_files = []
                 
-                if files and len(files) > 0:
-                    if display_status:
-                        status_placeholder.info(f"Téléchargement de {len(files)} fichier(s)...")
+                    if files and len(files) > 0:
+                        if display_status:
+                            status_placeholder.info(f"Téléchargement de {len(files)} fichier(s)...")
                     
-                    for file_info in files:
-                        file_id = file_info.get("id")
-                        file_name = file_info.get("filename", "unknown")
-                        file_type = file_info.get("type", "unknown")
+                        for file_info in files:
+                            file_id = file_info.get("id")
+                            file_name = file_info.get("filename", "unknown")
+                            file_type = file_info.get("type", "unknown")
                         
-                        file_result = self.download_file(file_id)
+                            file_result = self.download_file(file_id)
                         
-                        if file_result.get("success"):
-                            downloaded_files.append({
-                                "file_id": file_id,
-                                "filename": file_name,
-                                "type": file_type,
-                                "content": file_result.get("content"),
-                                "content_type": file_result.get("content_type")
-                            })
-                        else:
-                            if display_status:
-                                status_placeholder.warning(f"Échec du téléchargement du fichier {file_name}: {file_result.get('error')}")
+                            if file_result.get("success"):
+                                downloaded_files.append({
+                                    "file_id": file_id,
+                                    "filename": file_name,
+                                    "type": file_type,
+                                    "content": file_result.get("content"),
+                                    "content_type": file_result.get("content_type")
+                                })
+                            else:
+                                if display_status:
+                                    status_placeholder.warning(f"Échec du téléchargement du fichier {file_name}: {file_result.get('error')}")
                 
-                # 4. Nettoyer le placeholder et retourner les résultats
-                if display_status:
-                    status_placeholder.empty()
+                    # 4. Nettoyer le placeholder et retourner les résultats
+                    if display_status:
+                        status_placeholder.empty()
                 
-                return {
-                    "success": True,
-                    "event_data": event_data,
-                    "downloaded_files": downloaded_files
-                }
+                    ARCADIA_JOB_DURATION.observe(time.perf_counter() - job_start, outcome="completed")
+                
+                    return {
+                        "success": True,
+                        "event_data": event_data,
+                        "downloaded_files": downloaded_files
+                    }
             
-            elif event_status == "processing":
-                if display_status:
-                    # Mettre à jour le statut avec les détails disponibles
-                    task_context = event_data.get("task_context", {})
-                    nodes = task_context.get("nodes", [])
+                elif event_status == "processing":
+                    if display_status:
+                        # Mettre à jour le statut avec les détails disponibles
+                        task_context = event_data.get("task_context", {})
+                        nodes = task_context.get("nodes", [])
                     
-                    if nodes and len(nodes) > 0:
-                        last_node = nodes[-1]
-                        status_message = f"En cours: {last_node.get('name', 'Traitement')} - {last_node.get('status', 'en cours')}"
-                        status_placeholder.info(status_message)
-                    else:
-                        status_placeholder.info(f"Traitement en cours... ({attempt*2}/{max_attempts*2}s)")
-            else:
-                if display_status:
-                    status_placeholder.warning(f"État inattendu: {event_status}")
+                        if nodes and len(nodes) > 0:
+                            last_node = nodes[-1]
+                            status_message = f"En cours: {last_node.get('name', 'Traitement')} - {last_node.get('status', 'en cours')}"
+                            status_placeholder.info(status_message)
+                            timeline_placeholder.markdown(format_timeline(nodes, time.perf_counter() - job_start))
+                            self._show_partial_results(nodes, shown_nodes, partial_container, partial_downloads)
+                        else:
+                            status_placeholder.info(f"Traitement en cours... ({attempt*self.poll_interval:g}/{max_attempts*self.poll_interval:g}s)")
+                else:
+                    if display_status:
+                        status_placeholder.warning(f"État inattendu: {event_status}")
+        
+        finally:
+            if display_status:
+                # Chronologie et résultats partiels retirés quelle que soit l'issue (délai, erreur...)
+                timeline_placeholder.empty()
+                partial_placeholder.empty()
+                for future in partial_downloads:
+                    future.cancel()
         
         # Délai dépassé
+        ARCADIA_POLLS_PER_JOB.observe(attempt)
+        ARCADIA_JOB_DURATION.observe(time.perf_counter() - job_start, outcome="timeout")
         if display_status:
             status_placeholder.error("Délai d'attente dépassé pour la tâche")
         
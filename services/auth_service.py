@@ -1,14 +1,116 @@
+import copy
+import hashlib
+import json
 import os
-import yaml
+import threading
+import time
+from collections.abc import Mapping
 import streamlit as st
-import streamlit_authenticator as stauth
-from yaml.loader import SafeLoader
 from utils.logger import setup_logger
 from utils.exception_utils import format_exception
 
 # Configuration du logging
 logger = setup_logger("auth_service")
 
+# Intervalle minimal (en secondes) entre deux vérifications du fichier de configuration
+CONFIG_CHECK_INTERVAL = 2.0
+
+# Clé de session de l'authentificateur propre à chaque session
+_SESSION_KEY = "_auth_session"
+
+
+class _CachedAuthConfig:
+    """Configuration d'authentification analysée, partagée par toutes les sessions du processus."""
+    
+    def __init__(self, config, signature=None, content_hash=None):
+        self.config = config
+        self.signature = signature
+        self.content_hash = content_hash
+        self.checked_at = time.monotonic()
+        # Les mots de passe en clair sont hachés une seule fois, pas à chaque rerun
+        credentials = self.config.get('credentials', {})
+        if credentials.get('usernames'):
+            # Import tardif : streamlit_authenticator est lourd à charger au démarrage du worker
+            import streamlit_authenticator as stauth
+            stauth.Hasher.hash_passwords(credentials)
+
+
+_config_cache = {}
+_config_lock = threading.Lock()
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _load_file_config(path):
+    """
+    Retourne la configuration du fichier YAML, en ne le relisant que s'il a changé.
+    
+    Le fichier n'est examiné qu'une fois par CONFIG_CHECK_INTERVAL ; il n'est relu que si
+    sa date de modification ou sa taille a changé, et réanalysé que si son contenu diffère.
+    """
+    with _config_lock:
+        cached = _config_cache.get(path)
+        now = time.monotonic()
+        if cached is not None and now - cached.checked_at < CONFIG_CHECK_INTERVAL:
+            return cached
+        
+        signature = _file_signature(path)
+        if cached is not None and cached.signature == signature:
+            cached.checked_at = now
+            return cached
+        
+        with open(path, 'rb') as file:
+            content = file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        if cached is not None and cached.content_hash == content_hash:
+            cached.signature = signature
+            cached.checked_at = now
+            return cached
+        
+        logger.info(f"Chargement du fichier de configuration: {path}")
+        import yaml
+        cached = _CachedAuthConfig(yaml.load(content, Loader=yaml.SafeLoader), signature, content_hash)
+        _config_cache[path] = cached
+        return cached
+
+
+def _plain(value):
+    """Copie modifiable d'une valeur des secrets Streamlit (dictionnaires et listes ordinaires)."""
+    if isinstance(value, Mapping):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _load_secrets_config():
+    """
+    Retourne la configuration issue des secrets Streamlit, convertie une seule fois.
+    
+    Comme pour le fichier, les secrets ne sont réexaminés qu'une fois par
+    CONFIG_CHECK_INTERVAL, et la configuration n'est reconstruite que si leur contenu diffère.
+    """
+    with _config_lock:
+        cached = _config_cache.get('secrets')
+        now = time.monotonic()
+        if cached is not None and now - cached.checked_at < CONFIG_CHECK_INTERVAL:
+            return cached
+        
+        config = _plain(st.secrets['auth_config'])
+        content_hash = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+        if cached is not None and cached.content_hash == content_hash:
+            cached.checked_at = now
+            return cached
+        
+        logger.info("Chargement de la configuration d'authentification depuis les secrets")
+        cached = _CachedAuthConfig(config, content_hash=content_hash)
+        _config_cache['secrets'] = cached
+        return cached
+
+
 class AuthService:
     """Service de gestion de l'authentification."""
     
@@ -20,33 +122,42 @@ class AuthService:
         
         # Essayer d'abord de charger depuis les secrets Streamlit si disponibles
         if hasattr(st, 'secrets') and 'auth_config' in st.secrets:
-            logger.info("Utilisation de la configuration depuis les secrets Streamlit")
-            # Créer une copie modifiable du dictionnaire de secrets
-            self.config = dict(st.secrets['auth_config'])
-            # Assurez-vous que la structure interne est également copiée
-            if 'credentials' in self.config and 'usernames' in self.config['credentials']:
-                self.config['credentials'] = dict(self.config['credentials'])
-                self.config['credentials']['usernames'] = dict(self.config['credentials']['usernames'])
-                # Et aussi les utilisateurs individuels
-                for username in self.config['credentials']['usernames']:
-                    self.config['credentials']['usernames'][username] = dict(self.config['credentials']['usernames'][username])
+            logger.debug("Utilisation de la configuration depuis les secrets Streamlit")
+            self._use_cached_config(_load_secrets_config())
         else:
             # Sinon, charger depuis le fichier
             self.load_config()
-            
-        self.initialize_authenticator()
+        
+        # L'authentificateur de la session est réutilisé d'un rerun à l'autre
+        self.authenticator = self._session.get("authenticator")
+        if self.authenticator is None:
+            self.initialize_authenticator()
+            self._session["authenticator"] = self.authenticator
+    
+    def _use_cached_config(self, cached):
+        """
+        Associe la session à la configuration du processus.
+        
+        La copie de la configuration (l'authentificateur modifie les identifiants en place)
+        et l'authentificateur sont propres à la session et conservés dans st.session_state
+        tant que la configuration du processus n'a pas été rechargée.
+        """
+        session = st.session_state.get(_SESSION_KEY)
+        if session is None or session["source"] is not cached:
+            session = {"source": cached, "config": copy.deepcopy(cached.config), "authenticator": None}
+            st.session_state[_SESSION_KEY] = session
+        self._session = session
+        self.config = session["config"]
     
     def load_config(self):
-        """Charge la configuration depuis le fichier YAML."""
+        """Charge la configuration depuis le fichier YAML (via le cache du processus)."""
         try:
             # D'abord essayer de charger le fichier credentials.yaml (fichier réel)
             if not os.path.exists(self.credentials_path):
                 self.credentials_path = "config/example_credentials.yaml"
                 logger.warning("Utilisation du fichier d'authentification d'exemple.")
             
-            logger.info(f"Chargement du fichier de configuration: {self.credentials_path}")
-            with open(self.credentials_path, 'r') as file:
-                self.config = yaml.load(file, Loader=SafeLoader)
+            self._use_cached_config(_load_file_config(self.credentials_path))
             
             # Afficher des informations détaillées sur la configuration
             # self.debug_config()
@@ -58,15 +169,17 @@ class AuthService:
     def initialize_authenticator(self):
         """Initialise l'objet authentificateur."""
         try:
-            logger.info("Création de l'objet Authenticate")
+            logger.debug("Création de l'objet Authenticate")
+            import streamlit_authenticator as stauth
             self.authenticator = stauth.Authenticate(
                 self.config['credentials'],
                 self.config['cookie']['name'],
                 self.config['cookie']['key'],
                 self.config['cookie']['expiry_days'],
-                self.config.get('preauthorized', {}).get('emails', [])
+                self.config.get('preauthorized', {}).get('emails', []),
+                auto_hash=False  # Mots de passe déjà hachés lors de la mise en cache
             )
-            logger.info("Objet Authenticate créé avec succès")
+            logger.debug("Objet Authenticate créé avec succès")
         
         except Exception as e:
             logger.error(f"Erreur lors de l'initialisation de l'authentificateur: {format_exception(e)}")
@@ -92,7 +205,7 @@ class AuthService:
             authentication_status = st.session_state.get("authentication_status", None)
             username = st.session_state.get("username", None)
             
-            logger.info(f"État de la session après login: name={name}, auth_status={authentication_status}, username={username}")
+            logger.debug("État de la session après login: name=%s, auth_status=%s, username=%s", name, authentication_status, username)
             
             return authentication_status, name, username
         
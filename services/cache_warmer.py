@@ -0,0 +1,240 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import settings
+from services.job_scheduler import get_job_scheduler
+from utils.logger import setup_logger
+from utils.metrics import CACHE_WARMING_JOBS
+
+# Configuration du logging
+logger = setup_logger("cache_warmer")
+
+# Utilisateur sous lequel les tâches de préchauffage passent dans l'ordonnanceur
+WARMER_USERNAME = "cache-warmer"
+
+# Intervalle minimal (secondes) entre deux écritures des popularités sur disque
+_SAVE_INTERVAL = 60
+
+
+class PopularityTracker:
+    """
+    Popularité des recherches soumises, par payload canonique (voir payload_key).
+
+    Chaque demande ajoute 1 à un score qui décroît de moitié tous les half_life secondes :
+    les recherches demandées chaque matin restent en tête, les recherches ponctuelles
+    s'effacent. Les scores sont conservés dans un fichier JSON pour survivre aux redémarrages.
+    """
+
+    def __init__(self, path, half_life, max_tracked):
+        self.path = path
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                self._entries = json.load(file)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        """Écrit les scores sur disque, de manière atomique."""
+        with self._lock:
+            data = json.dumps(self._entries, ensure_ascii=False)
+            self._last_save = time.time()
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+    def _decayed(self, entry, now):
+        return entry["score"] * 0.5 ** ((now - entry["updated_at"]) / self.half_life)
+
+    def record(self, payload):
+        """Enregistre une demande de recherche."""
+        # Import tardif : le cache des recherches (pyarrow) n'est chargé qu'au premier usage
+        from services.screen_cache import payload_key
+        now = time.time()
+        key = payload_key(payload)
+        with self._lock:
+            entry = self._entries.get(key)
+            score = self._decayed(entry, now) if entry else 0.0
+            self._entries[key] = {"payload": payload, "score": score + 1, "updated_at": now}
+            if len(self._entries) > self.max_tracked:
+                # Oublier les recherches les moins demandées
+                ranked = sorted(self._entries, key=lambda k: self._decayed(self._entries[k], now))
+                for stale in ranked[:len(self._entries) - self.max_tracked]:
+                    del self._entries[stale]
+            save = now - self._last_save > _SAVE_INTERVAL
+        if save:
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning("Écriture des popularités impossible: %s", e)
+
+    def top(self, n, min_score=0):
+        """
+        Recherches les plus demandées.
+
+        Returns:
+            list: (score actuel, payload), du plus au moins demandé
+        """
+        now = time.time()
+        with self._lock:
+            scored = [(self._decayed(entry, now), entry["payload"]) for entry in self._entries.values()]
+        scored = [item for item in scored if item[0] >= min_score]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:n]
+
+
+def _parse_window(window):
+    start, end = (datetime.time.fromisoformat(value) for value in window)
+    return start, end
+
+
+def in_off_peak_window(now=None, windows=None):
+    """Indique si l'heure locale est dans une plage creuse (une plage peut passer minuit)."""
+    current = (now or datetime.datetime.now()).time()
+    for window in settings.CACHE_WARMING_WINDOWS if windows is None else windows:
+        start, end = _parse_window(window)
+        if start <= end and start <= current < end:
+            return True
+        if start > end and (current >= start or current < end):
+            return True
+    return False
+
+
+class CacheWarmer:
+    """
+    Relance en heures creuses les recherches les plus demandées, pour que leurs résultats
+    soient déjà dans le cache des recherches (voir ScreenCache) à l'arrivée des analystes.
+
+    Le préchauffage ne concurrence pas le trafic interactif : ses tâches passent en lot
+    dans l'ordonnanceur, ne démarrent que s'il reste CACHE_WARMING_RESERVED_SLOTS créneaux
+    libres, et sont limitées en parallélisme et en nombre par heure.
+    """
+
+    def __init__(self, tracker, api_factory):
+        self.tracker = tracker
+        self.api_factory = api_factory
+        self._started = deque()
+        self._lock = threading.Lock()
+
+    def _can_start(self):
+        """Budget de débit (tâches par heure) et créneaux laissés à l'interactif."""
+        now = time.time()
+        with self._lock:
+            while self._started and now - self._started[0] > 3600:
+                self._started.popleft()
+            if len(self._started) >= settings.CACHE_WARMING_MAX_PER_HOUR:
+                return False
+        return get_job_scheduler().idle_slots() > settings.CACHE_WARMING_RESERVED_SLOTS
+
+    def candidates(self):
+        """Recherches populaires dont le résultat conservé est absent ou trop ancien."""
+        # Import tardif : voir record()
+        from services.screen_cache import get_screen_cache
+        screen_cache = get_screen_cache()
+        payloads = []
+        for score, payload in self.tracker.top(settings.CACHE_WARMING_TOP_N, settings.CACHE_WARMING_MIN_SCORE):
+            age = screen_cache.age(payload)
+            if age is None or age > settings.CACHE_WARMING_REFRESH_AGE:
+                payloads.append(payload)
+        return payloads
+
+    def _warm(self, api, payload):
+        start = time.perf_counter()
+        try:
+            result = api.call_async_api(payload, display_status=False, username=WARMER_USERNAME,
+                                        interactive=False, refresh=True)
+            outcome = "success" if result.get("success") else "error"
+        except Exception as e:
+            logger.warning("Échec du préchauffage de %s: %s", payload.get("event_type"), e)
+            outcome = "error"
+        CACHE_WARMING_JOBS.inc(outcome=outcome)
+        logger.info("Préchauffage de %s (%s) en %.1fs", payload.get("event_type"), outcome, time.perf_counter() - start)
+
+    def run_once(self, now=None):
+        """
+        Un cycle de préchauffage (sans effet hors des plages creuses).
+
+        Returns:
+            int: Nombre de tâches de préchauffage lancées
+        """
+        if not in_off_peak_window(now):
+            return 0
+        payloads = self.candidates()
+        if not payloads:
+            return 0
+
+        api = self.api_factory()
+        launched = 0
+        with ThreadPoolExecutor(max_workers=settings.CACHE_WARMING_MAX_CONCURRENT,
+                                thread_name_prefix="cache-warmer-job") as executor:
+            running = set()
+            for payload in payloads:
+                while len(running) >= settings.CACHE_WARMING_MAX_CONCURRENT:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                if not self._can_start():
+                    CACHE_WARMING_JOBS.inc(outcome="deferred")
+                    break
+                with self._lock:
+                    self._started.append(time.time())
+                running.add(executor.submit(self._warm, api, payload))
+                launched += 1
+        return launched
+
+    def _loop(self):
+        while True:
+            time.sleep(settings.CACHE_WARMING_CHECK_INTERVAL)
+            try:
+                self.run_once()
+                self.tracker.save()
+            except Exception as e:
+                logger.warning("Échec du cycle de préchauffage: %s", e)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+_warmer_started = False
+
+
+def get_popularity_tracker():
+    """Retourne le suivi des popularités partagé par le processus."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = PopularityTracker(settings.CACHE_WARMING_POPULARITY_PATH,
+                                             settings.CACHE_WARMING_HALF_LIFE, settings.CACHE_WARMING_MAX_TRACKED)
+    return _tracker
+
+
+def _api_tools():
+    # Import tardif : api_tools importe ce module (import circulaire)
+    from services.api_tools import APITools
+    return APITools()
+
+
+def start_cache_warmer():
+    """Démarre (une seule fois par processus) le préchauffage en arrière-plan, s'il est activé."""
+    global _warmer_started
+    with _tracker_lock:
+        if _warmer_started or not settings.CACHE_WARMING_ENABLED:
+            return
+        _warmer_started = True
+    warmer = CacheWarmer(get_popularity_tracker(), _api_tools)
+    threading.Thread(target=warmer._loop, name="cache-warmer", daemon=True).start()
+    logger.info("Préchauffage des recherches populaires actif (plages creuses: %s)", settings.CACHE_WARMING_WINDOWS)
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+
+from config import settings
+from services.file_store import FileStore
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("conversation_store")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    thread_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_recency
+    ON conversations (username, updated_at DESC);
+
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL REFERENCES conversations (thread_id),
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    message_id TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS message_files (
+    thread_id TEXT NOT NULL REFERENCES conversations (thread_id),
+    message_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    type TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (message_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_message_files_thread
+    ON message_files (thread_id);
+"""
+
+TITLE_MAX_LENGTH = 80
+
+
+class ConversationStore:
+    """
+    Miroir local (SQLite, mode WAL) des conversations, messages et fichiers de résultats.
+
+    Les contenus des fichiers sont stockés par référence dans un FileStore ; la base
+    ne garde que leur empreinte.
+    """
+
+    def __init__(self, db_path, files_dir):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.files = FileStore(files_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        # WAL : lectures concurrentes (plusieurs workers) pendant une écriture
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def save_message(self, username, thread_id, position, message):
+        """
+        Enregistre (ou met à jour) un message d'une conversation.
+
+        Args:
+            username (str): L'utilisateur propriétaire de la conversation
+            thread_id (str): L'ID du thread OpenAI
+            position (int): L'index du message dans st.session_state.messages
+            message (dict): Le message ("role", "content" et éventuellement "message_id")
+        """
+        now = time.time()
+        title = message["content"][:TITLE_MAX_LENGTH] if message["role"] == "user" else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO conversations (thread_id, username, title, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET updated_at = excluded.updated_at, "
+                "title = COALESCE(conversations.title, excluded.title)",
+                (thread_id, username, title, now, now)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (thread_id, position, role, content, message_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, position, message["role"], message["content"] or "", message.get("message_id"), now)
+            )
+
+    def save_message_files(self, thread_id, message_id, files):
+        """
+        Enregistre les fichiers associés à un message.
+
+        Args:
+            thread_id (str): L'ID du thread OpenAI
+            message_id (str): L'ID du message de l'assistant
+            files (list): Les fichiers ("filename", "type", "content" et éventuellement "digest" ;
+                un fichier déchargé sur disque n'a que son "digest")
+        """
+        rows = []
+        for position, file_data in enumerate(files):
+            if file_data.get("content") is None:
+                digest = file_data["digest"]
+            else:
+                digest = self.files.put(file_data["content"], file_data.get("digest"))
+            rows.append((thread_id, message_id, position, file_data["filename"], file_data["type"], digest))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO message_files (thread_id, message_id, position, filename, type, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def list_conversations(self, username, limit=20):
+        """Retourne les conversations d'un utilisateur, de la plus récente à la plus ancienne."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, title, created_at, updated_at FROM conversations "
+                "WHERE username = ? ORDER BY updated_at DESC LIMIT ?",
+                (username, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def load_conversation(self, thread_id):
+        """
+        Recharge une conversation depuis le disque.
+
+        Args:
+            thread_id (str): L'ID du thread OpenAI
+
+        Returns:
+            tuple: (messages, message_files) au format de st.session_state, sans le message système
+        """
+        with self._lock:
+            message_rows = self._conn.execute(
+                "SELECT role, content, message_id FROM messages WHERE thread_id = ? ORDER BY position",
+                (thread_id,)
+            ).fetchall()
+            file_rows = self._conn.execute(
+                "SELECT message_id, filename, type, digest FROM message_files "
+                "WHERE thread_id = ? ORDER BY message_id, position",
+                (thread_id,)
+            ).fetchall()
+
+        messages = []
+        for row in message_rows:
+            message = {"role": row["role"], "content": row["content"]}
+            if row["message_id"]:
+                message["message_id"] = row["message_id"]
+            messages.append(message)
+
+        message_files = {}
+        for row in file_rows:
+            try:
+                content = self.files.get(row["digest"])
+            except OSError as e:
+                logger.warning(f"Fichier {row['filename']} introuvable dans le stockage local: {e}")
+                continue
+            message_files.setdefault(row["message_id"], []).append({
+                "filename": row["filename"],
+                "type": row["type"],
+                "content": content,
+                "digest": row["digest"]
+            })
+        return messages, message_files
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Retourne l'instance de ConversationStore partagée par le processus."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(settings.CONVERSATIONS_DB_PATH, settings.FILES_DIR)
+    return _store
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import uuid
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from config import settings
+from services.file_store import FileStore
+from services.result_tables import TABULAR_TYPES
+from services.session_memory import file_table
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("export")
+
+COMBINED_PARQUET_NAME = "resultats_combines.parquet"
+
+
+def _safe_name(filename):
+    return re.sub(r"[^\w.\-]+", "_", filename or "fichier").strip("._") or "fichier"
+
+
+def _iter_chunks(file_data, files, chunk_size):
+    """Morceaux du contenu d'un fichier : depuis la mémoire, ou relu par morceaux depuis le disque."""
+    content = file_data.get("content")
+    if content is not None:
+        view = memoryview(content)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        return
+    with open(files.path(file_data["digest"]), "rb") as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _combined_schema(schemas):
+    """
+    Schéma commun aux tables de résultats (union des colonnes, dans l'ordre d'apparition).
+
+    Une colonne de types différents d'un fichier à l'autre devient float64 si tous ses types
+    sont numériques, sinon texte.
+    """
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, []).append(field.type)
+    fields = []
+    for name, column_types in types.items():
+        if all(column_type == column_types[0] for column_type in column_types):
+            column_type = column_types[0]
+        elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in column_types):
+            column_type = pa.float64()
+        else:
+            column_type = pa.string()
+        if pa.types.is_null(column_type):
+            column_type = pa.string()
+        fields.append(pa.field(name, column_type))
+    fields.append(pa.field("source_file", pa.string()))
+    return pa.schema(fields)
+
+
+def _conform(batch, schema, source_file):
+    """Aligne un lot de lignes sur le schéma commun (colonnes manquantes à null)."""
+    columns = []
+    for field in schema:
+        if field.name == "source_file":
+            columns.append(pa.array([source_file] * batch.num_rows, pa.string()))
+        elif field.name in batch.schema.names:
+            column = batch.column(field.name)
+            columns.append(column if column.type == field.type else pc.cast(column, field.type))
+        else:
+            columns.append(pa.nulls(batch.num_rows, field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _cleanup_exports(exports_dir):
+    """Supprime les exports plus anciens que EXPORT_TTL."""
+    limit = time.time() - settings.EXPORT_TTL
+    for name in os.listdir(exports_dir):
+        path = os.path.join(exports_dir, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def export_conversation(message_files, exports_dir=None):
+    """
+    Écrit dans une archive ZIP tous les fichiers de résultats d'une conversation, ainsi
+    qu'un Parquet combinant ses résultats tabulaires.
+
+    L'archive est produite morceau par morceau sur le disque : ni les fichiers ni l'archive
+    ne sont assemblés en mémoire, et les tables sont traitées une à une, lot par lot (le
+    schéma commun est établi à partir des seuls schémas des fichiers).
+
+    Args:
+        message_files (dict): ID de message -> fichiers ({"filename", "type", "content" ou "digest"})
+        exports_dir (str): Répertoire des exports (par défaut EXPORTS_DIR)
+
+    Returns:
+        dict: "success", "error" ou "path" (archive), "files", "rows" (lignes du Parquet) et "bytes"
+    """
+    exports_dir = exports_dir or settings.EXPORTS_DIR
+    files = FileStore(settings.FILES_DIR)
+    all_files = [f for message_id in message_files for f in message_files[message_id]]
+    if not all_files:
+        return {"success": False, "error": "Aucun fichier de résultats dans cette conversation"}
+
+    os.makedirs(exports_dir, exist_ok=True)
+    _cleanup_exports(exports_dir)
+    path = os.path.join(exports_dir, f"export_{uuid.uuid4().hex}.zip")
+    chunk_size = settings.EXPORT_CHUNK_BYTES
+    start = time.perf_counter()
+
+    try:
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            tabular = []
+            for index, file_data in enumerate(all_files, start=1):
+                name = f"resultats/{index:03d}_{_safe_name(file_data.get('filename'))}"
+                with archive.open(name, "w", force_zip64=True) as entry:
+                    for chunk in _iter_chunks(file_data, files, chunk_size):
+                        entry.write(chunk)
+                if file_data.get("type") in TABULAR_TYPES:
+                    tabular.append((name, file_data))
+
+            rows = 0
+            if tabular:
+                # Premier passage : les schémas seuls (chaque table est relâchée aussitôt, et
+                # relue ensuite depuis le cache ou sa conversion Parquet projetée en mémoire)
+                schemas, readable = [], []
+                for name, file_data in tabular:
+                    try:
+                        schemas.append(file_table(file_data).schema)
+                        readable.append((name, file_data))
+                    except Exception as e:
+                        logger.warning("Fichier %s ignoré dans le Parquet combiné: %s", name, e)
+                if readable:
+                    schema = _combined_schema(schemas)
+                    with archive.open(COMBINED_PARQUET_NAME, "w", force_zip64=True) as entry:
+                        with pq.ParquetWriter(entry, schema) as writer:
+                            for name, file_data in readable:
+                                source_file = name.split("/", 1)[1]
+                                table = file_table(file_data)
+                                for batch in table.to_batches(max_chunksize=settings.EXPORT_PARQUET_BATCH_ROWS):
+                                    writer.write_batch(_conform(batch, schema, source_file))
+                                    rows += batch.num_rows
+                                del table
+    except Exception as e:
+        logger.error("Erreur lors de l'export de la conversation: %s", e)
+        if os.path.exists(path):
+            os.unlink(path)
+        return {"success": False, "error": str(e)}
+
+    size = os.path.getsize(path)
+    logger.info("Export de %d fichier(s) (%d lignes combinées, %d octets) en %.2fs",
+                len(all_files), rows, size, time.perf_counter() - start)
+    return {"success": True, "path": path, "files": len(all_files), "rows": rows, "bytes": size}
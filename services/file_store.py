@@ -0,0 +1,48 @@
+import hashlib
+import os
+import tempfile
+
+
+class FileStore:
+    """Stockage local des contenus de fichiers, adressés par leur empreinte SHA-256."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def path(self, digest):
+        """Retourne le chemin du fichier correspondant à une empreinte."""
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, content, digest=None):
+        """
+        Enregistre un contenu s'il n'est pas déjà présent.
+
+        Args:
+            content (bytes): Le contenu à enregistrer
+            digest (str): Empreinte du contenu, calculée si absente
+
+        Returns:
+            str: L'empreinte du contenu
+        """
+        digest = digest or hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Écriture atomique : un lecteur ne voit jamais un fichier partiel
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(content)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return digest
+
+    def get(self, digest):
+        """Relit un contenu à partir de son empreinte."""
+        with open(self.path(digest), "rb") as file:
+            return file.read()
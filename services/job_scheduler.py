@@ -0,0 +1,165 @@
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+from utils.logger import setup_logger
+from utils.metrics import ARCADIA_QUEUE_DEPTH, ARCADIA_QUEUE_WAIT
+
+# Configuration du logging
+logger = setup_logger("job_scheduler")
+
+
+class QueueTimeout(Exception):
+    """La tâche n'a pas obtenu de créneau dans le délai imparti."""
+
+
+class _Job:
+    __slots__ = ("username", "interactive", "tag", "seq", "granted")
+
+    def __init__(self, username, interactive, tag, seq):
+        self.username = username
+        self.interactive = interactive
+        self.tag = tag
+        self.seq = seq
+        self.granted = False
+
+    def order(self):
+        # Les requêtes interactives passent avant les lots, puis ordre équitable pondéré
+        return (not self.interactive, self.tag, self.seq)
+
+
+class JobScheduler:
+    """
+    Ordonnanceur des tâches ArcadiaAgents, partagé par toutes les sessions du processus.
+
+    Chaque utilisateur a sa propre file ; les créneaux (au plus max_concurrent tâches en
+    cours) sont attribués par file d'attente équitable pondérée (étiquettes de temps
+    virtuel), les requêtes interactives passant avant les lots.
+
+    Args:
+        max_concurrent (int): Nombre maximal de tâches en cours
+        weights (dict): Poids par utilisateur (1 par défaut)
+    """
+
+    def __init__(self, max_concurrent, weights=None):
+        self.max_concurrent = max_concurrent
+        self.weights = weights or {}
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._seq = itertools.count()
+        # Durée moyenne (moyenne mobile) d'une tâche, pour estimer l'attente
+        self._avg_duration = float(settings.ARCADIA_JOB_DURATION_ESTIMATE)
+
+    def _weight(self, username):
+        return max(float(self.weights.get(username, 1)), 0.01)
+
+    def _dispatch(self):
+        """Attribue les créneaux libres aux tâches en tête (appelé sous le verrou)."""
+        granted = False
+        while self._running < self.max_concurrent and self._waiting:
+            job = min(self._waiting, key=_Job.order)
+            self._waiting.remove(job)
+            job.granted = True
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, job.tag)
+            granted = True
+        ARCADIA_QUEUE_DEPTH.set(len(self._waiting))
+        if granted:
+            self._cond.notify_all()
+
+    def position(self, job):
+        """Nombre de tâches qui passeront avant celle-ci (appelé sous le verrou)."""
+        key = job.order()
+        return sum(1 for other in self._waiting if other.order() < key)
+
+    def idle_slots(self):
+        """Créneaux libres, déduction faite des tâches en file d'attente."""
+        with self._cond:
+            return self.max_concurrent - self._running - len(self._waiting)
+
+    def estimated_wait(self, position):
+        """Attente estimée (secondes) pour une tâche à cette position."""
+        return math.ceil((position + 1) / self.max_concurrent) * self._avg_duration
+
+    @contextmanager
+    def slot(self, username, interactive=True, on_wait=None, timeout=None):
+        """
+        Attend un créneau pour l'utilisateur, puis le libère à la sortie du bloc.
+
+        Args:
+            username (str): Utilisateur qui soumet la tâche
+            interactive (bool): Requête interactive (prioritaire) ou lot
+            on_wait (callable): Appelé avec (position, attente estimée en secondes) pendant
+                l'attente, depuis le thread appelant
+            timeout (float): Attente maximale (secondes)
+
+        Raises:
+            QueueTimeout: Si aucun créneau n'est obtenu dans le délai
+        """
+        timeout = settings.ARCADIA_QUEUE_TIMEOUT if timeout is None else timeout
+        username = username or "anonymous"
+        enqueued = time.monotonic()
+
+        with self._cond:
+            # Étiquette de début équitable : une file très active prend du retard sur les autres
+            start_tag = max(self._virtual_time, self._last_finish.get(username, 0.0))
+            tag = start_tag + 1.0 / self._weight(username)
+            self._last_finish[username] = tag
+            job = _Job(username, interactive, tag, next(self._seq))
+            self._waiting.append(job)
+            self._dispatch()
+
+            last_reported = None
+            while not job.granted:
+                remaining = timeout - (time.monotonic() - enqueued)
+                if remaining <= 0:
+                    self._waiting.remove(job)
+                    ARCADIA_QUEUE_DEPTH.set(len(self._waiting))
+                    logger.warning("Tâche de %s abandonnée après %.0fs en file d'attente", username, timeout)
+                    raise QueueTimeout(f"Aucun créneau disponible après {timeout:g}s")
+                position = self.position(job)
+                if on_wait is not None and position != last_reported:
+                    last_reported = position
+                    eta = self.estimated_wait(position)
+                    # Le rappel met à jour l'interface : hors du verrou
+                    self._cond.release()
+                    try:
+                        on_wait(position + 1, eta)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                self._cond.wait(min(remaining, 1.0))
+
+        waited = time.monotonic() - enqueued
+        ARCADIA_QUEUE_WAIT.observe(waited)
+        if waited > 1:
+            logger.info("Tâche de %s démarrée après %.1fs en file d'attente", username, waited)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            with self._cond:
+                self._running -= 1
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._dispatch()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler():
+    """Retourne l'ordonnanceur partagé par le processus."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(settings.ARCADIA_MAX_CONCURRENT_JOBS, settings.ARCADIA_USER_WEIGHTS)
+        return _scheduler
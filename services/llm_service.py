@@ -3,32 +3,65 @@ import os
 import time
 import random
 import streamlit as st
-from openai import OpenAI
-from openai.types.beta.threads import Run
-from openai.types.beta.threads.runs import RunStep
+from config import settings
+from services.local_tools import is_local_tool, local_tool_definitions, run_local_tool, session_tables
+from services.result_tables import TABULAR_TYPES, content_digest, is_converted, load_table, query_page, read_window
+from services.results_index import index_results_async
+from services.session_memory import file_content as load_file_content
+from services.session_sync import associate_pending_files, save_session
+from services.tool_output import build_tool_output
+from services.tool_schemas import tool_validators, validate_tool_arguments
+from services.warmup import get_assistant_tools, get_openai_client, thread_pool, warm_up
+from utils.logger import setup_logger
+from utils.metrics import ASSISTANT_RUN_DURATION, ASSISTANT_RUNS, ASSISTANT_RUNS_IN_FLIGHT, TOOL_CALL_DURATION, TOOL_CALLS
+
+# Configuration du logging
+logger = setup_logger("llm_service")
 
 class LLMService:
     def __init__(self):
-        self.client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+        # Client partagé par le processus (connexions gardées ouvertes entre les reruns)
+        self.client = get_openai_client(st.secrets["OPENAI_API_KEY"])
         self.assistant_id = st.secrets.get("OPENAI_ASSISTANT_ID", "votre_assistant_id_par_défaut")
         # Dictionnaire pour stocker les fichiers par ID de message
         if "message_files" not in st.session_state:
             st.session_state.message_files = {}
     
+    def warm_up(self):
+        """Prépare en arrière-plan les connexions et un thread pour la première question."""
+        from services.api_tools import APITools
+        warm_up(self.client, self.assistant_id, APITools().base_url)
+    
     def get_stream(self, messages: list) -> dict:
         """
         Crée un stream de réponses depuis l'API OpenAI Assistants avec statut.
         """
+        # Statut final du run, renseigné par _stream_run pour les métriques
+        run_state = {"status": "interrupted"}
+        ASSISTANT_RUNS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            yield from self._stream_run(messages, run_state)
+        finally:
+            st.session_state.pop("active_run", None)
+            ASSISTANT_RUNS_IN_FLIGHT.dec()
+            ASSISTANT_RUNS.inc(status=run_state["status"])
+            ASSISTANT_RUN_DURATION.observe(time.perf_counter() - start)
+    
+    def _stream_run(self, messages, run_state):
+        """Exécute un run sur le thread de la session et produit les morceaux de la réponse."""
         # Import ici pour éviter les dépendances circulaires
-        from services.api_tools import APITools
+        from services.api_tools import APITools, idempotency_key
         
         # Initialiser les outils API
         api_tools = APITools()
         
-        # Créer ou récupérer un thread existant
+        # Créer ou récupérer un thread existant (de préférence un thread préparé à l'avance)
         if "thread_id" not in st.session_state:
-            thread = self.client.beta.threads.create()
-            st.session_state.thread_id = thread.id
+            thread_id = thread_pool.acquire(self.client)
+            if thread_id is None:
+                thread_id = self.client.beta.threads.create().id
+            st.session_state.thread_id = thread_id
         
         thread_id = st.session_state.thread_id
         
@@ -39,6 +72,7 @@ class LLMService:
         for run in active_runs.data:
             if run.status in ["queued", "in_progress", "requires_action"]:
                 # Si le run est toujours actif après les tentatives, avertir l'utilisateur
+                run_state["status"] = "busy"
                 yield "⚠️ Une autre tâche est encore en cours de traitement. Veuillez attendre qu'elle soit terminée avant d'envoyer un nouveau message."
                 return
         
@@ -61,6 +95,12 @@ class LLMService:
             "thread_id": thread_id,
         }
         
+        # Outils locaux ajoutés à ceux de l'assistant (ceux qui portent sur les résultats de la
+        # session seulement si des résultats ont déjà été récupérés)
+        assistant_tools = get_assistant_tools(self.client, self.assistant_id)
+        if assistant_tools is not None:
+            run_params["tools"] = assistant_tools + local_tool_definitions(bool(session_tables(st.session_state)))
+        
         # Créer et démarrer un statut
         status_placeholder = st.empty()
         
@@ -76,6 +116,8 @@ class LLMService:
                 # Sauvegarder le run_id dès qu'il est disponible
                 if event.event == "thread.run.created" and hasattr(event, 'data'):
                     run_id = event.data.id
+                    # Run en cours, visible des autres réplicas via l'état partagé
+                    st.session_state.active_run = {"run_id": run_id, "started_at": time.time()}
                     status_placeholder.info(random.choice([
                         "Hop, je note...",
                         "Hm ?",
@@ -112,16 +154,42 @@ class LLMService:
                         tool_calls = event.data.required_action.submit_tool_outputs.tool_calls
                         tool_outputs = []
                         
+                        # Position dans la file d'attente des tâches ArcadiaAgents
+                        def report_queue(position, eta):
+                            status_placeholder.info(f"En file d'attente (position {position}, attente estimée ~{eta:.0f}s)...")
+                        
+                        # Schémas des fonctions du run, compilés une fois par processus
+                        validators = tool_validators(run_params.get("tools"))
+                        
                         # Traiter chaque outil appelé
-                        for tool_call in tool_calls:
+                        for index, tool_call in enumerate(tool_calls):
                             function_name = tool_call.function.name
-                            function_args = json.loads(tool_call.function.arguments)
                             
-                            status_placeholder.info("Recherche d'entreprises..." if function_name == "get_company_targets" else "Recherche de transactions...")
+                            # Arguments vérifiés et normalisés localement : une erreur est renvoyée
+                            # immédiatement à l'assistant, sans appel à ArcadiaAgents
+                            function_args, errors = validate_tool_arguments(function_name, tool_call.function.arguments, validators)
+                            if errors:
+                                status_placeholder.warning("Requête incomplète, correction en cours...")
+                                TOOL_CALLS.inc(function_name=function_name, outcome="invalid")
+                                tool_outputs.append({
+                                    "tool_call_id": tool_call.id,
+                                    "output": json.dumps({
+                                        "success": False,
+                                        "message": "Arguments invalides, corriger l'appel et réessayer",
+                                        "errors": errors[:20]
+                                    }, ensure_ascii=False)
+                                })
+                                continue
+                            
+                            if is_local_tool(function_name):
+                                status_placeholder.info("Analyse des résultats...")
+                            else:
+                                status_placeholder.info("Recherche d'entreprises..." if function_name == "get_company_targets" else "Recherche de transactions...")
                             
                             # Diriger vers l'API ArcadiaAgents
                             result = None
                             api_result = None
+                            tool_start = time.perf_counter()
                             
                             try:
                                 # Préparation du payload pour l'API ArcadiaAgents
@@ -129,11 +197,23 @@ class LLMService:
                                 payload = function_args    
                                 
                                 # Afficher les arguments de l'appel d'outil
-                                print(f"\nAppel de la fonction: {function_name}")
-                                print(f"Arguments: {json.dumps(function_args, indent=2)}")
+                                logger.info("Appel de la fonction: %s", function_name)
+                                # Les arguments ne sont formatés que si le niveau DEBUG est actif
+                                logger.debug("Arguments de %s: %s", function_name, function_args)
 
-                                # Appel à l'API via APITools
-                                api_result = api_tools.call_async_api(payload)
+                                if is_local_tool(function_name):
+                                    # Outil local : exécuté dans le processus sur les résultats de la session
+                                    api_result = run_local_tool(function_name, payload, session_tables(st.session_state))
+                                else:
+                                    # Appel à l'API via APITools
+                                    # Seul le premier appel du tour est prioritaire : les suivants forment un lot
+                                    api_result = api_tools.call_async_api(
+                                        payload,
+                                        username=st.session_state.get("username"),
+                                        interactive=index == 0,
+                                        on_queue=report_queue,
+                                        idempotency_key=idempotency_key(tool_call.id, payload)
+                                    )
                                                                  
                                 # Vérifier si l'appel a réussi
                                 if api_result.get("success", False):
@@ -146,33 +226,50 @@ class LLMService:
                                         st.session_state.pending_files = []
                                     
                                     # Stocker les fichiers en attente d'association avec le prochain message
-                                    for file_data in downloaded_files:
-                                        st.session_state.pending_files.append({
+                                    result_files = [
+                                        {
                                             "filename": file_data.get("filename", "file"),
                                             "type": file_data.get("type", "unknown"),
-                                            "content": file_data.get("content")
-                                        })
+                                            "content": file_data.get("content"),
+                                            "digest": content_digest(file_data.get("content") or b""),
+                                            "run_id": run_id
+                                        }
+                                        for file_data in downloaded_files
+                                    ]
+                                    st.session_state.pending_files.extend(result_files)
+                                    if not is_local_tool(function_name) and not api_result.get("derived"):
+                                        # Résultats retrouvables ensuite par toutes les sessions
+                                        index_results_async(result_files, function_name, st.session_state.get("username"))
+                                    # Conserver les fichiers dans l'état partagé avant la suite du run
+                                    save_session(st.session_state)
                                     
                                     # Informer l'utilisateur
-                                    if downloaded_files:
+                                    if api_result.get("derived"):
+                                        status_placeholder.success("Résultats repris d'une recherche précédente")
+                                    elif downloaded_files:
                                         status_placeholder.success(f"{len(downloaded_files)} fichier(s) de résultats récupéré(s)")
                                     
-                                    # Construire le résultat pour OpenAI
-                                    result = {
-                                        "success": True,
-                                        "message": "Traitement terminé avec succès",
-                                        "event_data": api_result.get("event_data", {}),
-                                        "files_info": [
-                                            {"filename": f.get("filename"), "type": f.get("type")} 
-                                            for f in downloaded_files
-                                        ]
-                                    }
+                                    if "output" in api_result:
+                                        # Outil local : résultat déjà construit pour l'assistant
+                                        result = api_result["output"]
+                                    else:
+                                        # Construire le résultat pour OpenAI : champs utiles et résumé des fichiers,
+                                        # les données complètes restent dans les fichiers de résultats
+                                        result = build_tool_output(
+                                            function_name,
+                                            success=True,
+                                            message="Traitement terminé avec succès",
+                                            event_data=api_result.get("event_data", {}),
+                                            files=result_files
+                                        )
                                 else:
                                     # Gestion de l'erreur
                                     error_msg = api_result.get("error", "Erreur inconnue")
                                     
                                     # Détection spécifique de l'erreur de délai dépassé
                                     if error_msg == "Délai d'attente dépassé":
+                                        TOOL_CALLS.inc(function_name=function_name, outcome="timeout")
+                                        TOOL_CALL_DURATION.observe(time.perf_counter() - tool_start, function_name=function_name)
                                         yield f"⚠️ Le temps d'attente maximal a été dépassé pour cette requête. Il y a sûrement eu une erreur. Veuillez réessayer."
                                         # Continuer sans ajouter ce résultat aux tool_outputs pour éviter un nouvel appel
                                         continue
@@ -190,6 +287,9 @@ class LLMService:
                                     "message": f"Erreur lors du traitement: {str(e)}"
                                 }
                             
+                            TOOL_CALLS.inc(function_name=function_name, outcome="success" if result["success"] else "error")
+                            TOOL_CALL_DURATION.observe(time.perf_counter() - tool_start, function_name=function_name)
+                            
                             # Ajouter le résultat au format attendu par submit_tool_outputs
                             tool_outputs.append({
                                 "tool_call_id": tool_call.id,
@@ -238,15 +338,14 @@ class LLMService:
                                     # Noter l'ID du message courant pour associer les fichiers
                                     current_message_id = message_id
                                     
-                                    # Si nous avons des fichiers en attente, les associer à ce nouveau message
-                                    if "pending_files" in st.session_state and st.session_state.pending_files:
-                                        print(f"Association de {len(st.session_state.pending_files)} fichiers en attente avec le message {message_id}")
-                                        # Transférer les fichiers en attente vers ce message
-                                        st.session_state.message_files[message_id].extend(st.session_state.pending_files)
-                                        # Vider la liste des fichiers en attente
-                                        st.session_state.pending_files = []
+                                    # Si nous avons des fichiers en attente issus de ce run, les associer à ce
+                                    # nouveau message (sous le verrou de la session dans l'état partagé)
+                                    if st.session_state.get("pending_files"):
+                                        associated = associate_pending_files(st.session_state, message_id, run_id)
+                                        logger.debug("Association de %d fichiers en attente avec le message %s", associated, message_id)
                                 
                                 elif event.event == "thread.run.completed":
+                                    run_state["status"] = "completed"
                                     # Si le message a été complètement streamé, continuer
                                     if message_being_created:
                                         status_placeholder.empty()
@@ -257,10 +356,11 @@ class LLMService:
                                     if current_message_id:
                                         # Afficher les fichiers associés au message à la fin
                                         if current_message_id in st.session_state.message_files and st.session_state.message_files[current_message_id]:
-                                            print(f"Fichiers à afficher pour le message {current_message_id}: {len(st.session_state.message_files[current_message_id])}")
+                                            logger.debug("Fichiers à afficher pour le message %s: %d", current_message_id, len(st.session_state.message_files[current_message_id]))
                                             # Ne pas afficher les fichiers ici, ils seront affichés une seule fois à la fi
                                 
                                 elif event.event == "thread.run.failed":
+                                    run_state["status"] = "failed"
                                     error_message = "Erreur dans le traitement"
                                     if hasattr(event.data, 'last_error'):
                                         error_message = f"Erreur: {event.data.last_error.message}"
@@ -287,6 +387,7 @@ class LLMService:
                                 yield chunk
                 
                 elif event.event == "thread.run.completed":
+                    run_state["status"] = "completed"
                     status_placeholder.empty()
                     # Forcer l'affichage des fichiers à la fin du streaming si possible
                     if current_message_id and current_message_id in st.session_state.message_files:
@@ -294,6 +395,7 @@ class LLMService:
                     break
                 
                 elif event.event == "thread.run.failed":
+                    run_state["status"] = "failed"
                     error_message = "Erreur dans le traitement"
                     if hasattr(event.data, 'last_error'):
                         error_message = f"Erreur: {event.data.last_error.message}"
@@ -362,19 +464,21 @@ class LLMService:
             # En cas d'erreur, renvoyer au moins le message système
             return [{"role": "system", "content": "Tu es un assistant de recherche spécialisé en M&A, qui va faire une recherche pour l'utilisateur..."}]
 
-    def _display_file(self, file_name, file_type, file_content):
+    def _display_file(self, file_name, file_type, file_content, digest=None, key_prefix=""):
         # Cette méthode ne sera plus appelée directement, mais depuis le fichier principal
         # qui affiche les messages, pour chaque message spécifique
-        if file_type == "image":
+        if file_type in TABULAR_TYPES and len(file_content) > settings.PREVIEW_LARGE_FILE_BYTES:
+            # Gros fichier : aperçu paginé côté serveur plutôt qu'un envoi intégral au navigateur
+            try:
+                self._display_large_table(file_name, file_type, file_content, digest, key_prefix)
+            except Exception as e:
+                st.error(f"Erreur lors de l'affichage du fichier {file_name}: {str(e)}")
+        elif file_type == "image":
             st.image(file_content)
         elif file_type == "csv":
             try:
-                # Utiliser pandas pour lire et afficher le CSV
-                import pandas as pd
-                import io
-                
-                # Créer un DataFrame à partir du contenu binaire
-                df = pd.read_csv(io.BytesIO(file_content))
+                # Table Arrow analysée une seule fois, hors du thread du script si nécessaire
+                df = load_table(file_content, file_type, digest)
                 
                 # Ajouter un espace pour séparer le message des données
                 st.write("")
@@ -394,12 +498,8 @@ class LLMService:
                 st.error(f"Erreur lors de l'affichage du CSV: {str(e)}")
         elif file_type == "excel":
             try:
-                # Utiliser pandas pour lire et afficher l'Excel
-                import pandas as pd
-                import io
-                
-                # Créer un DataFrame à partir du contenu binaire
-                df = pd.read_excel(io.BytesIO(file_content))
+                # Analyse dans le pool de processus : le GIL du serveur n'est pas monopolisé
+                df = load_table(file_content, file_type, digest)
                 
                 # Afficher le DataFrame
                 st.dataframe(df)
@@ -428,6 +528,83 @@ class LLMService:
                 file_name=file_name
             )
     
+    def _display_large_table(self, file_name, file_type, file_content, digest=None, key_prefix=""):
+        """
+        Affiche un gros fichier CSV/Excel par pages, avec tri et filtre appliqués côté serveur.
+        
+        Seule la première page est lue directement tant qu'aucun tri ni filtre n'est demandé ;
+        sinon le fichier est converti une seule fois en Arrow/Parquet puis re-découpé.
+        Le fichier complet reste téléchargeable.
+        """
+        digest = digest or content_digest(file_content)
+        key = f"preview_{key_prefix}_{digest[:16]}"
+        page_size = settings.PREVIEW_PAGE_SIZE
+        
+        st.write("")
+        with st.expander(f"Résultats de l'analyse ({file_name})", expanded=True):
+            search_col, sort_col, order_col = st.columns([2, 2, 1])
+            
+            def reset_page():
+                # Revenir à la première page quand le filtre ou le tri change
+                st.session_state[f"{key}_page"] = 1
+            
+            search = search_col.text_input("Filtrer", key=f"{key}_search", placeholder="Texte à rechercher...",
+                                           on_change=reset_page)
+            
+            # Les colonnes sont connues via la conversion, ou à défaut via l'échantillon de tête ;
+            # un Excel est toujours converti (dans le pool de processus) : en lire une fenêtre
+            # analyserait quand même tout le classeur sur le thread du script
+            table = load_table(file_content, file_type, digest) if is_converted(digest) or file_type == "excel" else None
+            columns = table.column_names if table is not None else list(read_window(file_content, file_type, 0, 1).columns)
+            sort_by = sort_col.selectbox("Trier par", [None] + columns, key=f"{key}_sort",
+                                         format_func=lambda c: "—" if c is None else c, on_change=reset_page)
+            descending = order_col.toggle("Décroissant", key=f"{key}_desc", on_change=reset_page)
+            page = st.session_state.get(f"{key}_page", 1) - 1
+            
+            if table is None and (search or sort_by or page > 0):
+                # Au-delà de la première page, une fenêtre lue dans le fichier en analyserait
+                # tout le début : le fichier est converti une fois pour toutes
+                table = load_table(file_content, file_type, digest)
+            
+            if table is not None:
+                result = query_page(table, digest, page, page_size, sort_by, descending, search,
+                                    settings.PREVIEW_MAX_RENDER_BYTES)
+                last_page = max(0, (result["total_rows"] - 1) // result["page_size"])
+                if page > last_page:
+                    # Le filtre a réduit le nombre de pages : revenir à la dernière
+                    page = last_page
+                    st.session_state[f"{key}_page"] = page + 1
+                    result = query_page(table, digest, page, page_size, sort_by, descending, search,
+                                        settings.PREVIEW_MAX_RENDER_BYTES)
+                rows, total_rows, page_size = result["rows"], result["total_rows"], result["page_size"]
+                page_count = max(1, -(-total_rows // page_size))
+                total_label = f"{total_rows} lignes"
+            else:
+                # Première page lue directement dans le fichier, sans conversion
+                rows = read_window(file_content, file_type, 0, page_size)
+                # Une fenêtre incomplète contient tout le fichier : pas de page suivante
+                page_count = 1 if len(rows) < page_size else None
+                if len(rows):
+                    # Même plafond d'octets par rendu que query_page
+                    row_bytes = max(1, int(rows.memory_usage(deep=True, index=False).sum()) // len(rows))
+                    rows = rows.head(max(1, settings.PREVIEW_MAX_RENDER_BYTES // row_bytes))
+                total_label = "aperçu"
+            
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            
+            nav_col, info_col = st.columns([1, 3])
+            nav_col.number_input("Page", min_value=1, max_value=page_count, step=1, key=f"{key}_page",
+                                 label_visibility="collapsed")
+            info_col.caption(f"Page {page + 1}{f' / {page_count}' if page_count else ''} — {total_label}")
+            
+            # Le fichier complet reste téléchargeable
+            st.download_button(
+                label=f"Télécharger {file_name}",
+                data=file_content,
+                file_name=file_name,
+                key=f"{key}_download"
+            )
+    
     def display_message_files(self, message_id):
         """
         Affiche les fichiers associés à un message spécifique.
@@ -438,9 +615,20 @@ class LLMService:
         if "message_files" not in st.session_state or message_id not in st.session_state.message_files:
             return
             
-        for file_data in st.session_state.message_files[message_id]:
+        for index, file_data in enumerate(st.session_state.message_files[message_id]):
+            if file_data.get("spilled") and file_data.get("content") is None:
+                # Contenu déchargé sur disque (budget mémoire de la session) : relu seulement à la
+                # demande, pour ne pas le replacer en mémoire (ni dans les médias) à chaque rerun
+                if not st.toggle(f"Afficher {file_data['filename']}", key=f"show_spilled_{message_id}_{index}",
+                                 help="Fichier déchargé de la mémoire de la session"):
+                    continue
+            file_content = load_file_content(file_data)
+            if file_content is None:
+                continue
             self._display_file(
                 file_data["filename"],
                 file_data["type"],
-                file_data["content"]
+                file_content,
+                digest=file_data.get("digest"),
+                key_prefix=message_id
             )
\ No newline at end of file
@@ -0,0 +1,524 @@
+import io
+import json
+import os
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from config import settings
+from services.result_tables import TABULAR_TYPES, resolve_column
+from services.results_index import get_results_index
+from services.session_memory import file_table
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("local_tools")
+
+
+class LocalToolError(Exception):
+    """Arguments invalides pour un outil local (message renvoyé tel quel à l'assistant)."""
+
+
+QUERY_RESULTS_SCHEMA = {
+    "name": "query_results",
+    "description": (
+        "Interroge un fichier de résultats déjà récupéré dans la conversation (filtrer, trier, "
+        "regrouper, agréger), sans relancer de recherche. À utiliser pour les questions de suivi "
+        "portant sur des résultats existants, par ex. « garder les cibles avec un CA > 50M » ou "
+        "« trier ces transactions par EV »."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "file": {
+                "type": "string",
+                "description": "Nom du fichier de résultats (par défaut, le plus récent)"
+            },
+            "filters": {
+                "type": "array",
+                "description": "Conditions combinées par ET",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "column": {"type": "string"},
+                        "op": {"type": "string", "enum": ["=", "!=", ">", ">=", "<", "<=", "contains", "in"]},
+                        "value": {"description": "Valeur comparée (liste pour 'in')"}
+                    },
+                    "required": ["column", "op", "value"]
+                }
+            },
+            "group_by": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Colonnes de regroupement"
+            },
+            "aggregations": {
+                "type": "array",
+                "description": "Agrégats calculés (par groupe si group_by), nommés <colonne>_<fonction>",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "column": {"type": "string"},
+                        "function": {
+                            "type": "string",
+                            "enum": ["sum", "mean", "min", "max", "median", "count", "count_distinct"]
+                        }
+                    },
+                    "required": ["function"]
+                }
+            },
+            "sort": {
+                "type": "array",
+                "description": "Tri, appliqué après regroupement (colonnes d'agrégats comprises)",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "column": {"type": "string"},
+                        "descending": {"type": "boolean"}
+                    },
+                    "required": ["column"]
+                }
+            },
+            "columns": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Colonnes à conserver (toutes par défaut)"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Nombre maximal de lignes renvoyées"
+            }
+        }
+    }
+}
+
+VALUATION_MULTIPLES_SCHEMA = {
+    "name": "valuation_multiples",
+    "description": (
+        "Calcule les multiples de valorisation (EV/EBITDA, EV/Revenue) d'un fichier de transactions "
+        "déjà récupéré : nombre, premier quartile, médiane, troisième quartile et moyenne, au global "
+        "et par secteur et/ou année. À utiliser plutôt que de calculer ces statistiques à partir "
+        "des lignes d'exemple."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "file": {
+                "type": "string",
+                "description": "Nom du fichier de résultats (par défaut, le plus récent)"
+            },
+            "filters": QUERY_RESULTS_SCHEMA["parameters"]["properties"]["filters"],
+            "group_by": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Colonnes de regroupement (par ex. sector) ; \"year\" est dérivé de la date de transaction"
+            },
+            "enterprise_value_column": {"type": "string", "description": "Colonne de valeur d'entreprise (détectée si absente)"},
+            "ebitda_column": {"type": "string", "description": "Colonne d'EBITDA (détectée si absente)"},
+            "revenue_column": {"type": "string", "description": "Colonne de chiffre d'affaires (détectée si absente)"},
+            "date_column": {"type": "string", "description": "Colonne de date de transaction (détectée si absente)"},
+            "max_multiple": {"type": "number", "description": "Multiple au-delà duquel une valeur est exclue comme aberrante"}
+        }
+    }
+}
+
+SEARCH_PAST_RESULTS_SCHEMA = {
+    "name": "search_past_results",
+    "description": (
+        "Recherche dans l'index local de tous les résultats d'entreprises et de transactions déjà "
+        "récupérés (toutes conversations et tous utilisateurs confondus), par ex. pour savoir si une "
+        "entreprise a déjà été vue. Réponse immédiate, sans relancer de recherche."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Texte libre recherché dans toutes les valeurs"},
+            "company": {"type": "string", "description": "Nom (ou début du nom) de l'entreprise"},
+            "sector": {"type": "string", "description": "Secteur"},
+            "country": {"type": "string", "description": "Pays"},
+            "date_from": {"type": "string", "description": "Date de transaction minimale (AAAA-MM-JJ)"},
+            "date_to": {"type": "string", "description": "Date de transaction maximale (AAAA-MM-JJ)"},
+            "limit": {"type": "integer", "description": "Nombre maximal de lignes renvoyées"}
+        }
+    }
+}
+
+# Fonctions d'agrégation Arrow correspondant aux fonctions exposées à l'assistant
+_AGGREGATE_FUNCTIONS = {
+    "sum": "sum",
+    "mean": "mean",
+    "min": "min",
+    "max": "max",
+    "median": "approximate_median",
+    "count": "count",
+    "count_distinct": "count_distinct",
+}
+
+_COMPARISONS = {
+    "=": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+}
+
+
+def session_tables(session_state):
+    """
+    Fichiers tabulaires disponibles dans la session, du plus ancien au plus récent.
+
+    Args:
+        session_state: st.session_state (ou tout objet similaire à un dictionnaire)
+
+    Returns:
+        OrderedDict: Nom de fichier -> fichier ({"filename", "type", "content", "digest"}) ;
+                     pour un nom en double, le fichier le plus récent l'emporte
+    """
+    tables = OrderedDict()
+    files = [f for message_files in session_state.get("message_files", {}).values() for f in message_files]
+    files += session_state.get("pending_files", [])
+    for file_data in files:
+        if file_data.get("type") in TABULAR_TYPES and (file_data.get("content") or file_data.get("spilled")):
+            name = file_data.get("filename", "file")
+            tables.pop(name, None)
+            tables[name] = file_data
+    return tables
+
+
+def _check_column(table, column):
+    if column not in table.column_names:
+        raise LocalToolError(f"Colonne inconnue '{column}' (colonnes disponibles: {', '.join(table.column_names)})")
+    return column
+
+
+def _typed_value(table, column, value):
+    """Valeur JSON convertie dans le type de la colonne."""
+    column_type = table.schema.field(column).type
+    try:
+        return pa.scalar(value).cast(column_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        raise LocalToolError(f"Valeur {value!r} incompatible avec la colonne '{column}' ({column_type})")
+
+
+def _filter_expression(table, condition):
+    column = _check_column(table, condition.get("column"))
+    op, value = condition.get("op"), condition.get("value")
+    field = pc.field(column)
+    if op == "contains":
+        if not pa.types.is_string(table.schema.field(column).type):
+            field = field.cast(pa.string())
+        return pc.match_substring(field, str(value), ignore_case=True)
+    if op == "in":
+        values = value if isinstance(value, list) else [value]
+        value_set = pa.array([_typed_value(table, column, v).as_py() for v in values], table.schema.field(column).type)
+        return pc.is_in(field, value_set=value_set)
+    if op not in _COMPARISONS:
+        raise LocalToolError(f"Opérateur inconnu '{op}'")
+    return _COMPARISONS[op](field, _typed_value(table, column, value))
+
+
+def run_query(table, filters=None, group_by=None, aggregations=None, sort=None, columns=None):
+    """
+    Exécute une requête (filtre, regroupement, agrégats, tri, projection) sur une table Arrow.
+
+    Args:
+        table (pyarrow.Table): Table interrogée
+        filters (list): Conditions {"column", "op", "value"}, combinées par ET
+        group_by (list): Colonnes de regroupement
+        aggregations (list): Agrégats {"column", "function"}
+        sort (list): Clés de tri {"column", "descending"}
+        columns (list): Colonnes à conserver
+
+    Returns:
+        pyarrow.Table: Le résultat de la requête
+
+    Raises:
+        LocalToolError: Si une colonne, un opérateur ou une valeur est invalide
+    """
+    if filters:
+        expression = None
+        for condition in filters:
+            condition_expression = _filter_expression(table, condition)
+            expression = condition_expression if expression is None else expression & condition_expression
+        table = table.filter(expression)
+
+    if group_by or aggregations:
+        keys = [_check_column(table, column) for column in group_by or []]
+        specs = []
+        for aggregation in aggregations or [{"function": "count"}]:
+            function = aggregation.get("function")
+            if function not in _AGGREGATE_FUNCTIONS:
+                raise LocalToolError(f"Fonction d'agrégation inconnue '{function}'")
+            column = aggregation.get("column")
+            if column is None and function == "count":
+                specs.append(([], "count_all"))
+            else:
+                specs.append((_check_column(table, column), _AGGREGATE_FUNCTIONS[function]))
+        table = table.group_by(keys).aggregate(specs)
+        # Noms stables pour l'assistant : <colonne>_<fonction> et "count" pour le nombre de lignes
+        names = [name.replace("_approximate_median", "_median") for name in table.column_names]
+        table = table.rename_columns(["count" if name == "count_all" else name for name in names])
+
+    if sort:
+        sort_keys = [
+            (_check_column(table, key.get("column")), "descending" if key.get("descending") else "ascending")
+            for key in sort
+        ]
+        table = table.sort_by(sort_keys)
+
+    if columns:
+        table = table.select([_check_column(table, column) for column in columns])
+    return table
+
+
+def _scalar(value):
+    if isinstance(value, float):
+        return float(f"{value:.6g}")
+    if value is not None and not isinstance(value, (int, str, bool)):
+        return str(value)
+    return value
+
+
+def _rows_within_budget(table, limit, max_bytes):
+    """Premières lignes du résultat, réduites si besoin pour respecter le budget en octets."""
+    rows = [{key: _scalar(value) for key, value in row.items()} for row in table.slice(0, limit).to_pylist()]
+    while rows and len(json.dumps(rows, ensure_ascii=False, default=str).encode()) > max_bytes:
+        rows = rows[:len(rows) // 2]
+    return rows
+
+
+def _result_file(source_name, table, suffix="requete"):
+    """Fichier CSV du résultat, affiché avec la réponse et interrogeable à son tour."""
+    buffer = io.BytesIO()
+    pa_csv.write_csv(table, buffer)
+    stem = os.path.splitext(source_name)[0]
+    return {"filename": f"{stem}_{suffix}.csv", "type": "csv", "content": buffer.getvalue()}
+
+
+def _rows_to_table(rows):
+    """
+    Table Arrow de lignes issues de fichiers différents : toutes les colonnes rencontrées
+    sont gardées, et les colonnes de types mixtes sont converties en texte.
+    """
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        try:
+            columns[name] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            columns[name] = pa.array([None if value is None else str(value) for value in values], pa.string())
+    return pa.table(columns)
+
+
+def _source_table(arguments, tables):
+    """Retourne (nom, table Arrow) du fichier désigné par l'argument file, le plus récent par défaut."""
+    if not tables:
+        raise LocalToolError("Aucun fichier de résultats disponible dans la conversation")
+    name = arguments.get("file") or next(reversed(tables))
+    if name not in tables:
+        raise LocalToolError(f"Fichier inconnu '{name}' (fichiers disponibles: {', '.join(tables)})")
+    file_data = tables[name]
+    return name, file_table(file_data)
+
+
+def query_results(arguments, tables):
+    """
+    Outil local query_results : interroge un fichier de résultats de la session.
+
+    Args:
+        arguments (dict): Arguments de l'appel d'outil (voir QUERY_RESULTS_SCHEMA)
+        tables (OrderedDict): Fichiers tabulaires de la session (voir session_tables)
+
+    Returns:
+        dict: "output" (résultat pour l'assistant) et "downloaded_files" (résultat en CSV)
+    """
+    name, source = _source_table(arguments, tables)
+    result = run_query(
+        source,
+        filters=arguments.get("filters"),
+        group_by=arguments.get("group_by"),
+        aggregations=arguments.get("aggregations"),
+        sort=arguments.get("sort"),
+        columns=arguments.get("columns"),
+    )
+
+    limit = min(int(arguments.get("limit") or settings.LOCAL_QUERY_MAX_ROWS), settings.LOCAL_QUERY_MAX_ROWS)
+    rows = _rows_within_budget(result, limit, settings.TOOL_OUTPUT_MAX_BYTES // 2)
+    output = {
+        "success": True,
+        "message": f"Requête exécutée sur {name}",
+        "file": name,
+        "source_rows": source.num_rows,
+        "total_rows": result.num_rows,
+        "columns": result.column_names,
+        "rows": rows,
+    }
+    if len(rows) < result.num_rows:
+        output["truncated"] = True
+
+    # Un CSV n'est produit que si la requête transforme le fichier source
+    transformed = any(arguments.get(key) for key in ("filters", "group_by", "aggregations", "sort", "columns"))
+    files = [_result_file(name, result)] if transformed and result.num_rows else []
+    return {"output": output, "downloaded_files": files}
+
+
+def valuation_multiples(arguments, tables):
+    """
+    Outil local valuation_multiples : statistiques de multiples d'un fichier de transactions.
+
+    Args:
+        arguments (dict): Arguments de l'appel d'outil (voir VALUATION_MULTIPLES_SCHEMA)
+        tables (OrderedDict): Fichiers tabulaires de la session (voir session_tables)
+
+    Returns:
+        dict: "output" (résumé pour l'assistant) et "downloaded_files" (statistiques en CSV)
+    """
+    # Import tardif : pandas n'est chargé qu'au premier calcul de multiples
+    from services.valuation import compute_multiples
+
+    name, source = _source_table(arguments, tables)
+    table = run_query(source, filters=arguments.get("filters"))
+
+    columns = {
+        role: resolve_column(table.column_names, role, arguments.get(f"{role}_column"))
+        for role in ("enterprise_value", "ebitda", "revenue", "date")
+    }
+    if columns["enterprise_value"] is None or (columns["ebitda"] is None and columns["revenue"] is None):
+        raise LocalToolError(
+            f"Colonnes de valeur d'entreprise et d'EBITDA ou de chiffre d'affaires introuvables dans {name} "
+            f"(colonnes disponibles: {', '.join(table.column_names)})"
+        )
+    group_by = arguments.get("group_by") or []
+    for key in group_by:
+        if key == "year":
+            if columns["date"] is None:
+                raise LocalToolError(f"Aucune colonne de date dans {name} pour regrouper par année")
+        else:
+            _check_column(table, key)
+
+    # Seules les colonnes utiles sont converties en DataFrame
+    needed = {column for column in columns.values() if column} | {key for key in group_by if key != "year"}
+    df = table.select([column for column in table.column_names if column in needed]).to_pandas()
+    stats = compute_multiples(df, columns, group_by=group_by, max_multiple=arguments.get("max_multiple"))
+
+    output = {
+        "success": True,
+        "message": f"Multiples calculés sur {name}",
+        "file": name,
+        "rows": table.num_rows,
+        "columns_used": {role: column for role, column in columns.items() if column},
+        "overall": {
+            multiple: {key: value if key == "count" else _scalar(float(value)) for key, value in values.items()}
+            for multiple, values in stats["overall"].items()
+        },
+        "excluded": stats["excluded"],
+    }
+
+    files = []
+    breakdown = stats["breakdown"]
+    if breakdown is not None:
+        breakdown_table = pa.Table.from_pandas(breakdown, preserve_index=False)
+        limit = settings.LOCAL_QUERY_MAX_ROWS
+        output["groups"] = breakdown_table.num_rows
+        output["breakdown"] = _rows_within_budget(breakdown_table, limit, settings.TOOL_OUTPUT_MAX_BYTES // 2)
+        if len(output["breakdown"]) < breakdown_table.num_rows:
+            output["truncated"] = True
+        files.append(_result_file(name, breakdown_table, suffix="multiples"))
+    else:
+        overall_rows = [{"multiple": multiple, **values} for multiple, values in output["overall"].items()]
+        files.append(_result_file(name, pa.Table.from_pylist(overall_rows), suffix="multiples"))
+    return {"output": output, "downloaded_files": files}
+
+
+def search_past_results(arguments, tables):
+    """
+    Outil local search_past_results : recherche dans l'index des résultats passés.
+
+    Args:
+        arguments (dict): Arguments de l'appel d'outil (voir SEARCH_PAST_RESULTS_SCHEMA)
+        tables (OrderedDict): Non utilisé (l'index couvre toutes les sessions)
+
+    Returns:
+        dict: "output" (lignes trouvées pour l'assistant) et "downloaded_files" (lignes en CSV)
+    """
+    criteria = {key: arguments.get(key) for key in ("query", "company", "sector", "country", "date_from", "date_to")}
+    if not any(criteria.values()):
+        raise LocalToolError("Au moins un critère de recherche est nécessaire")
+    matches = get_results_index().search(**criteria)
+
+    table = _rows_to_table([
+        {**match["data"], "source_file": match["filename"]} for match in matches
+    ]) if matches else None
+    limit = min(int(arguments.get("limit") or settings.LOCAL_QUERY_MAX_ROWS), settings.LOCAL_QUERY_MAX_ROWS)
+    rows = _rows_within_budget(table, limit, settings.TOOL_OUTPUT_MAX_BYTES // 2) if table is not None else []
+    output = {
+        "success": True,
+        "message": f"{len(matches)} ligne(s) trouvée(s) dans les résultats passés",
+        "total_rows": len(matches),
+        "rows": rows,
+    }
+    if len(rows) < len(matches):
+        output["truncated"] = True
+    if len(matches) >= settings.RESULTS_INDEX_MAX_MATCHES:
+        # D'autres lignes correspondent : préciser les critères pour les obtenir
+        output["more_matches"] = True
+
+    files = [_result_file("resultats_passes", table, suffix="recherche")] if table is not None else []
+    return {"output": output, "downloaded_files": files}
+
+
+# Outils exécutés dans le processus, sans appel à ArcadiaAgents :
+# nom -> (schéma, fonction, nécessite des fichiers de résultats dans la session)
+LOCAL_TOOLS = {
+    "query_results": (QUERY_RESULTS_SCHEMA, query_results, True),
+    "valuation_multiples": (VALUATION_MULTIPLES_SCHEMA, valuation_multiples, True),
+    "search_past_results": (SEARCH_PAST_RESULTS_SCHEMA, search_past_results, False),
+}
+
+
+def is_local_tool(function_name):
+    """Indique si un appel d'outil est exécuté localement."""
+    return function_name in LOCAL_TOOLS
+
+
+def local_tool_definitions(has_tables=True):
+    """
+    Définitions des outils locaux, au format attendu par le paramètre tools d'un run.
+
+    Args:
+        has_tables (bool): La session contient des fichiers de résultats tabulaires ; sinon
+            les outils qui portent sur ces fichiers ne sont pas proposés
+    """
+    return [
+        {"type": "function", "function": schema}
+        for schema, _, needs_tables in LOCAL_TOOLS.values()
+        if has_tables or not needs_tables
+    ]
+
+
+def run_local_tool(function_name, arguments, tables):
+    """
+    Exécute un outil local.
+
+    Args:
+        function_name (str): Nom de l'outil
+        arguments (dict): Arguments de l'appel d'outil
+        tables (OrderedDict): Fichiers tabulaires de la session (voir session_tables)
+
+    Returns:
+        dict: "success", "error" ou "output" (résultat pour l'assistant) et "downloaded_files"
+    """
+    _, handler, _ = LOCAL_TOOLS[function_name]
+    try:
+        result = handler(arguments, tables)
+        logger.info("Outil local %s exécuté (%d fichier(s) produit(s))", function_name, len(result["downloaded_files"]))
+        return {"success": True, **result}
+    except LocalToolError as e:
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        logger.error("Erreur lors de l'exécution de l'outil local %s: %s", function_name, e)
+        return {"success": False, "error": str(e)}
@@ -0,0 +1,74 @@
+"""
+Analyse des fichiers de résultats CSV/Excel en tables Arrow.
+
+Ce module est exécuté dans les processus du pool d'analyse (voir result_tables) : il ne
+doit importer ni streamlit ni config.settings, qui lit les secrets au chargement.
+"""
+import importlib.util
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# Lecteur Excel rapide (Rust), utilisé s'il est installé
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+
+
+def _dataframe_to_arrow(df):
+    """Convertit un DataFrame en table Arrow, en forçant en texte les colonnes de types mixtes."""
+    import pandas as pd
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].map(lambda value: None if pd.isna(value) else str(value))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def parse_table(file_content, file_type):
+    """
+    Analyse le contenu complet d'un fichier CSV/Excel en table Arrow.
+
+    Args:
+        file_content (bytes | pyarrow.Buffer): Le contenu binaire du fichier
+        file_type (str): "csv" ou "excel"
+
+    Returns:
+        pyarrow.Table: La table analysée
+    """
+    # Import tardif de pandas : chargé seulement pour les cas qu'Arrow ne couvre pas (Excel...)
+    if file_type == "csv":
+        try:
+            return pa_csv.read_csv(pa.BufferReader(file_content))
+        except pa.ArrowInvalid:
+            # Séparateur ou encodage non standard : laisser pandas deviner
+            import pandas as pd
+            return _dataframe_to_arrow(pd.read_csv(pa.BufferReader(file_content)))
+    if file_type == "excel":
+        import pandas as pd
+        source = io.BytesIO(file_content) if isinstance(file_content, bytes) else pa.BufferReader(file_content)
+        engine = "calamine" if HAS_CALAMINE else None
+        return _dataframe_to_arrow(pd.read_excel(source, engine=engine))
+    raise ValueError(f"Type de fichier non tabulaire: {file_type}")
+
+
+def parse_to_ipc(source_path, file_type, output_path):
+    """
+    Analyse un fichier (lu par projection mémoire, sans copie) et écrit la table au format
+    Arrow IPC, que l'appelant relit lui aussi par projection mémoire.
+
+    Args:
+        source_path (str): Chemin du fichier à analyser
+        file_type (str): "csv" ou "excel"
+        output_path (str): Chemin du fichier Arrow IPC à écrire
+
+    Returns:
+        int: Nombre de lignes de la table
+    """
+    with pa.memory_map(source_path) as source:
+        table = parse_table(source.read_buffer(), file_type)
+    with pa.OSFile(output_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return table.num_rows
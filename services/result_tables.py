@@ -0,0 +1,394 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from config import settings
+from services.file_store import FileStore
+from services.parse_worker import parse_table, parse_to_ipc
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("result_tables")
+
+TABULAR_TYPES = ("csv", "excel")
+
+
+def content_digest(file_content):
+    """Retourne l'empreinte SHA-256 du contenu d'un fichier de résultats."""
+    return hashlib.sha256(file_content).hexdigest()
+
+
+class _TableCache:
+    """Cache LRU des tables Arrow, borné en octets et adossé à des fichiers Parquet."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._tables = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+            return table
+
+    def put(self, key, table):
+        with self._lock:
+            if key in self._tables:
+                self._size -= self._tables.pop(key).nbytes
+            self._tables[key] = table
+            self._size += table.nbytes
+            # Évincer les tables les moins récemment utilisées (la dernière est toujours gardée)
+            while self._size > self.max_bytes and len(self._tables) > 1:
+                _, evicted = self._tables.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._tables
+
+    def nbytes(self, keys=None):
+        """Mémoire des tables gardées en cache (toutes, ou celles des clés données)."""
+        with self._lock:
+            if keys is None:
+                return self._size
+            return sum(table.nbytes for key, table in self._tables.items() if key in keys)
+
+
+_table_cache = _TableCache(settings.PREVIEW_CACHE_MAX_BYTES)
+_views = OrderedDict()
+_views_lock = threading.Lock()
+_MAX_VIEWS = 32
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parquet_path(digest):
+    return os.path.join(settings.DATA_DIR, "results", f"{digest}.parquet")
+
+
+def _parse_pool():
+    """Pool de processus d'analyse, créé au premier usage (voir parse_worker)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver : les processus ne sont pas dupliqués depuis le serveur multi-thread,
+            # et le module d'analyse (pyarrow, pandas) n'est chargé qu'une fois par le serveur
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if context.get_start_method() == "forkserver":
+                context.set_forkserver_preload(["services.parse_worker"])
+            _pool = ProcessPoolExecutor(max_workers=settings.PARSE_POOL_WORKERS, mp_context=context)
+        return _pool
+
+
+def _reset_parse_pool(pool):
+    """Arrête un pool dont une analyse a dépassé son délai ; le suivant sera recréé."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # Une tâche en cours ne peut pas être annulée : ses processus sont arrêtés
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_table_offloaded(file_content, file_type, digest=None):
+    """
+    Analyse un fichier CSV/Excel en table Arrow, hors du processus Streamlit si nécessaire.
+
+    Les fichiers Excel et les gros CSV sont analysés dans le pool de processus : le
+    contenu leur est transmis par projection mémoire du fichier du FileStore, et la table
+    revient au format Arrow IPC, relu lui aussi par projection mémoire (sans copie).
+
+    Args:
+        file_content (bytes): Le contenu binaire du fichier
+        file_type (str): "csv" ou "excel"
+        digest (str): Empreinte du contenu, calculée si absente
+
+    Returns:
+        pyarrow.Table: La table analysée
+
+    Raises:
+        ValueError: Si le fichier dépasse PARSE_MAX_BYTES
+        TimeoutError: Si l'analyse dépasse PARSE_TIMEOUT
+    """
+    if len(file_content) > settings.PARSE_MAX_BYTES:
+        raise ValueError(
+            f"Fichier trop volumineux pour être analysé ({len(file_content) / 1e6:.0f} Mo, "
+            f"maximum {settings.PARSE_MAX_BYTES / 1e6:.0f} Mo)"
+        )
+    if file_type == "csv" and len(file_content) < settings.PARSE_OFFLOAD_MIN_BYTES:
+        # Petit CSV : la lecture Arrow (qui libère le GIL) coûte moins que l'aller-retour
+        return parse_table(file_content, file_type)
+
+    digest = digest or content_digest(file_content)
+    files = FileStore(settings.FILES_DIR)
+    source_path = files.path(files.put(file_content, digest))
+    output_path = os.path.join(settings.DATA_DIR, "results", f"{digest}.{uuid.uuid4().hex}.arrow")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    start = time.perf_counter()
+    try:
+        # Un pool est arrêté en entier quand une analyse dépasse son délai (un processus ne peut
+        # pas être arrêté seul) : les analyses des autres sessions sont alors relancées une fois
+        for attempt in range(2):
+            pool = _parse_pool()
+            future = pool.submit(parse_to_ipc, source_path, file_type, output_path)
+            try:
+                future.result(timeout=settings.PARSE_TIMEOUT)
+                break
+            except FutureTimeout:
+                _reset_parse_pool(pool)
+                raise TimeoutError(f"Analyse du fichier interrompue après {settings.PARSE_TIMEOUT}s")
+            except BrokenProcessPool:
+                _reset_parse_pool(pool)
+                if attempt:
+                    raise
+                logger.warning("Pool d'analyse interrompu pendant l'analyse d'un fichier %s: nouvelle tentative", file_type)
+        # La projection reste valide après la suppression du fichier
+        table = pa.ipc.open_file(pa.memory_map(output_path)).read_all()
+    finally:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+    logger.info("Fichier %s analysé hors processus en %.2fs (%d lignes)", file_type, time.perf_counter() - start, table.num_rows)
+    return table
+
+
+def resolve_column(columns, role, explicit=None):
+    """
+    Retrouve la colonne jouant un rôle (valeur d'entreprise, secteur...) dans un fichier de résultats.
+
+    Args:
+        columns (list): Colonnes du fichier
+        role (str): Rôle recherché, clé de RESULT_COLUMN_CANDIDATES
+        explicit (str): Nom de colonne imposé par l'appelant
+
+    Returns:
+        str: Le nom de la colonne, ou None si aucune ne correspond
+    """
+    if explicit:
+        return explicit if explicit in columns else None
+    by_lower = {column.lower(): column for column in columns}
+    for candidate in settings.RESULT_COLUMN_CANDIDATES.get(role, [role]):
+        if candidate.lower() in by_lower:
+            return by_lower[candidate.lower()]
+    return None
+
+
+def cached_bytes(digests=None):
+    """
+    Mémoire des tables analysées gardées en cache : tables complètes et vues filtrées ou triées.
+
+    Args:
+        digests (set): Empreintes des fichiers à compter (par défaut, tous)
+
+    Returns:
+        dict: "tables" et "views", en octets
+    """
+    with _views_lock:
+        views = [(key[0], view) for key, view in _views.items()]
+    view_bytes = sum(
+        table.nbytes + (indices.nbytes if indices is not None else 0)
+        for digest, (table, indices) in views
+        if digests is None or digest in digests
+    )
+    return {"tables": _table_cache.nbytes(digests), "views": view_bytes}
+
+
+def _evict_conversions(keep_path):
+    """Supprime les conversions Parquet les moins récemment utilisées au-delà de PREVIEW_DISK_MAX_BYTES."""
+    directory = os.path.dirname(keep_path)
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(".parquet"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= settings.PREVIEW_DISK_MAX_BYTES:
+            break
+        if path == keep_path:
+            continue
+        try:
+            # Une table projetée en mémoire depuis ce fichier reste lisible après sa suppression
+            os.unlink(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def is_converted(digest):
+    """Indique si un fichier a déjà été converti (en mémoire ou en Parquet sur disque)."""
+    return digest in _table_cache or os.path.exists(_parquet_path(digest))
+
+
+def load_table(file_content, file_type, digest=None):
+    """
+    Retourne la table Arrow d'un fichier de résultats, en ne l'analysant qu'une seule fois.
+
+    La conversion est gardée en mémoire (cache LRU). Celle d'un fichier Excel ou d'un CSV
+    d'au moins PARSE_OFFLOAD_MIN_BYTES est aussi écrite en Parquet pour être relue
+    rapidement après éviction ; les conversions sur disque sont elles-mêmes bornées
+    (PREVIEW_DISK_MAX_BYTES, les moins récemment utilisées supprimées d'abord).
+
+    Args:
+        file_content (bytes): Le contenu binaire du fichier
+        file_type (str): "csv" ou "excel"
+        digest (str): Empreinte du contenu, calculée si absente
+
+    Returns:
+        pyarrow.Table: La table complète
+    """
+    digest = digest or content_digest(file_content)
+    table = _table_cache.get(digest)
+    if table is not None:
+        return table
+
+    path = _parquet_path(digest)
+    if os.path.exists(path):
+        table = pq.read_table(path, memory_map=True)
+        try:
+            # Date d'utilisation pour l'éviction des conversions
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        logger.info(f"Conversion en Arrow/Parquet d'un fichier {file_type} ({len(file_content)} octets)")
+        table = parse_table_offloaded(file_content, file_type, digest)
+        # Petit CSV : réanalysé plus vite qu'il n'est relu, gardé seulement en mémoire
+        if file_type != "csv" or len(file_content) >= settings.PARSE_OFFLOAD_MIN_BYTES:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, path)
+                _evict_conversions(path)
+            except Exception as e:
+                logger.warning(f"Impossible d'écrire la conversion Parquet {path}: {e}")
+
+    _table_cache.put(digest, table)
+    return table
+
+
+def read_window(file_content, file_type, start=0, nrows=None):
+    """
+    Lit uniquement une fenêtre de lignes d'un fichier, sans conversion complète.
+
+    Args:
+        file_content (bytes): Le contenu binaire du fichier
+        file_type (str): "csv" ou "excel"
+        start (int): Index de la première ligne de données à lire
+        nrows (int): Nombre de lignes à lire
+
+    Returns:
+        pandas.DataFrame: Les lignes demandées
+    """
+    import pandas as pd
+    nrows = nrows or settings.PREVIEW_PAGE_SIZE
+    # Conserver la ligne d'en-tête et sauter les lignes de données précédentes
+    skiprows = range(1, start + 1) if start else None
+    if file_type == "csv":
+        return pd.read_csv(io.BytesIO(file_content), skiprows=skiprows, nrows=nrows)
+    if file_type == "excel":
+        return pd.read_excel(io.BytesIO(file_content), skiprows=skiprows, nrows=nrows)
+    raise ValueError(f"Type de fichier non tabulaire: {file_type}")
+
+
+def _search_mask(table, search):
+    """Construit un masque des lignes dont une colonne contient le texte recherché."""
+    mask = None
+    for column in table.columns:
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            values = column
+        elif pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+            values = pc.cast(column, pa.string())
+        else:
+            continue
+        column_mask = pc.fill_null(pc.match_substring(values, search, ignore_case=True), False)
+        mask = column_mask if mask is None else pc.or_(mask, column_mask)
+    return mask
+
+
+def _get_view(digest, table, sort_by, descending, search):
+    """Retourne (table filtrée, indices de tri) en gardant les vues récentes en cache."""
+    key = (digest, sort_by, descending, search)
+    with _views_lock:
+        if key in _views:
+            _views.move_to_end(key)
+            return _views[key]
+
+    if search:
+        mask = _search_mask(table, search)
+        table = table.filter(mask) if mask is not None else table.slice(0, 0)
+    indices = None
+    if sort_by and sort_by in table.column_names:
+        order = "descending" if descending else "ascending"
+        indices = pc.sort_indices(table, sort_keys=[(sort_by, order)])
+
+    with _views_lock:
+        _views[key] = (table, indices)
+        while len(_views) > _MAX_VIEWS:
+            _views.popitem(last=False)
+    return table, indices
+
+
+def query_page(table, digest, page=0, page_size=None, sort_by=None, descending=False, search=None, max_bytes=None):
+    """
+    Retourne une page de résultats, après filtrage et tri appliqués côté serveur.
+
+    Args:
+        table (pyarrow.Table): La table complète (voir load_table)
+        digest (str): Empreinte du fichier, utilisée comme clé de cache des vues
+        page (int): Numéro de page (à partir de 0)
+        page_size (int): Nombre de lignes par page
+        sort_by (str): Colonne de tri
+        descending (bool): Tri décroissant
+        search (str): Texte à rechercher dans les colonnes texte et numériques
+        max_bytes (int): Nombre maximal d'octets de données renvoyés
+
+    Returns:
+        dict: "rows" (DataFrame de la page), "total_rows" (lignes après filtrage)
+              et "page_size" (taille de page effective, réduite pour respecter max_bytes)
+    """
+    page_size = page_size or settings.PREVIEW_PAGE_SIZE
+    max_bytes = max_bytes or settings.PREVIEW_MAX_RENDER_BYTES
+
+    view, indices = _get_view(digest, table, sort_by, descending, search or None)
+
+    # Plafonner les octets envoyés par rendu à partir de la taille moyenne d'une ligne
+    if view.num_rows:
+        row_bytes = max(1, view.nbytes // view.num_rows)
+        page_size = max(1, min(page_size, max_bytes // row_bytes))
+
+    start = page * page_size
+    if indices is not None:
+        page_table = view.take(indices.slice(start, page_size))
+    else:
+        page_table = view.slice(start, page_size)
+
+    return {
+        "rows": page_table.to_pandas(),
+        "total_rows": view.num_rows,
+        "page_size": page_size
+    }
@@ -0,0 +1,270 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from services.result_tables import TABULAR_TYPES, content_digest, load_table, resolve_column
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("results_index")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_files (
+    digest TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    function_name TEXT,
+    username TEXT,
+    rows INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS result_rows (
+    id INTEGER PRIMARY KEY,
+    row_hash TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL REFERENCES indexed_files (digest),
+    company_name TEXT,
+    company_key TEXT,
+    sector_key TEXT,
+    country_key TEXT,
+    deal_date TEXT,
+    data TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_result_rows_company ON result_rows (company_key);
+CREATE INDEX IF NOT EXISTS idx_result_rows_sector ON result_rows (sector_key, deal_date);
+CREATE INDEX IF NOT EXISTS idx_result_rows_country ON result_rows (country_key, deal_date);
+CREATE INDEX IF NOT EXISTS idx_result_rows_deal_date ON result_rows (deal_date);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS result_rows_fts USING fts5 (
+    text,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_key(value):
+    """Clé de recherche d'un texte : minuscules, sans accents ni espaces superflus."""
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split()) or None
+
+
+def _iso_date(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()[:10]
+    return str(value)[:10]
+
+
+def _fts_query(text):
+    """Requête FTS5 sûre : chaque mot est cité et recherché en préfixe, combinés par ET."""
+    tokens = _TOKEN_RE.findall(text or "")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class ResultsIndex:
+    """
+    Index local (SQLite, mode WAL) des lignes de tous les fichiers de résultats récupérés.
+
+    Index plein texte (FTS5) sur toutes les valeurs texte d'une ligne et index de champs
+    sur le nom d'entreprise, le secteur, le pays et la date de transaction. L'index est
+    maintenu de façon incrémentale : un fichier (par empreinte) et une ligne identique ne
+    sont indexés qu'une fois.
+
+    L'écriture et la lecture utilisent chacune leur connexion : grâce au mode WAL, une
+    recherche n'attend pas l'indexation d'un gros fichier, qui est validée par lots.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Connexion de lecture, ouverte après la création du schéma
+        self._read_lock = threading.Lock()
+        self._read_conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._read_conn.row_factory = sqlite3.Row
+        self._read_conn.execute("PRAGMA query_only = ON")
+
+    def _read(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def is_indexed(self, digest):
+        return bool(self._read("SELECT 1 FROM indexed_files WHERE digest = ?", (digest,)))
+
+    def index_file(self, file_data, function_name=None, username=None):
+        """
+        Ajoute à l'index les lignes d'un fichier de résultats tabulaire.
+
+        Args:
+            file_data (dict): Le fichier ({"filename", "type", "content", "digest"})
+            function_name (str): La fonction qui a produit le fichier
+            username (str): L'utilisateur qui a lancé la recherche
+
+        Returns:
+            int: Nombre de nouvelles lignes indexées (0 si le fichier l'était déjà)
+        """
+        content = file_data.get("content")
+        if file_data.get("type") not in TABULAR_TYPES or not content:
+            return 0
+        digest = file_data.get("digest") or content_digest(content)
+        if self.is_indexed(digest):
+            return 0
+
+        table = load_table(content, file_data["type"], digest)
+        columns = {role: resolve_column(table.column_names, role) for role in ("company_name", "sector", "country", "date")}
+        text_columns = [
+            name for name, column_type in zip(table.column_names, table.schema.types)
+            if str(column_type) in ("string", "large_string")
+        ]
+
+        now = time.time()
+        added = 0
+        # Une transaction par lot : le verrou d'écriture est relâché entre deux lots. Le fichier
+        # n'est marqué indexé qu'avec le dernier lot : une indexation interrompue sera reprise
+        for batch in table.to_batches(max_chunksize=settings.RESULTS_INDEX_BATCH_ROWS):
+            with self._lock, self._conn:
+                added += self._index_rows(batch.to_pylist(), digest, columns, text_columns, now)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO indexed_files (digest, filename, function_name, username, rows, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, file_data.get("filename", "file"), function_name, username, table.num_rows, now)
+            )
+        logger.info("Index des résultats: %d nouvelle(s) ligne(s) depuis %s", added, file_data.get("filename"))
+        return added
+
+    def _index_rows(self, rows, digest, columns, text_columns, now):
+        """Insère un lot de lignes (sous le verrou d'écriture, dans une transaction) ; retourne le nombre de nouvelles lignes."""
+        added = 0
+        for row in rows:
+            data = json.dumps(row, ensure_ascii=False, default=str, sort_keys=True)
+            row_hash = hashlib.sha1(data.encode()).hexdigest()
+            company = row.get(columns["company_name"]) if columns["company_name"] else None
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO result_rows (row_hash, digest, company_name, company_key, sector_key, "
+                "country_key, deal_date, data, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    row_hash, digest, company, normalize_key(company),
+                    normalize_key(row.get(columns["sector"])) if columns["sector"] else None,
+                    normalize_key(row.get(columns["country"])) if columns["country"] else None,
+                    _iso_date(row.get(columns["date"])) if columns["date"] else None,
+                    data, now, now
+                )
+            )
+            if cursor.rowcount:
+                text = " ".join(str(row[name]) for name in text_columns if row.get(name) is not None)
+                self._conn.execute("INSERT INTO result_rows_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+                added += 1
+            else:
+                self._conn.execute("UPDATE result_rows SET last_seen = ? WHERE row_hash = ?", (now, row_hash))
+        return added
+
+    def search(self, query=None, company=None, sector=None, country=None, date_from=None, date_to=None, limit=None):
+        """
+        Recherche des lignes de résultats passées.
+
+        Args:
+            query (str): Texte libre (mots recherchés en préfixe dans toutes les valeurs texte)
+            company (str): Nom d'entreprise (début du nom, sans tenir compte de la casse ni des accents)
+            sector (str): Secteur (valeur exacte, normalisée)
+            country (str): Pays (valeur exacte, normalisée)
+            date_from (str): Date de transaction minimale (AAAA-MM-JJ)
+            date_to (str): Date de transaction maximale (AAAA-MM-JJ)
+            limit (int): Nombre maximal de lignes
+
+        Returns:
+            list: Lignes trouvées, les plus récemment vues d'abord ({"data", "filename",
+                  "function_name", "first_seen", "last_seen"})
+        """
+        limit = min(int(limit or settings.RESULTS_INDEX_MAX_MATCHES), settings.RESULTS_INDEX_MAX_MATCHES)
+        clauses, params = [], []
+        fts_query = _fts_query(query)
+        if fts_query:
+            clauses.append("r.id IN (SELECT rowid FROM result_rows_fts WHERE result_rows_fts MATCH ?)")
+            params.append(fts_query)
+        company_key = normalize_key(company)
+        if company_key:
+            # Plage de préfixe : utilise l'index sur company_key
+            clauses.append("r.company_key >= ? AND r.company_key < ?")
+            params += [company_key, company_key + "\uffff"]
+        for column, value in (("sector_key", sector), ("country_key", country)):
+            if normalize_key(value):
+                clauses.append(f"r.{column} = ?")
+                params.append(normalize_key(value))
+        if date_from:
+            clauses.append("r.deal_date >= ?")
+            params.append(str(date_from))
+        if date_to:
+            clauses.append("r.deal_date <= ?")
+            params.append(str(date_to))
+
+        sql = (
+            "SELECT r.data, r.first_seen, r.last_seen, f.filename, f.function_name "
+            "FROM result_rows r JOIN indexed_files f ON f.digest = r.digest"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY r.last_seen DESC, r.id LIMIT ?"
+        params.append(limit)
+
+        rows = self._read(sql, params)
+        return [
+            {
+                "data": json.loads(row["data"]),
+                "filename": row["filename"],
+                "function_name": row["function_name"],
+                "first_seen": row["first_seen"],
+                "last_seen": row["last_seen"],
+            }
+            for row in rows
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+# Indexation hors du thread du script Streamlit ; un seul écrivain
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="results-index")
+
+
+def get_results_index():
+    """Retourne l'index des résultats partagé par le processus."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ResultsIndex(settings.RESULTS_INDEX_DB_PATH)
+    return _index
+
+
+def _index_files(files, function_name, username):
+    for file_data in files:
+        try:
+            get_results_index().index_file(file_data, function_name, username)
+        except Exception as e:
+            logger.warning("Indexation impossible de %s: %s", file_data.get("filename"), e)
+
+
+def index_results_async(files, function_name=None, username=None):
+    """Indexe en arrière-plan les fichiers de résultats d'une tâche terminée."""
+    files = [f for f in files if f.get("type") in TABULAR_TYPES and f.get("content")]
+    if files:
+        _executor.submit(_index_files, files, function_name, username)
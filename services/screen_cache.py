@@ -0,0 +1,331 @@
+import datetime
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from config import settings
+from services.file_store import FileStore
+from services.local_tools import LocalToolError, run_query
+from services.result_tables import TABULAR_TYPES, content_digest, resolve_column
+from services.results_index import normalize_key
+from services.session_memory import file_content, file_table
+from utils.logger import setup_logger
+from utils.metrics import SCREEN_CACHE_LOOKUPS
+
+# Configuration du logging
+logger = setup_logger("screen_cache")
+
+# Suffixes des bornes de plage dans les données d'un payload : clé -> (base, indice de la borne)
+_RANGE_SUFFIXES = {"_min": 0, "_from": 0, "_max": 1, "_to": 1}
+
+# Clés qui tronquent le résultat côté serveur : un tel résultat n'est réutilisé qu'à l'identique
+_TRUNCATING_KEYS = {"limit", "max_results", "top_n", "page", "page_size", "offset"}
+
+
+def _canonical(value):
+    """Valeur comparable d'une contrainte (texte normalisé, listes sans ordre)."""
+    if isinstance(value, str):
+        return normalize_key(value)
+    if isinstance(value, list):
+        return json.dumps(sorted(json.dumps(_canonical(item), sort_keys=True) for item in value))
+    if isinstance(value, dict):
+        return json.dumps({key: _canonical(item) for key, item in value.items()}, sort_keys=True)
+    return value
+
+
+def _constraints(data):
+    """
+    Sépare les données d'un payload en bornes de plage et en contraintes exactes.
+
+    Returns:
+        tuple: (base -> [borne basse, borne haute], clé -> valeur canonique)
+    """
+    ranges, exact = {}, {}
+    for key, value in (data or {}).items():
+        if value is None:
+            continue
+        base, bound = key, None
+        for suffix, index in _RANGE_SUFFIXES.items():
+            if key.endswith(suffix) and len(key) > len(suffix):
+                base, bound = key[:-len(suffix)], index
+                break
+        if bound is not None and isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            ranges.setdefault(base, [None, None])[bound] = value
+        else:
+            exact[key] = _canonical(value)
+    return ranges, exact
+
+
+def _comparable(bound):
+    """
+    Borne de plage convertie en nombre, ou à défaut en date ISO.
+
+    Le schéma des outils n'impose pas toujours le type des bornes : "10" et "5" doivent être
+    comparés comme des nombres, et non comme du texte.
+
+    Raises:
+        ValueError: Si la borne n'est ni un nombre ni une date ISO
+    """
+    if bound is None:
+        return None
+    try:
+        return _typed(bound, 0.0)
+    except (TypeError, ValueError):
+        return _typed(bound, datetime.datetime.min)
+
+
+def _within(inner, outer):
+    """Indique si la plage inner est contenue dans la plage outer (None : non bornée)."""
+    for index, compare in ((0, lambda a, b: a >= b), (1, lambda a, b: a <= b)):
+        if outer[index] is None:
+            continue
+        if inner[index] is None:
+            return False
+        try:
+            if not compare(inner[index], outer[index]):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def narrowed_ranges(data, cached_data):
+    """
+    Compare les données d'un payload à celles d'une recherche précédente.
+
+    Args:
+        data (dict): Données du nouveau payload
+        cached_data (dict): Données de la recherche précédente
+
+    Returns:
+        dict: Bases de plage resserrées -> nouvelle plage ({} si les recherches sont
+              équivalentes), ou None si le nouveau résultat ne peut pas être dérivé du précédent
+    """
+    ranges, exact = _constraints(data)
+    cached_ranges, cached_exact = _constraints(cached_data)
+    # Les contraintes non numériques (secteur, pays...) doivent être identiques : leur
+    # interprétation côté serveur (synonymes, sous-secteurs) n'est pas reproductible localement
+    if exact != cached_exact:
+        return None
+    # Une plage absente de la recherche précédente ne peut pas être vérifiée sur ses résultats
+    if set(ranges) != set(cached_ranges):
+        return None
+    narrowed = {}
+    for base, bounds in ranges.items():
+        # Une borne ni numérique ni date ne peut pas être comparée : pas de dérivation
+        try:
+            inner = [_comparable(bound) for bound in bounds]
+            outer = [_comparable(bound) for bound in cached_ranges[base]]
+        except (TypeError, ValueError):
+            return None
+        if not _within(inner, outer):
+            return None
+        if inner != outer:
+            # Une plage numérique ouverte ne permet pas de vérifier l'unité de la colonne
+            # (revenue_min=10 en millions est respecté par une colonne en euros)
+            if None in outer and not any(isinstance(bound, datetime.datetime) for bound in outer):
+                return None
+            narrowed[base] = bounds
+    if narrowed and _TRUNCATING_KEYS & set(cached_data or {}):
+        return None
+    return narrowed
+
+
+def _satisfies(table, column, bounds):
+    """Vérifie que toutes les valeurs d'une colonne respectent une plage (mêmes unités)."""
+    values = table.column(column)
+    if values.null_count == len(values):
+        return True
+    extremes = pc.min_max(values).as_py()
+    try:
+        if bounds[0] is not None and extremes["min"] < _typed(bounds[0], extremes["min"]):
+            return False
+        if bounds[1] is not None and extremes["max"] > _typed(bounds[1], extremes["max"]):
+            return False
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _typed(bound, sample):
+    """Borne convertie dans le type des valeurs de la colonne (nombre ou date ISO)."""
+    if isinstance(sample, (int, float)):
+        return float(bound)
+    if isinstance(sample, datetime.datetime):
+        return datetime.datetime.fromisoformat(str(bound))
+    if isinstance(sample, datetime.date):
+        return datetime.date.fromisoformat(str(bound)[:10])
+    return str(bound)
+
+
+def payload_key(payload):
+    """Clé canonique d'un payload : identique pour deux recherches équivalentes."""
+    ranges, exact = _constraints(payload.get("data"))
+    return json.dumps([payload.get("event_type"), ranges, exact], sort_keys=True, default=str)
+
+
+class ScreenCache:
+    """
+    Résultats des recherches ArcadiaAgents terminées, réutilisés pour les recherches
+    équivalentes ou plus restrictives.
+
+    Une recherche identique (aux différences de casse et d'ordre près) réutilise le
+    résultat tel quel. Une recherche qui ne fait que resserrer des plages numériques ou de
+    dates (par ex. revenue_min/revenue_max) est dérivée en filtrant localement le résultat
+    précédent, si celui-ci respecte bien ses propres plages. Les unités ne sont vérifiées
+    que par ce contrôle : une plage numérique précédente doit donc être bornée des deux
+    côtés, et une colonne dans une autre unité dont les valeurs restent entre les deux
+    bornes n'est pas détectée.
+    Les contenus sont gardés dans le FileStore ; les entrées expirent après SCREEN_CACHE_MAX_AGE.
+    """
+
+    def __init__(self, files_dir, max_entries=None, max_age=None):
+        self.files = FileStore(files_dir)
+        self.max_entries = max_entries or settings.SCREEN_CACHE_MAX_ENTRIES
+        self.max_age = settings.SCREEN_CACHE_MAX_AGE if max_age is None else max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(payload):
+        return isinstance(payload, dict) and payload.get("event_type") in settings.SCREEN_CACHE_EVENT_TYPES
+
+    def store(self, payload, result):
+        """
+        Conserve le résultat d'une tâche terminée.
+
+        Args:
+            payload (dict): Le payload soumis ({"event_type", "data"})
+            result (dict): Le résultat de call_async_api ("event_data", "downloaded_files")
+        """
+        if not self.is_cacheable(payload) or not result.get("success") or result.get("derived"):
+            return
+        files = []
+        for file_data in result.get("downloaded_files", []):
+            content = file_data.get("content")
+            if content is None:
+                return
+            digest = self.files.put(content, content_digest(content))
+            files.append({"filename": file_data.get("filename", "file"), "type": file_data.get("type"), "digest": digest})
+        entry = {
+            "payload": payload,
+            "event_data": result.get("event_data", {}),
+            "files": files,
+            "completed_at": time.time(),
+        }
+        key = payload_key(payload)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def age(self, payload):
+        """Âge (secondes) du résultat conservé pour ce payload exact, ou None."""
+        with self._lock:
+            entry = self._entries.get(payload_key(payload))
+        return None if entry is None else time.time() - entry["completed_at"]
+
+    def _fresh_entries(self, event_type):
+        """Entrées non expirées du type d'événement, de la plus récente à la plus ancienne."""
+        limit = time.time() - self.max_age
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry["completed_at"] < limit]:
+                del self._entries[key]
+            return [entry for entry in reversed(self._entries.values()) if entry["payload"].get("event_type") == event_type]
+
+    def _derive(self, entry, narrowed):
+        """Filtre localement les fichiers d'une entrée ; None si une plage n'est pas vérifiable."""
+        cached_ranges, _ = _constraints(entry["payload"].get("data"))
+        files = []
+        for file_data in entry["files"]:
+            if file_data["type"] not in TABULAR_TYPES:
+                return None
+            table = file_table(file_data)
+            filters = []
+            for base, bounds in narrowed.items():
+                column = resolve_column(table.column_names, base)
+                if column is None or not _satisfies(table, column, cached_ranges[base]):
+                    logger.debug("Plage %s non vérifiable sur %s", base, file_data["filename"])
+                    return None
+                if bounds[0] is not None:
+                    filters.append({"column": column, "op": ">=", "value": bounds[0]})
+                if bounds[1] is not None:
+                    filters.append({"column": column, "op": "<=", "value": bounds[1]})
+            try:
+                derived = run_query(table, filters)
+            except LocalToolError as e:
+                logger.debug("Dérivation impossible depuis %s: %s", file_data["filename"], e)
+                return None
+            buffer = io.BytesIO()
+            pa_csv.write_csv(derived, buffer)
+            stem = os.path.splitext(file_data["filename"])[0]
+            files.append({"filename": f"{stem}_derive.csv", "type": "csv", "content": buffer.getvalue()})
+        return files
+
+    def lookup(self, payload):
+        """
+        Cherche un résultat réutilisable pour un payload.
+
+        Args:
+            payload (dict): Le payload à soumettre ({"event_type", "data"})
+
+        Returns:
+            dict: Résultat au format de call_async_api, marqué "derived" (avec "derived_from"
+                  et "age_seconds" dans event_data), ou None s'il faut lancer la tâche
+        """
+        if not self.is_cacheable(payload):
+            return None
+        for entry in self._fresh_entries(payload.get("event_type")):
+            narrowed = narrowed_ranges(payload.get("data"), entry["payload"].get("data"))
+            if narrowed is None:
+                continue
+            try:
+                if narrowed:
+                    files = self._derive(entry, narrowed)
+                else:
+                    files = [{**f, "content": file_content(f)} for f in entry["files"]]
+                    files = None if any(f["content"] is None for f in files) else files
+            except Exception as e:
+                logger.warning("Réutilisation impossible d'une recherche précédente: %s", e)
+                files = None
+            if files is None:
+                continue
+
+            age = time.time() - entry["completed_at"]
+            source_id = entry["event_data"].get("event_id")
+            kind = "derived" if narrowed else "exact"
+            SCREEN_CACHE_LOOKUPS.inc(outcome=kind)
+            if narrowed:
+                message = (f"Résultat dérivé localement de la recherche {source_id} (il y a {age / 60:.0f} min), "
+                           f"en resserrant {', '.join(narrowed)}")
+                event_data = {"status": "completed", "query": payload.get("data")}
+            else:
+                message = f"Résultat d'une recherche identique {source_id} (il y a {age / 60:.0f} min)"
+                event_data = dict(entry["event_data"])
+            event_data.update(message=message, derived=True, derived_from=source_id, age_seconds=round(age))
+            logger.info("%s pour %s", message, payload.get("event_type"))
+            return {"success": True, "derived": True, "event_data": event_data, "downloaded_files": files}
+
+        SCREEN_CACHE_LOOKUPS.inc(outcome="miss")
+        return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_screen_cache():
+    """Retourne le cache des recherches partagé par le processus."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ScreenCache(settings.FILES_DIR)
+    return _cache
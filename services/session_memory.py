@@ -0,0 +1,203 @@
+import os
+import resource
+import threading
+import time
+
+from config import settings
+from services.file_store import FileStore
+from services.result_tables import cached_bytes, content_digest, is_converted, load_table
+from utils.logger import setup_logger
+from utils.metrics import (PROCESS_MEMORY_BYTES, SESSION_IDLE_TIMEOUT, SESSION_MEMORY_BYTES,
+                           SESSION_SPILLED_BYTES)
+
+# Configuration du logging
+logger = setup_logger("session_memory")
+
+# Catégories de l'empreinte mémoire d'une session
+CATEGORIES = ("messages", "message_files", "pending_files", "tables")
+
+# Dernière empreinte mesurée de chaque session : clé -> (instant, empreinte)
+_footprints = {}
+_footprints_lock = threading.Lock()
+
+
+def _files():
+    return FileStore(settings.FILES_DIR)
+
+
+def file_content(file_data):
+    """
+    Contenu d'un fichier de résultats, relu depuis le disque s'il a été déchargé.
+
+    Args:
+        file_data (dict): Le fichier ({"filename", "type", "content" et/ou "digest"})
+
+    Returns:
+        bytes: Le contenu, ou None s'il est introuvable
+    """
+    content = file_data.get("content")
+    if content is not None or not file_data.get("digest"):
+        return content
+    try:
+        return _files().get(file_data["digest"])
+    except OSError as e:
+        logger.warning("Contenu déchargé introuvable pour %s: %s", file_data.get("filename"), e)
+        return None
+
+
+def file_table(file_data):
+    """Table Arrow d'un fichier tabulaire ; un contenu déchargé n'est relu que s'il n'a jamais été converti."""
+    content = file_data.get("content")
+    digest = file_data.get("digest")
+    if content is None and not (digest and is_converted(digest)):
+        content = file_content(file_data)
+    return load_table(content, file_data["type"], digest)
+
+
+def _spill(file_data, files):
+    """Écrit le contenu d'un fichier dans le FileStore et le retire de la session."""
+    content = file_data["content"]
+    digest = files.put(content, file_data.get("digest") or content_digest(content))
+    file_data["digest"] = digest
+    file_data["spilled"] = True
+    del file_data["content"]
+    return len(content)
+
+
+def _payload_bytes(files):
+    return sum(len(f["content"]) for f in files if f.get("content") is not None)
+
+
+def measure_session(session_state):
+    """
+    Mesure la mémoire tenue par une session, par catégorie.
+
+    Les tables analysées sont partagées entre les sessions qui affichent le même fichier :
+    elles sont comptées pour chacune d'elles.
+
+    Args:
+        session_state: st.session_state (ou tout objet similaire à un dictionnaire)
+
+    Returns:
+        dict: Octets par catégorie (voir CATEGORIES), "total", ainsi que "spilled_files"
+              et "spilled_bytes" (contenus déchargés sur disque)
+    """
+    message_files = [f for files in session_state.get("message_files", {}).values() for f in files]
+    pending_files = session_state.get("pending_files", [])
+    digests = {f["digest"] for f in message_files + pending_files if f.get("digest")}
+    tables = cached_bytes(digests)
+    spilled = [f for f in message_files if f.get("spilled")]
+    spilled_bytes = 0
+    for file_data in spilled:
+        try:
+            spilled_bytes += os.path.getsize(_files().path(file_data["digest"]))
+        except OSError:
+            pass
+
+    footprint = {
+        "messages": sum(len((m.get("content") or "").encode()) for m in session_state.get("messages", [])),
+        "message_files": _payload_bytes(message_files),
+        "pending_files": _payload_bytes(pending_files),
+        "tables": tables["tables"] + tables["views"],
+    }
+    footprint["total"] = sum(footprint[category] for category in CATEGORIES)
+    footprint["spilled_files"] = len(spilled)
+    footprint["spilled_bytes"] = spilled_bytes
+    return footprint
+
+
+def _rss_bytes():
+    """Mémoire résidente du processus (pic d'utilisation si /proc n'est pas disponible)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss est en kilo-octets sous Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_process():
+    """
+    Mesure la mémoire du processus : résidente, caches de tables et sessions actives.
+
+    Returns:
+        dict: "rss", "table_cache", "view_cache", "sessions" (nombre de sessions actives)
+              et "session_<catégorie>" (somme des dernières empreintes des sessions actives)
+    """
+    now = time.monotonic()
+    with _footprints_lock:
+        for key in [k for k, (seen, _) in _footprints.items() if now - seen > SESSION_IDLE_TIMEOUT]:
+            del _footprints[key]
+        footprints = [footprint for _, footprint in _footprints.values()]
+
+    caches = cached_bytes()
+    process = {
+        "rss": _rss_bytes(),
+        "table_cache": caches["tables"],
+        "view_cache": caches["views"],
+        "sessions": len(footprints),
+    }
+    for category in CATEGORIES:
+        process[f"session_{category}"] = sum(footprint[category] for footprint in footprints)
+
+    for category in CATEGORIES:
+        SESSION_MEMORY_BYTES.set(process[f"session_{category}"], category=category)
+    for category in ("rss", "table_cache", "view_cache"):
+        PROCESS_MEMORY_BYTES.set(process[category], category=category)
+    return process
+
+
+def enforce_memory_budget(session_state, session_key=None, budget=None):
+    """
+    Mesure la session et, au-delà du budget, décharge sur disque les contenus de fichiers
+    des messages les plus anciens.
+
+    Les fichiers déchargés gardent leur empreinte et sont relus à la demande (voir
+    file_content). Les fichiers en attente et ceux des SESSION_MEMORY_KEEP_LATEST derniers
+    messages restent en mémoire.
+
+    Args:
+        session_state: st.session_state (ou tout objet similaire à un dictionnaire)
+        session_key (str): Identifiant de la session Streamlit (un par onglet) pour la
+            mesure du processus ; sans identifiant, la session n'y est pas comptée
+        budget (int): Budget en octets (par défaut SESSION_MEMORY_BUDGET)
+
+    Returns:
+        dict: "footprint" (voir measure_session), "spilled" (fichiers déchargés) et "freed" (octets)
+    """
+    budget = settings.SESSION_MEMORY_BUDGET if budget is None else budget
+    footprint = measure_session(session_state)
+    spilled, freed = 0, 0
+
+    # Les tables analysées sont gérées par leur propre cache : seuls les contenus sont déchargés
+    excess = footprint["total"] - footprint["tables"] - budget
+    if excess > 0:
+        message_ids = list(session_state.get("message_files", {}))
+        keep = max(0, settings.SESSION_MEMORY_KEEP_LATEST)
+        candidates = message_ids[:len(message_ids) - keep] if keep else message_ids
+        files = _files()
+        for message_id in candidates:
+            for file_data in session_state["message_files"][message_id]:
+                if freed >= excess:
+                    break
+                if file_data.get("content") is None:
+                    continue
+                try:
+                    freed += _spill(file_data, files)
+                    spilled += 1
+                except OSError as e:
+                    logger.warning("Déchargement impossible de %s: %s", file_data.get("filename"), e)
+            if freed >= excess:
+                break
+
+    if spilled:
+        SESSION_SPILLED_BYTES.inc(freed)
+        logger.info("Budget mémoire de session dépassé de %d octets: %d fichier(s) déchargé(s) (%d octets)",
+                    excess, spilled, freed)
+        footprint = measure_session(session_state)
+
+    if session_key:
+        with _footprints_lock:
+            _footprints[session_key] = (time.monotonic(), footprint)
+        measure_process()
+    return {"footprint": footprint, "spilled": spilled, "freed": freed}
@@ -0,0 +1,194 @@
+import threading
+import time
+
+from config import settings
+from services.file_store import FileStore
+from services.result_tables import content_digest
+from services.session_memory import file_content
+from services.state_backend import get_state_backend
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("session_sync")
+
+# Les contenus vivent _BLOB_TTL_MARGIN secondes de plus que les états qui les référencent :
+# leur durée de vie n'est prolongée qu'une fois par marge et par processus, et un contenu
+# n'expire jamais avant le dernier état enregistré qui le référence
+_BLOB_TTL_MARGIN = 24 * 3600
+
+# Dernière prolongation (ou écriture) de chaque contenu par ce processus : empreinte -> instant
+_refreshed_at = {}
+_refreshed_lock = threading.Lock()
+
+
+def _session_key(username, thread_id=None):
+    """Clé de l'état d'une conversation, ou sans thread_id, du pointeur vers la dernière conversation."""
+    return f"session:{username}:{thread_id}" if thread_id else f"session:{username}"
+
+
+def _merge_messages(ours, theirs):
+    """Garde les messages enregistrés par un autre onglet s'ils prolongent ceux de la session."""
+    if len(theirs) > len(ours) and theirs[:len(ours)] == ours:
+        return theirs
+    return ours
+
+
+def _merge_refs(ours, theirs):
+    """Ajoute aux références de la session celles enregistrées par un autre onglet."""
+    known = {(ref.get("digest"), ref.get("run_id")) for ref in ours}
+    return ours + [ref for ref in theirs if (ref.get("digest"), ref.get("run_id")) not in known]
+
+
+def _file_refs(backend, files):
+    """Stocke les contenus dans le backend et retourne les références (sans contenu)."""
+    refs = []
+    for file_data in files:
+        content = file_data.get("content")
+        digest = file_data.get("digest") or (content_digest(content) if content else None)
+        if digest and (content is not None or file_data.get("spilled")):
+            now = time.monotonic()
+            with _refreshed_lock:
+                refreshed = _refreshed_at.get(digest)
+            if refreshed is None or now - refreshed >= _BLOB_TTL_MARGIN:
+                ttl = settings.STATE_TTL + _BLOB_TTL_MARGIN
+                if not backend.refresh_blob(digest, ttl):
+                    # Contenu déchargé sur disque (budget mémoire) : relu pour le backend partagé
+                    backend.put_blob(content if content is not None else file_content(file_data), digest, ttl)
+                with _refreshed_lock:
+                    if len(_refreshed_at) > 10000:
+                        _refreshed_at.clear()
+                    _refreshed_at[digest] = now
+        ref = {key: value for key, value in file_data.items() if key != "content"}
+        ref["digest"] = digest
+        refs.append(ref)
+    return refs
+
+
+def _resolve_files(backend, refs):
+    """Recharge les contenus des fichiers référencés (sauf ceux déchargés et présents sur ce disque)."""
+    files = []
+    for ref in refs:
+        if ref.get("spilled") and ref.get("digest") and FileStore(settings.FILES_DIR).exists(ref["digest"]):
+            files.append(ref)
+            continue
+        ref = {key: value for key, value in ref.items() if key != "spilled"}
+        content = backend.get_blob(ref["digest"]) if ref.get("digest") else None
+        if content is None:
+            logger.warning("Contenu introuvable pour le fichier %s", ref.get("filename"))
+            continue
+        files.append({**ref, "content": content})
+    return files
+
+
+def load_session(session_state):
+    """
+    Recharge depuis le backend partagé l'état de la dernière conversation de l'utilisateur.
+
+    Args:
+        session_state: st.session_state (ou tout objet similaire à un dictionnaire)
+
+    Returns:
+        bool: True si un état a été trouvé et chargé
+    """
+    username = session_state.get("username")
+    if not username:
+        return False
+
+    backend = get_state_backend()
+    pointer = backend.get(_session_key(username)) or {}
+    record = backend.get(_session_key(username, pointer["thread_id"])) if pointer.get("thread_id") else None
+    if record is None and pointer.get("messages"):
+        # État enregistré avant le passage à un état par conversation
+        record = pointer
+    if not record or not record.get("messages"):
+        return False
+
+    session_state["messages"] = record["messages"]
+    if record.get("thread_id"):
+        session_state["thread_id"] = record["thread_id"]
+    session_state["message_files"] = {
+        message_id: _resolve_files(backend, refs) for message_id, refs in record.get("message_files", {}).items()
+    }
+    session_state["pending_files"] = _resolve_files(backend, record.get("pending_files", []))
+    if record.get("active_run"):
+        session_state["active_run"] = record["active_run"]
+    logger.info("État de session de %s rechargé (%d messages)", username, len(record["messages"]))
+    return True
+
+
+def save_session(session_state):
+    """
+    Écrit l'état de la conversation dans le backend partagé (contenus des fichiers par référence).
+
+    Chaque conversation a son propre état : deux onglets de l'utilisateur sur des conversations
+    différentes ne s'écrasent pas. Sur une même conversation, l'état est fusionné sous le
+    verrou avec celui enregistré par l'autre onglet.
+    """
+    username = session_state.get("username")
+    thread_id = session_state.get("thread_id")
+    if not username or not thread_id or "messages" not in session_state:
+        return
+
+    backend = get_state_backend()
+    key = _session_key(username, thread_id)
+    try:
+        with backend.lock(key):
+            stored = backend.get(key) or {}
+            message_files = {
+                message_id: _file_refs(backend, files)
+                for message_id, files in session_state.get("message_files", {}).items()
+            }
+            for message_id, refs in stored.get("message_files", {}).items():
+                message_files[message_id] = _merge_refs(message_files.get(message_id, []), refs)
+            record = {
+                "thread_id": thread_id,
+                "messages": _merge_messages(session_state["messages"], stored.get("messages", [])),
+                "message_files": message_files,
+                "pending_files": _merge_refs(_file_refs(backend, session_state.get("pending_files", [])),
+                                             stored.get("pending_files", [])),
+                "active_run": session_state.get("active_run"),
+            }
+            backend.set(key, record, ttl=settings.STATE_TTL)
+        # Conversation reprise par un nouvel onglet ou un autre réplica
+        backend.set(_session_key(username), {"thread_id": thread_id}, ttl=settings.STATE_TTL)
+    except Exception as e:
+        logger.error("Erreur lors de l'enregistrement de l'état de session: %s", e)
+
+
+def associate_pending_files(session_state, message_id, run_id=None):
+    """
+    Associe au message les fichiers en attente produits par le run, sous le verrou de la session.
+
+    Seuls les fichiers du run courant sont déplacés, pour qu'un autre onglet ou réplica
+    servant la même session ne récupère pas des fichiers qui ne sont pas les siens.
+
+    Returns:
+        int: Nombre de fichiers associés
+    """
+    pending = session_state.get("pending_files", [])
+    files = [f for f in pending if f.get("run_id") in (run_id, None)]
+    if not files:
+        return 0
+
+    session_state.setdefault("message_files", {}).setdefault(message_id, []).extend(files)
+    session_state["pending_files"] = [f for f in pending if f.get("run_id") not in (run_id, None)]
+
+    username = session_state.get("username")
+    thread_id = session_state.get("thread_id")
+    if not username or not thread_id:
+        return len(files)
+
+    backend = get_state_backend()
+    key = _session_key(username, thread_id)
+    try:
+        with backend.lock(key):
+            record = backend.get(key)
+            if record is not None:
+                record.setdefault("message_files", {}).setdefault(message_id, []).extend(_file_refs(backend, files))
+                record["pending_files"] = [
+                    ref for ref in record.get("pending_files", []) if ref.get("run_id") not in (run_id, None)
+                ]
+                backend.set(key, record, ttl=settings.STATE_TTL)
+    except Exception as e:
+        logger.error("Erreur lors de l'association des fichiers en attente: %s", e)
+    return len(files)
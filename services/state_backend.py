@@ -0,0 +1,241 @@
+import json
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from config import settings
+from services.file_store import FileStore
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("state_backend")
+
+
+class StateLockTimeout(Exception):
+    """Le verrou d'une session n'a pas pu être obtenu à temps."""
+
+
+class MemoryStateBackend:
+    """
+    Backend d'état en mémoire du processus (par défaut).
+
+    Les contenus de fichiers sont stockés par référence dans le FileStore local.
+    """
+
+    def __init__(self, files_dir):
+        self.files = FileStore(files_dir)
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() > expires_at:
+                del self._values[key]
+                return None
+            return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._values[key] = (json.dumps(value), expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    @contextmanager
+    def lock(self, key, timeout=None):
+        timeout = settings.STATE_LOCK_TIMEOUT if timeout is None else timeout
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        if not lock.acquire(timeout=timeout):
+            raise StateLockTimeout(f"Verrou {key} non obtenu après {timeout:g}s")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def put_blob(self, content, digest, ttl=None):
+        # Le FileStore local n'expire pas : la durée de vie est sans objet ici
+        self.files.put(content, digest)
+
+    def refresh_blob(self, digest, ttl=None):
+        return self.files.exists(digest)
+
+    def get_blob(self, digest):
+        try:
+            return self.files.get(digest)
+        except FileNotFoundError:
+            return None
+
+
+class RespError(Exception):
+    """Erreur renvoyée par le serveur (réponse RESP "-ERR ...")."""
+
+
+class _RespConnection:
+    """Connexion minimale au protocole Redis (RESP2)."""
+
+    def __init__(self, host, port, password=None, db=0, timeout=5.0):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._reader = self._socket.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    @staticmethod
+    def _encode(args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connexion fermée par le serveur")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RespError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RespError(f"Réponse RESP inattendue: {line!r}")
+
+    def execute(self, *args):
+        self._socket.sendall(self._encode(args))
+        return self._read_reply()
+
+
+# Supprime la clé seulement si elle contient encore notre jeton (libération sûre d'un verrou)
+_UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+class RedisStateBackend:
+    """
+    Backend d'état partagé entre les réplicas, via le protocole Redis.
+
+    Les états de session et les contenus de fichiers (par empreinte) sont stockés dans
+    Redis avec une durée de vie ; les verrous utilisent SET NX PX.
+
+    Args:
+        url (str): redis://[:mot_de_passe@]hôte[:port][/base]
+        prefix (str): Préfixe des clés
+    """
+
+    def __init__(self, url, prefix="mna:"):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = _RespConnection(self.host, self.port, self.password, self.db)
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, *args):
+        try:
+            return self._connection().execute(*args)
+        except (ConnectionError, OSError):
+            # Connexion perdue (redémarrage du serveur...) : une seule nouvelle tentative
+            connection = getattr(self._local, "connection", None)
+            if connection is not None:
+                connection.close()
+            self._local.connection = None
+            return self._connection().execute(*args)
+
+    def get(self, key):
+        value = self._execute("GET", self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        args = ["SET", self.prefix + key, json.dumps(value)]
+        if ttl:
+            args += ["EX", int(ttl)]
+        self._execute(*args)
+
+    def delete(self, key):
+        self._execute("DEL", self.prefix + key)
+
+    @contextmanager
+    def lock(self, key, timeout=None):
+        timeout = settings.STATE_LOCK_TIMEOUT if timeout is None else timeout
+        lock_key = f"{self.prefix}lock:{key}"
+        token = uuid.uuid4().hex
+        # Le verrou expire de lui-même si le réplica qui le détient disparaît
+        lease_ms = int(max(timeout, 1) * 3000)
+        deadline = time.monotonic() + timeout
+        while self._execute("SET", lock_key, token, "NX", "PX", lease_ms) is None:
+            if time.monotonic() > deadline:
+                raise StateLockTimeout(f"Verrou {key} non obtenu après {timeout:g}s")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            self._execute("EVAL", _UNLOCK_SCRIPT, 1, lock_key, token)
+
+    def put_blob(self, content, digest, ttl=None):
+        ttl = settings.STATE_TTL if ttl is None else ttl
+        self._execute("SET", f"{self.prefix}file:{digest}", content, "EX", int(ttl), "NX")
+
+    def refresh_blob(self, digest, ttl=None):
+        """Prolonge la durée de vie d'un contenu ; False s'il a déjà expiré."""
+        ttl = settings.STATE_TTL if ttl is None else ttl
+        return self._execute("EXPIRE", f"{self.prefix}file:{digest}", int(ttl)) == 1
+
+    def get_blob(self, digest):
+        return self._execute("GET", f"{self.prefix}file:{digest}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_state_backend(url):
+    """Crée le backend correspondant à une URL : memory:// ou redis://..."""
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return MemoryStateBackend(settings.FILES_DIR)
+    if scheme == "redis":
+        return RedisStateBackend(url)
+    raise ValueError(f"Backend d'état inconnu: {url}")
+
+
+def get_state_backend():
+    """Retourne le backend d'état configuré (STATE_BACKEND_URL), partagé par le processus."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_state_backend(settings.STATE_BACKEND_URL)
+            logger.info("Backend d'état: %s", type(_backend).__name__)
+        return _backend
@@ -0,0 +1,206 @@
+import json
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from config import settings
+from services.result_tables import TABULAR_TYPES, load_table
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("tool_output")
+
+
+def _projection(function_name):
+    return settings.TOOL_OUTPUT_PROJECTIONS.get(function_name, settings.TOOL_OUTPUT_PROJECTIONS["default"])
+
+
+def project_fields(data, fields):
+    """
+    Ne conserve d'un dictionnaire que les champs demandés.
+
+    Args:
+        data (dict): Données complètes (par ex. event_data d'ArcadiaAgents)
+        fields (list): Chemins pointés à conserver, par ex. "task_context.summary"
+
+    Returns:
+        dict: Sous-ensemble de data avec la même structure imbriquée
+    """
+    projected = {}
+    for path in fields:
+        keys = path.split(".")
+        value = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return projected
+
+
+def _scalar(value):
+    """Valeur Arrow convertie en valeur JSON compacte."""
+    value = value.as_py() if isinstance(value, pa.Scalar) else value
+    if isinstance(value, float):
+        return float(f"{value:.6g}")
+    if value is not None and not isinstance(value, (int, str, bool)):
+        return str(value)
+    return value
+
+
+def _column_stats(column):
+    """Statistiques d'une colonne : type, valeurs manquantes, bornes ou valeurs fréquentes."""
+    stats = {"type": str(column.type), "nulls": column.null_count}
+    if column.null_count == len(column):
+        return stats
+
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        min_max = pc.min_max(column)
+        stats.update(min=_scalar(min_max["min"]), max=_scalar(min_max["max"]), mean=_scalar(pc.mean(column)))
+    elif pa.types.is_temporal(column.type):
+        min_max = pc.min_max(column)
+        stats.update(min=_scalar(min_max["min"]), max=_scalar(min_max["max"]))
+    elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        counts = pc.value_counts(column.drop_null())
+        stats["distinct"] = len(counts)
+        top = counts.take(pc.array_sort_indices(counts.field("counts"), order="descending")[:3]).to_pylist()
+        # Les valeurs fréquentes n'ont pas d'intérêt pour une colonne d'identifiants uniques
+        if top and top[0]["counts"] > 1:
+            stats["top"] = {str(item["values"]): item["counts"] for item in top}
+    return stats
+
+
+def summarize_table(table, top_k=None, sort_by=None, max_columns=None):
+    """
+    Résume une table de résultats pour l'assistant.
+
+    Args:
+        table (pyarrow.Table): Table complète
+        top_k (int): Nombre de lignes d'exemple
+        sort_by (str): Colonne de tri décroissant des lignes d'exemple, si présente
+        max_columns (int): Nombre maximal de colonnes décrites
+
+    Returns:
+        dict: Nombre de lignes, statistiques par colonne et premières lignes
+    """
+    top_k = settings.TOOL_OUTPUT_TOP_K if top_k is None else top_k
+    max_columns = max_columns or settings.TOOL_OUTPUT_MAX_COLUMNS
+
+    names = table.column_names[:max_columns]
+    summary = {
+        "rows": table.num_rows,
+        "columns": {name: _column_stats(table.column(name)) for name in names},
+    }
+    if len(table.column_names) > max_columns:
+        summary["omitted_columns"] = len(table.column_names) - max_columns
+
+    if top_k and table.num_rows:
+        if sort_by in table.column_names:
+            indices = pc.select_k_unstable(table, top_k, sort_keys=[(sort_by, "descending")])
+            rows = table.select(names).take(indices)
+            summary["top_rows_sorted_by"] = sort_by
+        else:
+            rows = table.select(names).slice(0, top_k)
+        summary["top_rows"] = [
+            {key: _scalar(value) for key, value in row.items()} for row in rows.to_pylist()
+        ]
+    return summary
+
+
+def _describe_file(file_data, projection):
+    """Description d'un fichier de résultats : résumé si tabulaire, sinon nom et type."""
+    description = {"filename": file_data.get("filename"), "type": file_data.get("type")}
+    content = file_data.get("content")
+    if file_data.get("type") in TABULAR_TYPES and content:
+        try:
+            table = load_table(content, file_data["type"], file_data.get("digest"))
+            description.update(summarize_table(table, sort_by=projection.get("sort_by")))
+        except Exception as e:
+            logger.warning("Résumé impossible pour %s: %s", file_data.get("filename"), e)
+    return description
+
+
+def _encoded_size(value):
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode())
+
+
+def _shrink(output):
+    """Étapes de réduction successives, de la moins à la plus destructrice."""
+    files = output.get("files", [])
+    # 1. Moins de lignes d'exemple, puis aucune
+    for keep in (2, 0):
+        for file_info in files:
+            if "top_rows" in file_info:
+                file_info["top_rows"] = file_info["top_rows"][:keep]
+                if not keep:
+                    del file_info["top_rows"]
+                    file_info.pop("top_rows_sorted_by", None)
+        yield output
+    # 2. Colonnes réduites à leur type
+    for file_info in files:
+        if "columns" in file_info:
+            file_info["columns"] = {name: stats["type"] for name, stats in file_info["columns"].items()}
+    yield output
+    # 3. Seul le statut de la tâche est conservé
+    if "event_data" in output:
+        output["event_data"] = project_fields(output["event_data"], ["event_id", "status"])
+    yield output
+
+
+def enforce_budget(output, max_bytes=None):
+    """
+    Réduit la sortie d'un outil jusqu'à respecter le budget en octets (JSON encodé).
+
+    Returns:
+        dict: Sortie réduite ; "truncated" est ajouté si une réduction a été nécessaire
+    """
+    max_bytes = max_bytes or settings.TOOL_OUTPUT_MAX_BYTES
+    if _encoded_size(output) <= max_bytes:
+        return output
+
+    output["truncated"] = True
+    for reduced in _shrink(output):
+        if _encoded_size(reduced) <= max_bytes:
+            return reduced
+
+    # Dernier recours : ne garder que l'essentiel
+    minimal = {
+        "success": output.get("success"),
+        "message": str(output.get("message", ""))[:500],
+        "files": [{"filename": f.get("filename"), "rows": f.get("rows")} for f in output.get("files", [])][:20],
+        "truncated": True,
+    }
+    return minimal
+
+
+def build_tool_output(function_name, success, message, event_data=None, files=None):
+    """
+    Construit le résultat compact d'un appel d'outil, à renvoyer à l'assistant.
+
+    Seuls les champs configurés de event_data sont conservés et les fichiers tabulaires
+    sont résumés ; les données complètes restent disponibles dans les fichiers de résultats.
+
+    Args:
+        function_name (str): Nom de la fonction appelée par l'assistant
+        success (bool): Succès de l'appel
+        message (str): Message de statut
+        event_data (dict): Données de l'événement ArcadiaAgents
+        files (list): Fichiers de résultats ({"filename", "type", "content", "digest"})
+
+    Returns:
+        dict: Résultat compact, dans le budget TOOL_OUTPUT_MAX_BYTES
+    """
+    projection = _projection(function_name)
+    output = {"success": success, "message": message}
+    if event_data:
+        output["event_data"] = project_fields(event_data, projection["fields"])
+    if files:
+        output["files"] = [_describe_file(file_data, projection) for file_data in files]
+
+    output = enforce_budget(output)
+    logger.debug("Résultat de %s renvoyé à l'assistant: %d octets", function_name, _encoded_size(output))
+    return output
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import re
+import threading
+
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("tool_schemas")
+
+_TYPE_NAMES = {
+    dict: "object",
+    list: "array",
+    str: "string",
+    bool: "boolean",
+    int: "integer",
+    float: "number",
+    type(None): "null",
+}
+
+
+# Virgule acceptée seulement comme séparateur décimal unique, sans point ("12,5") ; suivie de
+# trois chiffres ("1,000"), elle peut aussi séparer les milliers : valeur refusée plutôt que devinée
+_DECIMAL_COMMA_RE = re.compile(r"^[+-]?\d+,(\d{1,2}|\d{4,})$")
+
+
+def _type_name(value):
+    return _TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+def _coerce(value, expected):
+    """
+    Vérifie (et normalise) le type d'une valeur.
+
+    Returns:
+        tuple: (valeur normalisée, True) si la valeur est du type attendu, sinon (valeur, False)
+    """
+    if expected == "object":
+        return value, isinstance(value, dict)
+    if expected == "array":
+        return value, isinstance(value, list)
+    if expected == "string":
+        return value, isinstance(value, str)
+    if expected == "null":
+        return value, value is None
+    if expected == "boolean":
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true", True
+        return value, isinstance(value, bool)
+    if expected in ("number", "integer"):
+        if isinstance(value, str):
+            text = value.strip()
+            if "," in text:
+                if not _DECIMAL_COMMA_RE.match(text):
+                    return value, False
+                text = text.replace(",", ".")
+            try:
+                value = float(text)
+            except ValueError:
+                return value, False
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value, False
+        if expected == "integer":
+            if isinstance(value, float) and not value.is_integer():
+                return value, False
+            return int(value), True
+        return value, True
+    # Type inconnu du sous-ensemble pris en charge : pas de contrôle
+    return value, True
+
+
+def _compile(schema):
+    """
+    Compile un schéma JSON (sous-ensemble) en fonction de validation.
+
+    Mots-clés pris en charge : type, properties, required, additionalProperties (booléen),
+    items, enum, default, minimum, maximum, minLength, maxLength, minItems, maxItems, pattern.
+
+    Returns:
+        callable: check(value, path, errors) -> valeur normalisée ; les erreurs sont ajoutées à errors
+    """
+    if not isinstance(schema, dict):
+        return lambda value, path, errors: value
+
+    expected = schema.get("type")
+    expected_types = expected if isinstance(expected, list) else [expected] if expected else []
+    enum = schema.get("enum")
+    properties = {name: _compile(sub) for name, sub in schema.get("properties", {}).items()}
+    defaults = {name: sub["default"] for name, sub in schema.get("properties", {}).items() if "default" in sub}
+    required = schema.get("required", [])
+    additional = schema.get("additionalProperties", True)
+    items = _compile(schema["items"]) if "items" in schema else None
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+
+    def check(value, path, errors):
+        if expected_types:
+            for candidate in expected_types:
+                normalized, ok = _coerce(value, candidate)
+                if ok:
+                    value = normalized
+                    break
+            else:
+                if (isinstance(value, str) and "," in value and not _DECIMAL_COMMA_RE.match(value.strip())
+                        and {"number", "integer"} & set(expected_types)):
+                    errors.append(
+                        f"{path}: nombre {value!r} ambigu, la virgule n'est acceptée que comme séparateur "
+                        f"décimal (envoyer le nombre sans séparateur de milliers, par ex. 1000000 ou 12.5)"
+                    )
+                else:
+                    errors.append(f"{path}: type attendu {' ou '.join(expected_types)}, reçu {_type_name(value)}")
+                return value
+
+        if enum is not None and value not in enum:
+            errors.append(f"{path}: valeur {value!r} non autorisée (valeurs possibles: {', '.join(map(str, enum))})")
+
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value and name not in defaults:
+                    errors.append(f"{path}.{name}: champ obligatoire manquant")
+            normalized = {}
+            for name, item in value.items():
+                if name in properties:
+                    normalized[name] = properties[name](item, f"{path}.{name}", errors)
+                elif additional is False:
+                    errors.append(f"{path}.{name}: propriété inconnue (propriétés possibles: {', '.join(properties)})")
+                else:
+                    normalized[name] = item
+            for name, default in defaults.items():
+                normalized.setdefault(name, default)
+            value = normalized
+
+        elif isinstance(value, list):
+            if min_items is not None and len(value) < min_items:
+                errors.append(f"{path}: au moins {min_items} élément(s) attendu(s)")
+            if max_items is not None and len(value) > max_items:
+                errors.append(f"{path}: au plus {max_items} élément(s) attendu(s)")
+            if items is not None:
+                value = [items(item, f"{path}[{index}]", errors) for index, item in enumerate(value)]
+
+        elif isinstance(value, str):
+            if min_length is not None and len(value) < min_length:
+                errors.append(f"{path}: au moins {min_length} caractère(s) attendu(s)")
+            if max_length is not None and len(value) > max_length:
+                errors.append(f"{path}: au plus {max_length} caractère(s) attendu(s)")
+            if pattern is not None and not pattern.search(value):
+                errors.append(f"{path}: format invalide (motif attendu: {pattern.pattern})")
+
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if minimum is not None and value < minimum:
+                errors.append(f"{path}: valeur {value} inférieure au minimum {minimum}")
+            if maximum is not None and value > maximum:
+                errors.append(f"{path}: valeur {value} supérieure au maximum {maximum}")
+        return value
+
+    return check
+
+
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(schema):
+    """Retourne la fonction de validation d'un schéma, compilée une seule fois par processus."""
+    key = hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+    with _validators_lock:
+        validator = _validators.get(key)
+    if validator is None:
+        validator = _compile(schema)
+        with _validators_lock:
+            _validators[key] = validator
+    return validator
+
+
+def tool_validators(tools):
+    """
+    Validateurs des outils de type fonction d'un run.
+
+    Args:
+        tools (list): Outils au format du paramètre tools ({"type": "function", "function": {...}})
+
+    Returns:
+        dict: Nom de la fonction -> fonction de validation
+    """
+    validators = {}
+    for tool in tools or []:
+        function = tool.get("function") if tool.get("type") == "function" else None
+        if function and function.get("name"):
+            validators[function["name"]] = get_validator(function.get("parameters") or {})
+    return validators
+
+
+def validate_tool_arguments(function_name, raw_arguments, validators):
+    """
+    Analyse et valide les arguments d'un appel d'outil avant son exécution.
+
+    Args:
+        function_name (str): Nom de la fonction appelée
+        raw_arguments (str): Arguments JSON fournis par l'assistant
+        validators (dict): Validateurs des outils du run (voir tool_validators) ; vide si
+            les schémas ne sont pas connus (aucune validation)
+
+    Returns:
+        tuple: (arguments normalisés, liste des erreurs)
+    """
+    try:
+        arguments = json.loads(raw_arguments or "{}")
+    except json.JSONDecodeError as e:
+        return None, [f"arguments: JSON invalide ({e})"]
+    if not validators:
+        return arguments, []
+    if function_name not in validators:
+        return arguments, [f"fonction inconnue '{function_name}' (fonctions disponibles: {', '.join(validators)})"]
+    errors = []
+    arguments = validators[function_name](arguments, "arguments", errors)
+    if errors:
+        logger.info("Arguments invalides pour %s: %s", function_name, "; ".join(errors))
+    return arguments, errors
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from config import settings
+
+# Multiples calculés : nom -> (numérateur, dénominateur) parmi les colonnes résolues
+MULTIPLES = {
+    "ev_ebitda": ("enterprise_value", "ebitda"),
+    "ev_revenue": ("enterprise_value", "revenue"),
+}
+
+# Quantiles calculés et suffixe des colonnes correspondantes
+_QUANTILES = {0.25: "p25", 0.5: "median", 0.75: "p75"}
+
+
+def _year(values):
+    """Année d'une colonne de dates, de texte ou déjà numérique."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("Int64")
+    return pd.to_datetime(values, errors="coerce").dt.year.astype("Int64")
+
+
+def compute_multiples(df, columns, group_by=None, max_multiple=None):
+    """
+    Calcule les multiples de valorisation et leurs statistiques, de façon vectorisée.
+
+    Les multiples dont le dénominateur est nul ou négatif, ou supérieurs à max_multiple,
+    sont exclus des statistiques (ils fausseraient médianes et quartiles).
+
+    Args:
+        df (pandas.DataFrame): Résultats de transactions
+        columns (dict): Rôle -> colonne ("enterprise_value", "ebitda", "revenue", "date")
+        group_by (list): Colonnes de regroupement ; "year" est dérivé de la colonne de date
+        max_multiple (float): Multiple au-delà duquel une valeur est considérée aberrante
+
+    Returns:
+        dict: "overall" (statistiques par multiple), "excluded" (valeurs exclues par multiple)
+              et "breakdown" (DataFrame des statistiques par groupe, ou None)
+    """
+    max_multiple = settings.VALUATION_MAX_MULTIPLE if max_multiple is None else max_multiple
+    data = pd.DataFrame(index=df.index)
+    excluded = {}
+    for name, (numerator, denominator) in MULTIPLES.items():
+        if columns.get(numerator) is None or columns.get(denominator) is None:
+            continue
+        num = pd.to_numeric(df[columns[numerator]], errors="coerce").to_numpy(dtype=float)
+        den = pd.to_numeric(df[columns[denominator]], errors="coerce").to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = num / den
+        valid = (den > 0) & (num > 0) & np.isfinite(values) & (values <= max_multiple)
+        data[name] = np.where(valid, values, np.nan)
+        excluded[name] = int((~valid & ~np.isnan(num) & ~np.isnan(den)).sum())
+
+    metrics = list(data.columns)
+    overall = {}
+    for name in metrics:
+        values = data[name].to_numpy()
+        values = values[~np.isnan(values)]
+        stats = {"count": int(values.size)}
+        if values.size:
+            p25, median, p75 = np.quantile(values, list(_QUANTILES))
+            stats.update(p25=p25, median=median, p75=p75, mean=values.mean())
+        overall[name] = stats
+
+    breakdown = None
+    if group_by and metrics:
+        for key in group_by:
+            data[key] = _year(df[columns["date"]]) if key == "year" else df[key]
+        grouped = data.groupby(list(group_by), dropna=True)[metrics]
+        counts = grouped.count().add_suffix("_count")
+        quantiles = grouped.quantile(list(_QUANTILES)).unstack()
+        quantiles.columns = [f"{name}_{_QUANTILES[q]}" for name, q in quantiles.columns]
+        breakdown = pd.concat([counts, quantiles], axis=1)
+        ordered = [f"{name}_{suffix}" for name in metrics for suffix in ("count", "p25", "median", "p75")]
+        breakdown = breakdown[ordered].reset_index()
+    return {"overall": overall, "excluded": excluded, "breakdown": breakdown}
+
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("warmup")
+
+_lock = threading.Lock()
+_clients = {}
+_http_session = None
+# Outils déclarés par assistant : assistant_id -> (date de récupération, outils)
+_assistant_tools = {}
+# Tâches de préchauffage en arrière-plan (hors du thread du script Streamlit)
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warmup")
+
+
+def get_openai_client(api_key):
+    """
+    Retourne le client OpenAI partagé par le processus.
+
+    Le client est thread-safe et garde ses connexions ouvertes : les sessions et les
+    reruns ne paient plus la création du client ni la poignée de main TLS.
+    """
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # Import tardif : le SDK OpenAI n'est chargé qu'à la création du premier client
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key)
+            _clients[api_key] = client
+        return client
+
+
+def get_http_session():
+    """Retourne la session HTTP partagée (pool de connexions keep-alive) pour ArcadiaAgents."""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def get_assistant_tools(client, assistant_id):
+    """
+    Retourne les outils déclarés par l'assistant (dictionnaires), mis en cache par le processus.
+
+    Un run qui passe le paramètre tools remplace ceux de l'assistant : cette liste permet de
+    les compléter sans appel à l'API à chaque question.
+
+    Returns:
+        list: Les outils de l'assistant, ou None si la récupération a échoué
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _assistant_tools.get(assistant_id)
+    if cached is not None and now - cached[0] < settings.ASSISTANT_TOOLS_CACHE_TTL:
+        return cached[1]
+    try:
+        assistant = client.beta.assistants.retrieve(assistant_id)
+    except Exception as e:
+        logger.warning("Impossible de récupérer les outils de l'assistant: %s", e)
+        return cached[1] if cached is not None else None
+    tools = [tool if isinstance(tool, dict) else tool.to_dict() for tool in assistant.tools or []]
+    with _lock:
+        _assistant_tools[assistant_id] = (now, tools)
+    return tools
+
+
+class ThreadPool:
+    """
+    Réserve de threads Assistants créés à l'avance, distribués aux nouvelles sessions.
+
+    Args:
+        size (int): Nombre de threads à garder prêts
+        max_age (float): Âge (secondes) au-delà duquel un thread n'est plus distribué
+    """
+
+    def __init__(self, size, max_age):
+        self.size = size
+        self.max_age = max_age
+        self._threads = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def acquire(self, client):
+        """
+        Retourne l'ID d'un thread préparé, ou None si la réserve est vide.
+
+        La réserve est réalimentée en arrière-plan.
+        """
+        now = time.monotonic()
+        thread_id = None
+        with self._lock:
+            while self._threads:
+                created_at, candidate = self._threads.popleft()
+                if now - created_at < self.max_age:
+                    thread_id = candidate
+                    break
+        self.refill(client)
+        return thread_id
+
+    def refill(self, client):
+        """Complète la réserve en arrière-plan (une seule réalimentation à la fois)."""
+        with self._lock:
+            if self._refilling or len(self._threads) >= self.size:
+                return
+            self._refilling = True
+        _executor.submit(self._refill, client)
+
+    def _refill(self, client):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._threads) >= self.size:
+                        return
+                thread = client.beta.threads.create()
+                with self._lock:
+                    self._threads.append((time.monotonic(), thread.id))
+                logger.debug("Thread %s ajouté à la réserve", thread.id)
+        except Exception as e:
+            logger.warning("Échec de la préparation d'un thread: %s", e)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+thread_pool = ThreadPool(settings.WARMUP_THREAD_POOL_SIZE, settings.WARMUP_THREAD_MAX_AGE)
+
+
+def _warm_openai(client, assistant_id):
+    start = time.perf_counter()
+    # La récupération de l'assistant ouvre la connexion et remplit le cache de ses outils
+    if get_assistant_tools(client, assistant_id) is not None:
+        logger.debug("Connexion OpenAI préchauffée en %.3fs", time.perf_counter() - start)
+
+
+def _warm_http(base_url):
+    start = time.perf_counter()
+    try:
+        # Toute réponse suffit : il s'agit d'ouvrir la connexion TLS du pool
+        get_http_session().head(base_url, timeout=5)
+        logger.debug("Connexion à %s préchauffée en %.3fs", base_url, time.perf_counter() - start)
+    except Exception as e:
+        logger.warning("Échec du préchauffage de %s: %s", base_url, e)
+
+
+def warm_up(client, assistant_id, arcadia_url):
+    """
+    Prépare en arrière-plan ce dont la première question aura besoin.
+
+    Ouvre les connexions vers OpenAI et ArcadiaAgents et complète la réserve de threads.
+    Ne bloque pas l'appelant.
+
+    Args:
+        client (OpenAI): Client partagé (voir get_openai_client)
+        assistant_id (str): ID de l'assistant, récupéré pour ouvrir la connexion
+        arcadia_url (str): URL de base de l'API ArcadiaAgents
+    """
+    _executor.submit(_warm_openai, client, assistant_id)
+    _executor.submit(_warm_http, arcadia_url)
+    thread_pool.refill(client)
@@ -81,7 +81,7 @@ def show_login_form(auth_service):
             st.error("Identifiants incorrects")
             return False
         else:
-            logger.info("Aucune tentative de connexion")
+            logger.debug("Aucune tentative de connexion")
             return False
     
     except Exception as e:
@@ -1,78 +1,136 @@
+import functools
+import os
+
 import streamlit as st
-from PIL import Image
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config import settings
+from services.conversation_store import get_conversation_store
+from services.export import export_conversation
 from services.llm_service import LLMService
+from services.session_memory import enforce_memory_budget
+from services.session_sync import load_session, save_session
+from ui.stream_renderer import write_markdown_stream
 from utils.logger import setup_logger
-from streamlit_extras.stylable_container import stylable_container
 
 # Configuration du logging
 logger = setup_logger("main_ui")
 
-def main_app_ui():
-    """Interface utilisateur principale de l'application après authentification."""
-    # Appliquer les styles CSS depuis styles.py
-    from ui.styles import apply_chat_styles
-    apply_chat_styles()
+def _process_input():
+    """Callback du champ de saisie : stocke la question et vide l'entrée."""
+    # Stocker la valeur actuelle
+    prompt = st.session_state.chat_input
+    # Vider immédiatement l'entrée
+    st.session_state.chat_input = ""
+    
+    if prompt:
+        # Traiter le message
+        st.session_state.user_input = prompt
 
-    # Charger l'image pour l'avatar
-    try:
-        assistant_avatar = Image.open('assets/logo-scalene.webp')
-    except Exception as e:
-        logger.error(f"Erreur lors du chargement de l'image: {e}")
-        assistant_avatar = ""  # Utiliser un placeholder en cas d'erreur
+def _load_earlier_messages():
+    """Callback du bouton "Afficher les messages précédents"."""
+    st.session_state.history_window += settings.CHAT_HISTORY_PAGE
 
-    # Utiliser une icône Material Design pour l'avatar utilisateur (équivalent à person-circle de Bootstrap)
-    user_avatar = "assets/person-circle.svg"
+def _session_id():
+    """Identifiant de la session Streamlit (un par onglet), ou None hors d'un run du script."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
 
-    # Initialiser l'historique du chat
-    if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {"role": "system", "content": "Vous êtes un assistant de recherche en fusions-acquisitions. Votre objectif est d'aider les analystes à effectuer des recherches pertinentes sur des transactions et des entreprises."}
-        ]
+def _render_message(llm, message, user_avatar, assistant_avatar):
+    """Affiche un message de l'historique et ses fichiers associés."""
+    if message["role"] == "user":
+        with st.chat_message(message["role"], avatar=user_avatar):
+            st.markdown(message["content"])
+    else:
+        with st.chat_message(message["role"], avatar=assistant_avatar):
+            # Afficher le message texte
+            message_text_container = st.container()
+            with message_text_container:
+                st.markdown(message["content"])
+            
+            # Afficher les fichiers associés à ce message si existants
+            if "message_id" in message:
+                llm.display_message_files(message["message_id"])
 
-    # Initialiser le service LLM
-    llm = LLMService()
+def _restore_conversation():
+    """Recharge la dernière conversation de l'utilisateur depuis le stockage local."""
+    username = st.session_state.get("username")
+    if not username:
+        return
+    
+    try:
+        store = get_conversation_store()
+        conversations = store.list_conversations(username, limit=1)
+        if not conversations:
+            return
+        thread_id = conversations[0]["thread_id"]
+        messages, message_files = store.load_conversation(thread_id)
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement de la conversation locale: {e}")
+        return
+    
+    logger.info(f"Conversation {thread_id} rechargée depuis le stockage local ({len(messages)} messages)")
+    st.session_state.thread_id = thread_id
+    st.session_state.messages.extend(messages)
+    st.session_state.message_files = message_files
 
-    # Initialiser le state pour le input
-    if "user_input" not in st.session_state:
-        st.session_state.user_input = ""
+def _persist_messages(start):
+    """Écrit dans le stockage local les messages ajoutés depuis l'index start, et leurs fichiers."""
+    username = st.session_state.get("username")
+    thread_id = st.session_state.get("thread_id")
+    if not username or not thread_id:
+        return
+    
+    try:
+        store = get_conversation_store()
+        for position in range(start, len(st.session_state.messages)):
+            message = st.session_state.messages[position]
+            store.save_message(username, thread_id, position, message)
+            files = st.session_state.get("message_files", {}).get(message.get("message_id"))
+            if files:
+                store.save_message_files(thread_id, message["message_id"], files)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'enregistrement de la conversation locale: {e}")
 
-    # Fonction de callback pour traiter l'envoi
-    def process_input():
-        # Stocker la valeur actuelle
-        prompt = st.session_state.chat_input
-        # Vider immédiatement l'entrée
-        st.session_state.chat_input = ""
-        
-        if prompt:
-            # Traiter le message
-            st.session_state.user_input = prompt
+@st.fragment
+def _chat_history(llm, user_avatar, assistant_avatar):
+    """
+    Affiche l'historique connu lors du dernier rechargement complet de la page.
     
-    # Titre centré avec style minimaliste
-    st.markdown("<div class='title-container'><h1 class='app-title'> Assistant de Recherche M&A</h1></div>", unsafe_allow_html=True)
+    Seuls les échanges les plus récents sont rendus ; les plus anciens sont chargés à la
+    demande. En tant que fragment, l'historique n'est pas redessiné pendant qu'une
+    nouvelle réponse est générée.
+    """
+    # Ignorer le message système
+    history = st.session_state.messages[1:st.session_state.history_end]
+    hidden_count = max(0, len(history) - 2 * st.session_state.history_window)
+    
+    if hidden_count:
+        st.button(
+            f"Afficher les messages précédents ({hidden_count})",
+            type="tertiary",
+            key="load_earlier_messages",
+            on_click=_load_earlier_messages
+        )
     
+    for message in history[hidden_count:]:
+        _render_message(llm, message, user_avatar, assistant_avatar)
+
+@st.fragment
+def _chat_turn(llm, user_avatar, assistant_avatar):
+    """
+    Affiche le champ de saisie, les messages échangés depuis le dernier rechargement
+    complet et la réponse en cours de streaming.
+    """
     # Créer un container pour les messages du chat
     message_container = st.container()
     
     # Champ de saisie déjà stylisé par le CSS personnalisé
-    prompt = st.text_input("Posez votre question sur les transactions M&A:", key="chat_input", on_change=process_input)
+    st.text_input("Posez votre question sur les transactions M&A:", key="chat_input", on_change=_process_input)
     
-    # Afficher tous les messages (historique et nouveaux) dans le message_container
+    # Afficher les messages ajoutés depuis le dernier rendu de l'historique
     with message_container:
-        # Afficher l'historique des messages (sauf le message système)
-        for message in st.session_state.messages[1:]:  # Ignorer le message système
-            if message["role"] == "user":
-                with st.chat_message(message["role"], avatar=user_avatar):
-                    st.markdown(message["content"])
-            else:
-                with st.chat_message(message["role"], avatar=assistant_avatar):
-                    # Afficher le message texte
-                    message_text_container = st.container()
-                    with message_text_container:
-                        st.markdown(message["content"])
-                    
-                    # Afficher les fichiers associés à ce message si existants
-                    if "message_id" in message:
-                        llm.display_message_files(message["message_id"])
+        for message in st.session_state.messages[st.session_state.history_end:]:
+            _render_message(llm, message, user_avatar, assistant_avatar)
 
     # Traiter l'entrée utilisateur stockée dans session_state
     if st.session_state.user_input:
@@ -80,11 +138,9 @@ def main_app_ui():
         st.session_state.user_input = ""  # Réinitialiser pour le prochain tour
         
         # Ajouter la requête à l'historique
+        turn_start = len(st.session_state.messages)
         st.session_state.messages.append({"role": "user", "content": prompt})
         
-        # Ajouter la requête à la conversation envoyée à l'API
-        messages_for_api = st.session_state.messages.copy()
-        
         # Afficher le message utilisateur et la réponse (pas besoin car ils seront affichés au prochain rechargement)
         with message_container:
             with st.chat_message("user", avatar=user_avatar):
@@ -97,7 +153,7 @@ def main_app_ui():
                 with st.chat_message("assistant", avatar=assistant_avatar):
                     # Streaming du message
                     stream = llm.get_stream(st.session_state.messages)
-                    response = st.write_stream(stream)
+                    response = write_markdown_stream(stream)
                     
                     # Récupérer le dernier message et son ID
                     try:
@@ -123,6 +179,121 @@ def main_app_ui():
         if current_message_id:
             message_to_append["message_id"] = current_message_id
         st.session_state.messages.append(message_to_append)
+        
+        # Enregistrer l'échange dans le stockage local et dans l'état partagé entre réplicas
+        _persist_messages(turn_start)
+        save_session(st.session_state)
+        
+        # Décharger sur disque les fichiers les plus anciens si la session dépasse son budget mémoire
+        enforce_memory_budget(st.session_state, _session_id())
+        
+        # Chaque rerun du fragment redessine les messages postérieurs à history_end : au-delà
+        # de CHAT_LIVE_EXCHANGES échanges, les intégrer à l'historique (fenêtré) en avançant
+        # history_end par un rechargement complet. Au premier échange, ce rechargement
+        # affiche aussi les boutons.
+        live_exchanges = (len(st.session_state.messages) - st.session_state.history_end) // 2
+        if st.session_state.history_end <= 2 or live_exchanges >= settings.CHAT_LIVE_EXCHANGES:
+            st.session_state.history_end = len(st.session_state.messages)
+            st.rerun()
+
+
+def _clear_export(path):
+    """Callback du bouton de téléchargement : l'archive n'est plus nécessaire sur le disque."""
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def _export_button():
+    """
+    Bouton d'export ; l'archive n'est produite qu'à la demande.
+    
+    Le bouton de téléchargement n'est rendu qu'au rerun qui suit la production de
+    l'archive : elle n'est pas relue en mémoire à chaque rerun suivant (les archives non
+    téléchargées sont supprimées après EXPORT_TTL).
+    """
+    path = st.session_state.pop("export_path", None)
+    if path and os.path.exists(path):
+        with open(path, "rb") as archive:
+            st.download_button(
+                "Télécharger l'archive",
+                data=archive,
+                file_name="resultats_conversation.zip",
+                mime="application/zip",
+                icon=":material/download:",
+                on_click=_clear_export,
+                args=(path,),
+                key="export_download"
+            )
+        return
+    if st.button("", icon=":material/archive:", help="Exporter tous les résultats de la conversation", type="tertiary", key="export_button"):
+        with st.spinner("Préparation de l'export..."):
+            result = export_conversation(st.session_state.message_files)
+        if result["success"]:
+            st.session_state.export_path = result["path"]
+            st.rerun()
+        else:
+            st.error(result["error"])
+
+
+@functools.lru_cache(maxsize=1)
+def _assistant_avatar():
+    """Image de l'avatar de l'assistant, chargée une seule fois par processus (PIL importé à la demande)."""
+    try:
+        from PIL import Image
+        image = Image.open('assets/logo-scalene.webp')
+        # Décodage immédiat : l'image est partagée entre les sessions et les threads
+        image.load()
+        return image
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement de l'image: {e}")
+        return ""  # Utiliser un placeholder en cas d'erreur
+
+
+def main_app_ui():
+    """Interface utilisateur principale de l'application après authentification."""
+    # Appliquer les styles CSS depuis styles.py
+    from ui.styles import apply_chat_styles
+    apply_chat_styles()
+
+    # Charger l'image pour l'avatar
+    assistant_avatar = _assistant_avatar()
+
+    # Utiliser une icône Material Design pour l'avatar utilisateur (équivalent à person-circle de Bootstrap)
+    user_avatar = "assets/person-circle.svg"
+
+    # Initialiser l'historique du chat
+    # Reprendre d'abord l'état partagé de la session (servie auparavant par un autre réplica,
+    # ou avant un redémarrage), sinon la dernière conversation enregistrée localement
+    if "messages" not in st.session_state:
+        if not load_session(st.session_state):
+            st.session_state.messages = [
+                {"role": "system", "content": "Vous êtes un assistant de recherche en fusions-acquisitions. Votre objectif est d'aider les analystes à effectuer des recherches pertinentes sur des transactions et des entreprises."}
+            ]
+            _restore_conversation()
+        # Session restaurée : appliquer tout de suite le budget mémoire
+        enforce_memory_budget(st.session_state, _session_id())
+
+    # Initialiser le service LLM
+    llm = LLMService()
+
+    # Initialiser le state pour le input
+    if "user_input" not in st.session_state:
+        st.session_state.user_input = ""
+    
+    # Nombre d'échanges affichés dans l'historique
+    if "history_window" not in st.session_state:
+        st.session_state.history_window = settings.CHAT_HISTORY_WINDOW
+    
+    # Limite de l'historique rendu par le fragment d'historique ; les messages suivants
+    # sont rendus par le fragment de saisie jusqu'au prochain rechargement complet
+    st.session_state.history_end = len(st.session_state.messages)
+    
+    # Titre centré avec style minimaliste
+    st.markdown("<div class='title-container'><h1 class='app-title'> Assistant de Recherche M&A</h1></div>", unsafe_allow_html=True)
+    
+    # Historique puis saisie, chacun dans son propre fragment
+    _chat_history(llm, user_avatar, assistant_avatar)
+    _chat_turn(llm, user_avatar, assistant_avatar)
     
     # Créer une ligne avec deux colonnes pour les boutons
     if len(st.session_state.messages) > 2:  # Plus que le message système + 1 échange
@@ -131,6 +302,7 @@ def main_app_ui():
         # Bouton de déconnexion
         with col1:
             # Utiliser stylable_container pour aligner le bouton à droite
+            from streamlit_extras.stylable_container import stylable_container
             with stylable_container(
                 key="logout_button_container",
                 css_styles="""
@@ -152,3 +324,8 @@ def main_app_ui():
                             except:
                                 pass
                     st.rerun()
+        
+        # Export de tous les résultats de la conversation (généré seulement à la demande)
+        with col2:
+            if any(st.session_state.get("message_files", {}).values()):
+                _export_button()
@@ -0,0 +1,176 @@
+"""
+Rendu incrémental du markdown d'une réponse streamée.
+
+Les blocs terminés (paragraphes, titres, blocs de code, listes et tableaux) sont figés
+dans leurs propres éléments ; seul le bloc ouvert est redessiné. Le coût d'un morceau
+reçu dépend de la taille du bloc en cours, et non de toute la réponse.
+"""
+import re
+
+import streamlit as st
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_LIST_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s")
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s")
+
+
+def _block_kind(line):
+    stripped = line.lstrip()
+    if stripped.startswith("|"):
+        return "table"
+    if _LIST_RE.match(line):
+        return "list"
+    return "text"
+
+
+class MarkdownStreamRenderer:
+    """
+    Affiche un flux de texte markdown au fur et à mesure, bloc par bloc.
+
+    Args:
+        container: Conteneur Streamlit cible (créé au premier morceau si absent)
+    """
+
+    def __init__(self, container=None):
+        self._container = container
+        self._chunks = []
+        self._lines = []
+        self._partial = []
+        self._kind = None
+        self._in_fence = False
+        self._block = None
+        self._partial_line = None
+
+    def _new_element(self):
+        if self._container is None:
+            self._container = st.container()
+        return self._container.empty()
+
+    def _structured(self):
+        # Listes et tableaux : le bloc n'est redessiné qu'à chaque ligne terminée
+        return self._kind in ("table", "list") and not self._in_fence
+
+    def _render_block(self):
+        """Redessine le bloc ouvert (et sa ligne en cours, sauf pour les listes et tableaux)."""
+        if self._block is None:
+            self._block = self._new_element()
+        lines = self._lines
+        partial = "".join(self._partial)
+        if partial and not self._structured():
+            lines = lines + [partial]
+        self._block.markdown("\n".join(lines))
+
+    def _render_partial_line(self):
+        """Affiche à part l'élément de liste en cours d'écriture."""
+        partial = "".join(self._partial)
+        if partial.strip():
+            if self._partial_line is None:
+                self._partial_line = self._new_element()
+            self._partial_line.markdown(partial)
+        elif self._partial_line is not None:
+            self._partial_line.empty()
+
+    def _commit(self):
+        """Fige le bloc ouvert ; les morceaux suivants vont dans un nouvel élément."""
+        if self._lines:
+            if self._block is None:
+                self._block = self._new_element()
+            self._block.markdown("\n".join(self._lines))
+            # Bloc vide (seule une ligne en cours y était affichée) : l'élément est réutilisé
+            self._block = None
+        if self._partial_line is not None:
+            self._partial_line.empty()
+        self._lines = []
+        self._kind = None
+        self._partial_line = None
+
+    def _add_line(self, line):
+        """Traite une ligne terminée ; retourne True si le bloc ouvert doit être redessiné."""
+        if _FENCE_RE.match(line):
+            if self._in_fence:
+                self._lines.append(line)
+                self._in_fence = False
+                self._commit()
+                return False
+            self._commit()
+            self._in_fence = True
+            self._kind = "code"
+            self._lines.append(line)
+            return True
+
+        if self._in_fence:
+            self._lines.append(line)
+            return True
+
+        if not line.strip():
+            self._commit()
+            return False
+
+        kind = _block_kind(line)
+        # Un tableau commence ou se termine : bloc distinct, même sans ligne vide
+        if self._lines and (kind == "table") != (self._kind == "table"):
+            self._commit()
+        if self._kind is None:
+            self._kind = kind
+        self._lines.append(line)
+
+        if _HEADING_RE.match(line):
+            self._commit()
+            return False
+        return True
+
+    def write(self, chunk):
+        """Ajoute un morceau de texte et met à jour l'affichage."""
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+
+        pieces = chunk.split("\n")
+        line_completed = False
+        for piece in pieces[:-1]:
+            self._partial.append(piece)
+            line = "".join(self._partial)
+            self._partial = []
+            line_completed = self._add_line(line) or line_completed
+        if pieces[-1]:
+            self._partial.append(pieces[-1])
+
+        if not self._structured():
+            if self._lines or self._partial:
+                self._render_block()
+            return
+        if line_completed:
+            self._render_block()
+        if self._kind == "list":
+            self._render_partial_line()
+
+    def close(self):
+        """
+        Termine le rendu et retourne le texte complet.
+
+        Returns:
+            str: Le texte complet, assemblé une seule fois
+        """
+        if self._partial:
+            line = "".join(self._partial)
+            self._partial = []
+            self._add_line(line)
+        self._commit()
+        return "".join(self._chunks)
+
+
+def write_markdown_stream(stream, container=None):
+    """
+    Équivalent de st.write_stream pour un flux de texte markdown, à rendu incrémental.
+
+    Args:
+        stream: Itérable de morceaux de texte
+        container: Conteneur Streamlit cible (optionnel)
+
+    Returns:
+        str: Le texte complet de la réponse
+    """
+    renderer = MarkdownStreamRenderer(container)
+    for chunk in stream:
+        renderer.write(chunk)
+    return renderer.close()
@@ -0,0 +1,110 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Temps d'import à froid maximal (secondes) des points d'entrée, hors Streamlit et secrets
+DEFAULT_BUDGETS = {
+    "app": 0.6,
+    "services.llm_service": 0.4,
+    "services.api_tools": 0.35,
+}
+
+# Déjà chargés par le serveur Streamlit avant l'exécution du script : exclus de la mesure
+PRELOAD = "import streamlit as st\ntry:\n    st.secrets.to_dict()\nexcept Exception:\n    pass\n"
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_importtime(output, module):
+    """
+    Extrait de la sortie de -X importtime le temps cumulé d'un module et ses imports.
+
+    Returns:
+        tuple: (temps cumulé en secondes, liste de (module, temps cumulé) des imports imbriqués)
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+
+    # -X importtime écrit un module après ses imports : ceux du module cible le précèdent
+    for index, (depth, name, cumulative) in enumerate(entries):
+        if name == module and depth == 0:
+            children = []
+            for child_depth, child_name, child_cumulative in reversed(entries[:index]):
+                if child_depth == 0:
+                    break
+                children.append((child_name, child_cumulative))
+            return cumulative, children
+    raise RuntimeError(f"Module {module} absent du profil d'import")
+
+
+def profile_import(module, repeat=3):
+    """
+    Mesure le temps d'import à froid d'un module, dans un nouveau processus à chaque essai.
+
+    Args:
+        module (str): Module à importer (par ex. "app")
+        repeat (int): Nombre d'essais ; le meilleur est retenu
+
+    Returns:
+        dict: "seconds" (meilleur temps cumulé) et "imports" (imports imbriqués du meilleur essai)
+    """
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"{PRELOAD}import {module}\n"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Import de {module} impossible:\n{completed.stderr[-2000:]}")
+        seconds, imports = _parse_importtime(completed.stderr, module)
+        if best is None or seconds < best["seconds"]:
+            best = {"seconds": seconds, "imports": imports}
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profil et budget du temps d'import à froid des points d'entrée.")
+    parser.add_argument("modules", nargs="*", help="Modules à mesurer (par défaut, ceux qui ont un budget)")
+    parser.add_argument("--top", type=int, default=10, help="Nombre d'imports les plus lents affichés par module")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre d'essais par module (le meilleur est retenu)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=SECONDES",
+                        help="Budget d'un module (remplace la valeur par défaut)")
+    parser.add_argument("--check", action="store_true", help="Code de sortie 1 si un budget est dépassé")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in args.budget:
+        module, _, seconds = item.partition("=")
+        try:
+            budgets[module] = float(seconds)
+        except ValueError:
+            parser.error(f"Budget invalide: {item}")
+
+    over_budget = []
+    for module in args.modules or list(budgets):
+        profile = profile_import(module, repeat=args.repeat)
+        budget = budgets.get(module)
+        status = ""
+        if budget is not None:
+            status = f" (budget {budget:.2f}s{', DÉPASSÉ' if profile['seconds'] > budget else ''})"
+            if profile["seconds"] > budget:
+                over_budget.append(module)
+        print(f"{module}: {profile['seconds']:.3f}s{status}")
+        for name, seconds in sorted(profile["imports"], key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {seconds:8.3f}s  {name}")
+
+    if args.check and over_budget:
+        print(f"Budget d'import dépassé: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,125 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Niveau par défaut et niveaux par logger, par ex. LOG_LEVELS="api_tools=DEBUG,auth_service=WARNING"
+DEFAULT_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOGGER_LEVELS = dict(
+    item.strip().split("=", 1) for item in os.environ.get("LOG_LEVELS", "").split(",") if "=" in item
+)
+# "json" (structuré, par défaut) ou "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Au plus LOG_RATE_LIMIT messages identiques (même logger, même modèle) par fenêtre de
+# LOG_RATE_INTERVAL secondes ; les avertissements et erreurs ne sont jamais limités
+LOG_RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", "20"))
+LOG_RATE_INTERVAL = float(os.environ.get("LOG_RATE_INTERVAL", "10"))
+
+# Attributs standards d'un LogRecord, exclus des champs structurés
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formate chaque enregistrement en une ligne JSON, avec les champs passés via `extra`."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limite les messages répétitifs des chemins chauds (reruns, polling).
+
+    Les messages sont regroupés par logger et par modèle de message (avant formatage des
+    arguments) ; le nombre de messages supprimés est ajouté au suivant qui passe.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._windows) > 1024:
+                # Oublier les fenêtres expirées (messages non modélisés, tous différents)
+                self._windows = {
+                    k: v for k, v in self._windows.items() if now - v[0] < self.interval
+                }
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.limit:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self._windows[key] = (window_start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+_log_queue = queue.SimpleQueue()
+_listener = None
+_listener_lock = threading.Lock()
+_rate_limit_filter = RateLimitFilter()
+
+
+def _ensure_listener():
+    """Démarre (une seule fois par processus) le thread qui écrit les logs."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        handler = logging.StreamHandler()
+        if LOG_FORMAT == "text":
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        else:
+            handler.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(_log_queue, handler)
+        _listener.start()
+        # Vider la file à l'arrêt du processus
+        atexit.register(_listener.stop)
+
+
+def set_log_level(name, level):
+    """Modifie à chaud le niveau d'un logger."""
+    logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+
 
 def setup_logger(name="mna_app"):
     """Configure et retourne un logger pour l'application."""
     logger = logging.getLogger(name)
-    
+
     # Configurer le logger seulement s'il n'y a pas de gestionnaires
     if not logger.handlers:
-        logger.setLevel(logging.DEBUG)
-        
-        # Formater
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        
-        # Handler console
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-        
-        # On pourrait ajouter un handler pour un fichier de log ici
-        
+        logger.setLevel(LOGGER_LEVELS.get(name, DEFAULT_LEVEL).upper())
+
+        # Handler asynchrone : l'appelant ne fait que déposer l'enregistrement dans une file,
+        # l'écriture est faite par le thread du QueueListener
+        _ensure_listener()
+        queue_handler = logging.handlers.QueueHandler(_log_queue)
+        queue_handler.addFilter(_rate_limit_filter)
+        logger.addHandler(queue_handler)
+
     return logger
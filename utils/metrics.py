@@ -0,0 +1,307 @@
+import bisect
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.logger import setup_logger
+
+# Configuration du logging
+logger = setup_logger("metrics")
+
+# Exposition : endpoint HTTP local (METRICS_PORT) et/ou fichier texte (METRICS_TEXTFILE)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = float(os.environ.get("METRICS_TEXTFILE_INTERVAL", "15"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Labels attendus pour {self.name}: {self.labelnames}, reçus: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Compteur monotone."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Valeur instantanée, fixée directement ou calculée à la lecture."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Calcule la valeur (sans labels) au moment de l'exposition."""
+        self._function = function
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Histogramme à seaux cumulés (compatible Prometheus)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée d'un bloc, en secondes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Registre des métriques du processus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Retourne toutes les métriques au format texte d'exposition Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Assistants OpenAI
+ASSISTANT_RUNS = REGISTRY.counter("mna_assistant_runs_total", "Runs Assistants par statut final", ["status"])
+ASSISTANT_RUN_DURATION = REGISTRY.histogram("mna_assistant_run_duration_seconds", "Durée des runs Assistants")
+ASSISTANT_RUNS_IN_FLIGHT = REGISTRY.gauge("mna_assistant_runs_in_flight", "Runs Assistants en cours")
+TOOL_CALLS = REGISTRY.counter("mna_tool_calls_total", "Appels d'outils par fonction et résultat", ["function_name", "outcome"])
+TOOL_CALL_DURATION = REGISTRY.histogram("mna_tool_call_duration_seconds", "Durée des appels d'outils", ["function_name"])
+
+# API ArcadiaAgents
+ARCADIA_SUBMITS = REGISTRY.counter("mna_arcadia_submits_total", "Soumissions d'événements ArcadiaAgents", ["outcome"])
+ARCADIA_POLLS_PER_JOB = REGISTRY.histogram(
+    "mna_arcadia_polls_per_job", "Nombre de vérifications d'état par tâche ArcadiaAgents",
+    buckets=(1, 2, 3, 5, 10, 20, 30, 45, 60)
+)
+ARCADIA_JOB_DURATION = REGISTRY.histogram("mna_arcadia_job_duration_seconds", "Durée des tâches ArcadiaAgents", ["outcome"])
+ARCADIA_DOWNLOAD_BYTES = REGISTRY.counter("mna_arcadia_download_bytes_total", "Octets téléchargés depuis ArcadiaAgents")
+ARCADIA_ERRORS = REGISTRY.counter("mna_arcadia_errors_total", "Erreurs ArcadiaAgents par endpoint et code HTTP", ["endpoint", "status_code"])
+ARCADIA_RETRIES = REGISTRY.counter("mna_arcadia_retries_total", "Nouvelles tentatives de requêtes ArcadiaAgents", ["endpoint"])
+ARCADIA_QUEUE_DEPTH = REGISTRY.gauge("mna_arcadia_queue_depth", "Tâches ArcadiaAgents en file d'attente")
+ARCADIA_QUEUE_WAIT = REGISTRY.histogram("mna_arcadia_queue_wait_seconds", "Attente des tâches ArcadiaAgents avant démarrage")
+CACHE_WARMING_JOBS = REGISTRY.counter("mna_cache_warming_jobs_total", "Tâches de préchauffage par résultat (success, error, deferred)", ["outcome"])
+SCREEN_CACHE_LOOKUPS = REGISTRY.counter("mna_screen_cache_lookups_total", "Recherches réutilisées (exact, derived) ou lancées (miss)", ["outcome"])
+
+# Application
+RERUN_DURATION = REGISTRY.histogram("mna_rerun_duration_seconds", "Durée d'exécution de main_app_ui")
+ACTIVE_SESSIONS = REGISTRY.gauge("mna_active_sessions", "Sessions actives (vues récemment)")
+SESSION_MEMORY_BYTES = REGISTRY.gauge("mna_session_memory_bytes", "Mémoire des sessions actives par catégorie", ["category"])
+PROCESS_MEMORY_BYTES = REGISTRY.gauge("mna_process_memory_bytes", "Mémoire du processus par catégorie", ["category"])
+SESSION_SPILLED_BYTES = REGISTRY.counter("mna_session_spilled_bytes_total", "Contenus de fichiers déchargés sur disque (budget mémoire des sessions)")
+
+SESSION_IDLE_TIMEOUT = 300  # Secondes sans rerun après lesquelles une session n'est plus active
+_sessions_seen = {}
+_sessions_lock = threading.Lock()
+
+
+def track_session(session_id):
+    """Enregistre l'activité d'une session pour la jauge des sessions actives."""
+    now = time.monotonic()
+    with _sessions_lock:
+        _sessions_seen[session_id] = now
+        if len(_sessions_seen) > 256:
+            for key in [k for k, seen in _sessions_seen.items() if now - seen > SESSION_IDLE_TIMEOUT]:
+                del _sessions_seen[key]
+
+
+def _count_active_sessions():
+    now = time.monotonic()
+    with _sessions_lock:
+        return sum(1 for seen in _sessions_seen.values() if now - seen <= SESSION_IDLE_TIMEOUT)
+
+
+ACTIVE_SESSIONS.set_function(_count_active_sessions)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_textfile(path):
+    """Écrit les métriques dans un fichier (collecteur textfile), de manière atomique."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".prom.tmp")
+    with os.fdopen(fd, "w") as file:
+        file.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+def _textfile_loop(path, interval):
+    while True:
+        try:
+            write_textfile(path)
+        except Exception as e:
+            logger.warning("Échec de l'écriture des métriques dans %s: %s", path, e)
+        time.sleep(interval)
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(port=METRICS_PORT, textfile=METRICS_TEXTFILE):
+    """Démarre (une seule fois par processus) les exportateurs configurés."""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if port:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Métriques exposées sur http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            logger.warning(f"Impossible d'exposer les métriques sur le port {port}: {e}")
+    if textfile:
+        threading.Thread(
+            target=_textfile_loop, args=(textfile, METRICS_TEXTFILE_INTERVAL), name="metrics-textfile", daemon=True
+        ).start()
+        logger.info(f"Métriques écrites dans {textfile}")
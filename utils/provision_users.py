@@ -0,0 +1,209 @@
+import argparse
+import csv
+import os
+import re
+import secrets
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+import yaml
+from yaml.loader import SafeLoader
+from yaml.dumper import SafeDumper
+
+DEFAULT_CONFIG_FILE = "config/credentials.yaml"
+DEFAULT_BCRYPT_ROUNDS = 12
+
+BCRYPT_HASH_REGEX = re.compile(r'^\$2[aby]\$\d+\$.{53}$')
+
+
+def is_bcrypt_hash(value):
+    """Indique si une valeur est déjà un hash bcrypt."""
+    return bool(value) and BCRYPT_HASH_REGEX.match(value) is not None
+
+
+def _hash_if_changed(task):
+    """
+    Hache un mot de passe dans un processus du pool.
+
+    Si un hash existant est fourni et correspond déjà au mot de passe, il est conservé.
+
+    Args:
+        task (tuple): (mot de passe en clair, hash existant ou None, coût bcrypt)
+
+    Returns:
+        tuple: (hash à enregistrer, True si un nouveau hash a été calculé)
+    """
+    password, existing_hash, rounds = task
+    if existing_hash and bcrypt.checkpw(password.encode(), existing_hash.encode()):
+        return existing_hash, False
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode(), True
+
+
+def hash_passwords(tasks, rounds=DEFAULT_BCRYPT_ROUNDS, workers=None):
+    """
+    Hache des mots de passe en parallèle sur un pool de processus.
+
+    Args:
+        tasks (list): Liste de (mot de passe en clair, hash existant ou None)
+        rounds (int): Coût bcrypt (log2 du nombre d'itérations)
+        workers (int): Nombre de processus (par défaut, le nombre de CPU)
+
+    Returns:
+        list: Liste de (hash, True si nouveau hash) dans l'ordre des tâches
+    """
+    if not tasks:
+        return []
+    jobs = [(password, existing_hash, rounds) for password, existing_hash in tasks]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers == 1:
+        return [_hash_if_changed(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_hash_if_changed, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def load_config(config_file):
+    """Charge la configuration d'authentification, ou en crée une vide si le fichier n'existe pas."""
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as file:
+            config = yaml.load(file, SafeLoader) or {}
+    else:
+        config = {
+            'cookie': {
+                'name': 'mna_auth',
+                'key': secrets.token_hex(32),
+                'expiry_days': 30
+            }
+        }
+    config.setdefault('credentials', {}).setdefault('usernames', {})
+    return config
+
+
+def write_config_atomic(config, config_file):
+    """Écrit la configuration de manière atomique (fichier temporaire puis renommage)."""
+    directory = os.path.dirname(config_file) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".credentials-", suffix=".yaml")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            yaml.dump(config, file, Dumper=SafeDumper, allow_unicode=True)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(config_file):
+            os.chmod(tmp_path, os.stat(config_file).st_mode & 0o777)
+        os.replace(tmp_path, config_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_users_csv(csv_file):
+    """
+    Lit les utilisateurs à provisionner depuis un CSV.
+
+    Colonnes attendues : username, name, email, password (vide pour conserver le mot
+    de passe actuel) et roles (optionnel, séparés par des ";").
+    """
+    with open(csv_file, newline='', encoding='utf-8-sig') as file:
+        for row in csv.DictReader(file):
+            username = (row.get('username') or '').strip().lower()
+            if not username:
+                continue
+            roles = [role.strip() for role in (row.get('roles') or '').split(';') if role.strip()]
+            yield {
+                'username': username,
+                'name': (row.get('name') or '').strip(),
+                'email': (row.get('email') or '').strip(),
+                'password': row.get('password') or '',
+                'roles': roles
+            }
+
+
+def provision_users(csv_file, config_file=DEFAULT_CONFIG_FILE, rounds=DEFAULT_BCRYPT_ROUNDS, workers=None):
+    """
+    Importe des utilisateurs depuis un CSV dans le fichier d'authentification.
+
+    Seuls les mots de passe nouveaux ou modifiés sont hachés, en parallèle.
+
+    Returns:
+        dict: Statistiques du provisionnement
+    """
+    config = load_config(config_file)
+    usernames = config['credentials']['usernames']
+
+    tasks = []
+    pending_users = []
+    changes = {}
+    skipped = 0
+    for user in read_users_csv(csv_file):
+        existing = usernames.get(user['username'])
+        if existing is None and not user['password']:
+            print(f"Utilisateur {user['username']} ignoré : aucun mot de passe fourni.")
+            skipped += 1
+            continue
+
+        entry = dict(existing or {})
+        for field in ('name', 'email'):
+            if user[field]:
+                entry[field] = user[field]
+        if user['roles']:
+            entry['roles'] = user['roles']
+
+        if is_bcrypt_hash(user['password']):
+            entry['password'] = user['password']
+        elif user['password']:
+            existing_hash = entry.get('password')
+            tasks.append((user['password'], existing_hash if is_bcrypt_hash(existing_hash) else None))
+            pending_users.append(user['username'])
+
+        if existing is None:
+            changes[user['username']] = "created"
+        elif entry != existing:
+            changes[user['username']] = "updated"
+        usernames[user['username']] = entry
+
+    start = time.perf_counter()
+    results = hash_passwords(tasks, rounds=rounds, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    hashed = 0
+    for username, (password_hash, is_new) in zip(pending_users, results):
+        if is_new:
+            hashed += 1
+            changes.setdefault(username, "updated")
+        usernames[username]['password'] = password_hash
+
+    write_config_atomic(config, config_file)
+
+    return {
+        "created": sum(1 for change in changes.values() if change == "created"),
+        "updated": sum(1 for change in changes.values() if change == "updated"),
+        "skipped": skipped,
+        "checked": len(tasks),
+        "hashed": hashed,
+        "elapsed": elapsed,
+        "throughput": len(tasks) / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provisionnement en masse des utilisateurs depuis un CSV.")
+    parser.add_argument("csv_file", help="CSV avec les colonnes username, name, email, password, roles")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="Fichier d'authentification à mettre à jour")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_BCRYPT_ROUNDS, help="Coût bcrypt (4 à 31)")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus de hachage")
+    args = parser.parse_args()
+
+    if not 4 <= args.rounds <= 31:
+        parser.error("Le coût bcrypt doit être compris entre 4 et 31.")
+
+    stats = provision_users(args.csv_file, args.config, args.rounds, args.workers)
+    print(f"{stats['created']} utilisateur(s) créé(s), {stats['updated']} mis à jour, {stats['skipped']} ignoré(s).")
+    print(f"{stats['checked']} mot(s) de passe vérifié(s), {stats['hashed']} haché(s) en {stats['elapsed']:.2f}s "
+          f"({stats['throughput']:.1f} mots de passe/s, coût bcrypt {args.rounds}).")
+    print(f"Fichier {args.config} mis à jour.")
+
+
+if __name__ == "__main__":
+    main()